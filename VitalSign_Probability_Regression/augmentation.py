@@ -0,0 +1,69 @@
+import torch
+
+'''
+Simulation 입력 (Absorbance) 학습 중 Augmentation
+input_data_random20_3.npy 처럼 noise 를 더한 파일을 따로 만들지 않고, 학습 batch 를 읽을 때 Device 위에서 한 번에 적용함.
+  - noise : 원소 별 uniform (low, high) 또는 gaussian (std) noise
+  - gain : sample 별 (per_band 이면 sample, band 별) 곱하는 값 (low, high)
+  - offset : sample 별 (per_band 이면 sample, band 별) 더하는 값 (low, high), Absorbance offset = 반사율 밝기 변화 (-log gain)
+random stream 은 (seed, epoch) 로 정해지므로 Checkpoint 에서 이어서 학습해도 같은 epoch 에는 같은 noise 가 나옴.
+'''
+
+# input_data_random20_3.npy (random20 의 Absorbance 에 uniform 0 ~ 0.03 noise) 와 같은 설정
+# 파일은 64 band 에 noise 를 더한 뒤 band 를 골랐으므로 두 band 평균인 band 11 의 분포만 조금 다름
+RANDOM20_3 = {'noise': (0.0, 0.03)}
+
+
+class Augmentation(object):
+    '''
+    noise : (low, high) uniform noise 범위, noise_std : gaussian noise 표준편차 (noise 와 함께 쓰면 둘 다 더함)
+    gain, offset : (low, high) 범위, None 이면 사용 안 함
+    columns : Augmentation 할 입력 column (기본 Absorbance 14 band, 뒤에 붙은 mel / thickness 확률분포는 그대로)
+    '''
+    def __init__(self, noise=None, noise_std=None, gain=None, offset=None, per_band=False, columns=slice(0, 14), seed=0, device='cpu'):
+        self.noise = noise
+        self.noise_std = noise_std
+        self.gain = gain
+        self.offset = offset
+        self.per_band = per_band
+        self.columns = columns
+        self.seed = seed
+        self.device = device
+
+        self.generator = torch.Generator(device=device)
+        self.set_epoch(0)
+
+    def set_epoch(self, epoch):
+        '''epoch 마다 random stream 을 (seed, epoch) 로 다시 시작'''
+        self.generator.manual_seed(self.seed * 1000003 + epoch)
+
+    def _uniform(self, shape, value_range, dtype):
+        low, high = value_range
+        return torch.rand(shape, generator=self.generator, device=self.device, dtype=dtype) * (high - low) + low
+
+    def __call__(self, x):
+        '''x : (batch, feature) -> Augmentation 한 새 Tensor (x 는 그대로)'''
+        x = x.clone()
+        band = x[:, self.columns]
+        scale_shape = band.shape if self.per_band == True else (band.shape[0], 1)
+
+        if self.gain is not None:
+            band = band * self._uniform(scale_shape, self.gain, band.dtype)
+        if self.offset is not None:
+            band = band + self._uniform(scale_shape, self.offset, band.dtype)
+        if self.noise is not None:
+            band = band + self._uniform(band.shape, self.noise, band.dtype)
+        if self.noise_std is not None:
+            band = band + torch.randn(band.shape, generator=self.generator, device=self.device, dtype=band.dtype) * self.noise_std
+
+        x[:, self.columns] = band
+        return x
+
+
+def build_augmentation(config=None, device='cpu'):
+    '''config : Augmentation 인자 dict (예 : RANDOM20_3, {'noise_std': 0.01, 'offset': (-0.05, 0.05), 'seed': 1}), None 이면 사용 안 함'''
+    if config is None:
+        return None
+    if isinstance(config, Augmentation):
+        return config
+    return Augmentation(device=device, **config)
@@ -0,0 +1,334 @@
+import numpy as np
+import os
+import time
+
+import torch
+import torch.nn.functional as F
+
+from simulation_corpus import VALUE_INDEX
+from train_engine import StagedTrainer, TripletSampler
+from train_util import build_scheduler, scheduler_step, build_early_stopping, AsyncValidator, BatchedAdam, config_fingerprint
+from vitalsign_model import Batched_Feature_mel_thickness, BatchedClassifier, BatchedRegression
+
+'''
+여러 Model (seed, margin, lr 이 다른 변형)을 한 번에 학습하는 Engine
+N개 Model의 weight를 쌓아서(BatchedMLP) 같은 data batch를 batched matmul 한 번으로 계산하므로,
+CPU에서 작은 MLP의 호출 overhead가 N번이 아니라 한 번만 듦.
+Model i 의 weight는 result/<save_dir>/model<i>/ 에 단일 Model과 같은 형식으로 저장됨.
+'''
+
+
+def batched_triplet_loss(anc_out, pos_out, neg_out, margin):
+    '''(N, batch, dim) -> Model 별 TripletMarginLoss (N,), margin : (N,)'''
+    d_ap = torch.norm(anc_out - pos_out + 1e-6, dim=2)
+    d_an = torch.norm(anc_out - neg_out + 1e-6, dim=2)
+    return torch.mean(F.relu(d_ap - d_an + margin.unsqueeze(1)), dim=1)
+
+
+def batched_soft_cross_entropy(pred_prob, target_prob):
+    '''(N, batch, class) -> Model 별 Loss (N,)'''
+    return torch.mean(-(torch.sum(target_prob * torch.log(pred_prob + 0.00000000001), dim=2)), dim=1)
+
+
+class BatchedStagedTrainer(StagedTrainer):
+    '''
+    variants : Model 별 설정 list, 예) [{'seed': 0}, {'seed': 1, 'margin': 0.5}, {'seed': 2, 'lr_scale': 0.5}]
+      seed : weight 초기화 seed, margin : Feature Model Triplet margin (기본 config 값), lr_scale : 모든 단계 lr 배율
+    Feature Model은 random Triplet 만 지원 (모든 Model이 같은 Triplet batch 사용)
+    '''
+    def __init__(self, config, save_dir, variants, use_gpu=False, **kwargs):
+        if config['feature'].get('mining', 'random') != 'random':
+            raise ValueError("BatchedStagedTrainer supports only random triplet mining, got {}".format(config['feature']['mining']))
+
+        super(BatchedStagedTrainer, self).__init__(config, save_dir, use_gpu=use_gpu, **kwargs)
+
+        self.variants = variants
+        self.n_models = len(variants)
+        self.seeds = [v.get('seed') for v in variants]
+        self.margin = torch.tensor([v.get('margin', config['feature']['margin']) for v in variants], device=self.device)
+        self.lr_scale = [v.get('lr_scale', 1.0) for v in variants]
+
+        self.model_dirs = []
+        for i in range(self.n_models):
+            model_dir = os.path.join(self.result_dir, 'model{}'.format(i))
+            if os.path.isdir(model_dir) == False:
+                os.makedirs(model_dir)
+            self.model_dirs.append(model_dir)
+
+    def checkpoint_fingerprint(self, cfg):
+        '''StagedTrainer 설정에 Model 별 변형 (seed, margin, lr_scale) 을 더한 hash'''
+        return config_fingerprint({'trainer': super(BatchedStagedTrainer, self).checkpoint_fingerprint(cfg), 'variants': self.variants})
+
+    def model_weight_path(self, i, name):
+        return os.path.join(self.model_dirs[i], name)
+
+    def _load_batched(self, model, name):
+        for i in range(self.n_models):
+            model.load_model_state_dict(i, torch.load(self.model_weight_path(i, name), map_location=self.device))
+
+    def _fit(self, stage, model, cfg, train_epoch, validate, weight_names, log_format, save2_message=None, on_epoch_end=None):
+        '''
+        StagedTrainer._fit 의 N개 Model 버전
+        train_epoch(optimizer) -> Model 별 batch Loss (N,) 의 list, validate(model) -> (Model 별 test_loss (N,), ...)
+        Early Stopping은 Model 별로 판단하고, 모든 Model이 멈추면 학습을 끝냄
+        '''
+        n = self.n_models
+        optimizer = BatchedAdam(model.parameters(), lr=cfg['lr'], lr_scale=self.lr_scale)
+        scheduler = build_scheduler(optimizer, cfg.get('lr_schedule'))
+        stoppers = [build_early_stopping(cfg.get('early_stopping')) for _ in range(n)]
+
+        ckpt = self.checkpointer(stage, cfg)
+        metrics = ckpt.load(model, optimizer, scheduler)
+
+        best = {'best_loss': metrics.get('best_loss', [float('inf')] * n),
+                'best_test_loss': metrics.get('best_test_loss', [float('inf')] * n)}
+        for stopper, stopper_state in zip(stoppers, metrics.get('stoppers', [])):
+            if stopper is not None:
+                stopper.load_state_dict(stopper_state)
+        epochs = cfg['epochs']
+
+        def checkpoint_metrics():
+            m = dict(best)
+            m['stoppers'] = [s.state_dict() if s is not None else None for s in stoppers]
+            return m
+
+        def stopped(i):
+            return stoppers[i] is not None and stoppers[i].stop_epoch is not None
+
+        def report(epoch, mean_loss, result, state):
+            test_loss = result[0]
+
+            for i in range(n):
+                if stopped(i):
+                    continue
+
+                model_state = model.model_state_dict(i, state)
+                extra = [r[i] for r in result]
+                tag = "[Model {}] ".format(i)
+
+                if mean_loss[i] < best['best_loss'][i]:
+                    best['best_loss'][i] = float(mean_loss[i])
+                    print(tag + log_format(epoch, epochs, mean_loss[i], *extra) + " (Save Model)")
+                    torch.save(model_state, self.model_weight_path(i, weight_names[0]))
+                else:
+                    print(tag + log_format(epoch, epochs, mean_loss[i], *extra))
+                    if weight_names[2] is not None:
+                        torch.save(model_state, self.model_weight_path(i, weight_names[2]))
+
+                if test_loss[i] < best['best_test_loss'][i]:
+                    best['best_test_loss'][i] = float(test_loss[i])
+                    torch.save(model_state, self.model_weight_path(i, weight_names[1]))
+
+                if stoppers[i] is not None and stoppers[i].step(test_loss[i], epoch, state=model_state):
+                    print(tag + "Early Stopping at Epoch {}/{} : {}".format(epoch + 1, epochs, stoppers[i].reason))
+
+            scheduler_step(scheduler, float(np.mean(test_loss)))
+
+            return all(stopped(i) for i in range(n))
+
+        validator = AsyncValidator(model, validate, asynchronous=self.async_validation)
+        stop = False
+
+        for epoch in ckpt.epoch_range(epochs):
+            self._set_epoch(epoch)
+
+            model.train()
+            running_loss = train_epoch(optimizer)
+
+            if on_epoch_end is not None:
+                on_epoch_end(epoch, model)
+
+            if epoch % 10 == 0:
+                validator.submit(epoch, model, np.mean(running_loss, axis=0))
+
+            for v_epoch, mean_loss, result, state in validator.poll():
+                if stop == False:
+                    stop = report(v_epoch, mean_loss, result, state)
+
+            if stop:
+                break
+
+            scheduler_step(scheduler)
+            ckpt.step(epoch, model, optimizer, scheduler, None, checkpoint_metrics())
+
+        for v_epoch, mean_loss, result, state in validator.drain():
+            if stop == False:
+                stop = report(v_epoch, mean_loss, result, state)
+        validator.close()
+
+        ckpt.finish(model, optimizer, scheduler, None, checkpoint_metrics())
+        self.metrics[stage] = dict(best)
+
+        for i, stopper in enumerate(stoppers):
+            if stopper is not None and stopper.restore_best and stopper.best_state is not None:
+                model.load_model_state_dict(i, stopper.best_state)
+
+        return model
+
+    ############# 1. Train Feature Model ###################
+    def train_feature(self):
+        print("**************************************************")
+        print("****** 1.  Train Feature Model (x{}) *************".format(self.n_models))
+        print("**************************************************")
+        cfg = self.config['feature']
+        train, val = self.data['train'], self.data['val']
+
+        feature_model = Batched_Feature_mel_thickness(self.n_models, input_dim=self.input_dim, hidden_dim=self.feature_dim,
+                                                      seeds=self.seeds).to(self.device)
+
+        val_generator = torch.Generator(device=self.device)
+        val_generator.manual_seed(0)
+        val_pos, val_neg = TripletSampler(val['label']).sample(torch.arange(len(val['label']), device=self.device), val_generator)
+        train_sampler = TripletSampler(train['label'])
+        n_train = len(train['label'])
+
+        def train_epoch(optimizer):
+            running_loss = []
+            perm = torch.randperm(n_train, device=self.device)
+            for bi in range(0, n_train, cfg['batch_size']):
+                anchor_idx = perm[bi:bi + cfg['batch_size']]
+                pos_idx, neg_idx = train_sampler.sample(anchor_idx)
+
+                anc_out = feature_model(self._train_input(anchor_idx))
+                pos_out = feature_model(self._train_input(pos_idx))
+                neg_out = feature_model(self._train_input(neg_idx))
+                loss = batched_triplet_loss(anc_out, pos_out, neg_out, self.margin)
+
+                # Model 별 Loss의 합으로 backward 하면 각 Model의 gradient는 서로 독립
+                optimizer.zero_grad()
+                loss.sum().backward()
+                optimizer.step()
+
+                running_loss.append(loss.detach().cpu().numpy())
+            return running_loss
+
+        def validate(model):
+            val_out = model(val['input'])
+            return (batched_triplet_loss(val_out, val_out[:, val_pos], val_out[:, val_neg], self.margin).cpu().numpy(),)
+
+        def log_format(epoch, epochs, mean_loss, test_loss):
+            t_stamp = time.ctime(time.time())
+            return "{} | Epoch: {}/{} - Loss: {:.4f} , Test Loss: {:.4f}".format(t_stamp, epoch + 1, epochs, mean_loss, test_loss)
+
+        def on_epoch_end(epoch, model):
+            if epoch in cfg['snapshot_epochs']:
+                for i in range(self.n_models):
+                    torch.save(model.model_state_dict(i), self.model_weight_path(i, 'feature_weight_data_{}'.format(epoch)))
+
+        self._fit('feature', feature_model, cfg, train_epoch, validate,
+                  ('feature_weight_data', 'feature_weight_data2', 'feature_weight_data3'), log_format, on_epoch_end=on_epoch_end)
+
+        self.feature_model = feature_model
+        return feature_model
+
+    ############# 2. Train Classification Model ###################
+    def train_classifier(self):
+        print("**************************************************")
+        print("****** 2.  Train Classification Model (x{}) ******".format(self.n_models))
+        print("**************************************************")
+        cfg = self.config['classifier']
+        train, val = self.data['train'], self.data['val']
+
+        if self.feature_model is None:
+            self.feature_model = Batched_Feature_mel_thickness(self.n_models, input_dim=self.input_dim,
+                                                               hidden_dim=self.feature_dim).to(self.device)
+        self._load_batched(self.feature_model, cfg['feature_weight'])
+
+        # Feature Model은 고정되어 있으므로 Model 별 출력 (N, sample, dim)을 한 번만 계산 (augment 가 있으면 학습 batch 는 매번 계산)
+        self.feature_model.eval()
+        train_x = self._cache_outputs(self.feature_model, train['input']) if self.augment is None else None
+        val_x = self._cache_outputs(self.feature_model, val['input'])
+        n_train = len(train['input'])
+
+        classifier_model = BatchedClassifier(self.n_models, cl_mode=self.cl, input_dim=self.feature_dim, seeds=self.seeds).to(self.device)
+
+        def train_epoch(optimizer):
+            running_loss = []
+            perm = torch.randperm(n_train, device=self.device)
+            for bi in range(0, n_train, cfg['batch_size']):
+                idx = perm[bi:bi + cfg['batch_size']]
+
+                pred_prob = F.softmax(classifier_model(self._frozen_batch(train_x, self.feature_model, idx, dim=1)), dim=2)
+                loss = batched_soft_cross_entropy(pred_prob, train['soft_label'][idx].unsqueeze(0))
+
+                optimizer.zero_grad()
+                loss.sum().backward()
+                optimizer.step()
+
+                running_loss.append(loss.detach().cpu().numpy())
+            return running_loss
+
+        def validate(model):
+            pred_prob = F.softmax(model(val_x), dim=2)
+            test_loss = batched_soft_cross_entropy(pred_prob, val['soft_label'].unsqueeze(0))
+            acc = (torch.argmax(pred_prob, dim=2) == val['label'].unsqueeze(0)).float().mean(dim=1)
+            return test_loss.cpu().numpy(), acc.cpu().numpy()
+
+        def log_format(epoch, epochs, mean_loss, test_loss, acc):
+            return "Epoch: {}/{} - Loss: {:.4f} , Test loss : {:.4f},  Test Acc : {:.4f}".format(epoch + 1, epochs, mean_loss, test_loss, acc)
+
+        self._fit('classifier', classifier_model, cfg, train_epoch, validate,
+                  ('classification_weight_data', 'classification_weight_data2', None), log_format)
+
+        self.classifier_model = classifier_model
+        return classifier_model
+
+    ############# 3. Train Regression Model ###################
+    def train_regression(self):
+        cfg = self.config['regression']
+        train, val = self.data['train'], self.data['val']
+
+        if self.feature_model is None:
+            self.feature_model = Batched_Feature_mel_thickness(self.n_models, input_dim=self.input_dim,
+                                                               hidden_dim=self.feature_dim).to(self.device)
+            self._load_batched(self.feature_model, self.config['classifier']['feature_weight'])
+        if self.classifier_model is None:
+            self.classifier_model = BatchedClassifier(self.n_models, cl_mode=self.cl, input_dim=self.feature_dim).to(self.device)
+        self._load_batched(self.classifier_model, cfg['classifier_weight'])
+
+        def frozen(x):
+            return F.softmax(self._cache_outputs(self.classifier_model, self._cache_outputs(self.feature_model, x)), dim=2)
+
+        train_prob = frozen(train['input']) if self.augment is None else None
+        val_prob = frozen(val['input'])
+        n_train = len(train['input'])
+
+        def log_format(epoch, epochs, mean_loss, test_loss):
+            return "Epoch: {}/{} - Loss: {:.4f},  Test Loss: {:.4f}".format(epoch + 1, epochs, mean_loss, test_loss)
+
+        for target, prefix in cfg['targets'].items():
+            print("**************************************************")
+            print("****** 3.  Train Regression Model ({}, x{}) ******".format(target, self.n_models))
+            print("**************************************************")
+
+            train_gt = train['value'][:, VALUE_INDEX[target]]
+            val_gt = val['value'][:, VALUE_INDEX[target]]
+
+            reg_model = BatchedRegression(self.n_models, cl_mode=self.cl, seeds=self.seeds).to(self.device)
+
+            def train_epoch(optimizer):
+                running_loss = []
+                perm = torch.randperm(n_train, device=self.device)
+                for bi in range(0, n_train, cfg['batch_size']):
+                    idx = perm[bi:bi + cfg['batch_size']]
+
+                    pred_value = reg_model(self._frozen_batch(train_prob, frozen, idx, dim=1)).squeeze(2)
+                    loss = torch.sqrt(torch.mean((pred_value - train_gt[idx].unsqueeze(0)) ** 2, dim=1))
+
+                    optimizer.zero_grad()
+                    loss.sum().backward()
+                    optimizer.step()
+
+                    running_loss.append(loss.detach().cpu().numpy())
+                return running_loss
+
+            def validate(model):
+                pred_value = model(val_prob).squeeze(2)
+                return (torch.sqrt(torch.mean((pred_value - val_gt.unsqueeze(0)) ** 2, dim=1)).cpu().numpy(),)
+
+            self._fit('regression_{}'.format(target), reg_model, cfg, train_epoch, validate,
+                      ('{}_weight_data'.format(prefix), '{}_weight_data2'.format(prefix), None), log_format)
+
+            self.regression_models[target] = reg_model
+
+        return self.regression_models
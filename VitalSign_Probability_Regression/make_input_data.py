@@ -1,6 +1,12 @@
 import numpy as np
 import os
 
+'''
+input_data_random20_3.npy (random20 Absorbance 에 uniform 0 ~ 0.03 noise) 생성
+학습에서는 파일을 만들지 않고 StagedTrainer(augment=augmentation.RANDOM20_3) 로 같은 noise 를 batch 마다 적용할 수 있음.
+이 Script 는 기존 TRAIN_FILE_LIST 결과 재현용
+'''
+
 path = os.path.dirname(__file__)
 
 # test_fileNameList = ['input_data13.npy', 'input_data_random20.npy']
@@ -9,10 +15,8 @@ temp_data = np.load(path + '/input_data/input_data_random20.npy', allow_pickle=T
 
 # print("check temp data shape : ", np.shape(temp_data))
 
-for i in range(64):
-    for j in range(6000):
-        random_noise = np.random.rand() * 0.03
-        temp_data[i][j][5] = temp_data[i][j][5] + random_noise
+# (band 64, sample 6000) Absorbance 에 한 번에 noise 추가
+random_noise = np.random.rand(64, 6000) * 0.03
+temp_data[:64, :6000, 5] = temp_data[:64, :6000, 5] + random_noise
 
 np.save(path + '/input_data/input_data_random20_3.npy', temp_data)
-
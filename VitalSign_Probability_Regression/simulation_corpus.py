@@ -0,0 +1,123 @@
+import numpy as np
+import os
+
+'''
+Simulation Dataset(input_data/*.npy)을 한 번만 읽어서 Absorbance, Label을 Array로 정리
+data shape : (spectral_band(64), sample, field), field 0~3 : mel, thb, sto, thickness / field 5 : Absorbance
+'''
+
+TRAIN_FILE_LIST = ['input_data9.npy', 'input_data14.npy', 'input_data15.npy',
+                   'input_data_random9.npy', 'input_data_random23.npy', 'input_data_random21.npy', 'input_data_random22.npy', 'input_data_random24.npy',
+                   'input_data_random10.npy', 'input_data_random11.npy', 'input_data_random12.npy', 'input_data_random20_3.npy']
+
+TEST_FILE_LIST = ['input_data13.npy', 'input_data_random20.npy']
+
+# 64 band 중 카메라 14 band에 해당하는 index, (46, 47)은 두 band의 평균
+BAND_INDEX = [9, 12, 16, 19, 25, 27, 29, 31, 34, 35, 44, (46, 47), 48, 49]
+
+# value column 순서
+VALUE_INDEX = {'mel': 0, 'thb': 1, 'sto': 2, 'thickness': 3}
+
+# Class 구간 경계 (구간 오른쪽 값 포함)
+CLASS_EDGES = {
+    'mel': [0.02, 0.04, 0.06, 0.08, 0.1, 0.12, 0.14],
+    'thb': [0.01, 0.02, 0.03, 0.04, 0.05, 0.06],
+    'sto': [0.7, 0.75, 0.8, 0.85, 0.9, 0.95],
+    'thickness': [0.035, 0.055],
+}
+
+# 확률 Label(Gaussian)의 중심값과 sigma
+CLASS_CENTERS = {
+    'mel': ([0.01, 0.03, 0.05, 0.07, 0.09, 0.11, 0.13, 0.15], 0.01),
+    'thb': ([0.005, 0.015, 0.025, 0.035, 0.045, 0.055, 0.065], 0.0025),
+    'sto': ([0.675, 0.725, 0.775, 0.825, 0.875, 0.925, 0.975], 0.0125),
+    'thickness': ([0.025, 0.045, 0.065], 0.01),
+}
+
+
+def select_bands(reflect_list):
+    '''64 band Absorbance (N, 64) -> 14 band (N, 14)'''
+    columns = []
+    for bi in BAND_INDEX:
+        if isinstance(bi, tuple):
+            columns.append(np.mean(reflect_list[:, list(bi)], axis=1))
+        else:
+            columns.append(reflect_list[:, bi])
+
+    return np.stack(columns, axis=1).astype(np.float32)
+
+
+def class_label(values, cl):
+    '''연속값 -> Class index. cl == '' 이면 thb + sto combination (thb * 7 + sto)'''
+    if cl == '':
+        return class_label(values, 'thb') * 7 + class_label(values, 'sto')
+
+    v = values[:, VALUE_INDEX[cl]]
+    return np.searchsorted(np.array(CLASS_EDGES[cl]), v, side='left').astype(np.int64)
+
+
+def soft_label(values, cl):
+    '''연속값 -> Gaussian 확률 Label. cl == '' 이면 thb, sto 2D Gaussian (대각 공분산)'''
+    if cl == '':
+        thb = soft_label(values, 'thb')
+        sto = soft_label(values, 'sto')
+        comb = (thb[:, :, np.newaxis] * sto[:, np.newaxis, :]).reshape(len(values), -1)
+        return (comb / np.sum(comb, axis=1, keepdims=True)).astype(np.float32)
+
+    centers, g_sig = CLASS_CENTERS[cl]
+    v = values[:, VALUE_INDEX[cl]][:, np.newaxis].astype(np.float64)
+    g_p = np.exp(-(v - np.array(centers)[np.newaxis, :]) ** 2 / (2 * g_sig ** 2))
+
+    return (g_p / np.sum(g_p, axis=1, keepdims=True)).astype(np.float32)
+
+
+def load_simulation_corpus(file_list, input_dir=None):
+    '''
+    Read Data
+    return : absorbance (N, 14) float32, value (N, 4) float32 [mel, thb, sto, thickness]
+    '''
+    if input_dir is None:
+        input_dir = os.path.join(os.path.dirname(__file__), 'input_data')
+
+    absorbance = []
+    value = []
+
+    for fn in file_list:
+        temp_data = np.load(os.path.join(input_dir, fn), allow_pickle=True)
+
+        absorbance.append(select_bands(np.transpose(temp_data[:, :, 5]).astype(np.float64)))
+        value.append(np.array(temp_data[0, :, 0:4], dtype=np.float32))
+
+    corpus = {
+        'absorbance': np.concatenate(absorbance, axis=0),
+        'value': np.concatenate(value, axis=0),
+    }
+
+    return corpus
+
+
+def cached_corpus(file_list, cache_dir, input_dir=None, mmap_mode='r'):
+    '''
+    load_simulation_corpus 결과를 cache_dir에 .npy로 저장해두고, 이후에는 mmap으로 읽음
+    (여러 Process가 같은 Cache를 공유하므로 원본 input_data를 다시 읽고 band를 고르는 작업을 반복하지 않음)
+    file_list가 달라지면 Cache를 새로 만듦
+    '''
+    list_path = os.path.join(cache_dir, 'file_list.txt')
+    names = '\n'.join(file_list)
+
+    cached = os.path.isfile(list_path)
+    if cached:
+        with open(list_path) as f:
+            cached = f.read() == names
+
+    if cached == False:
+        corpus = load_simulation_corpus(file_list, input_dir)
+
+        if os.path.isdir(cache_dir) == False:
+            os.makedirs(cache_dir)
+        for key, value in corpus.items():
+            np.save(os.path.join(cache_dir, key + '.npy'), value)
+        with open(list_path, 'w') as f:
+            f.write(names)
+
+    return {key: np.load(os.path.join(cache_dir, key + '.npy'), mmap_mode=mmap_mode) for key in ('absorbance', 'value')}
@@ -0,0 +1,132 @@
+import numpy as np
+import os
+
+import torch
+import torch.nn.functional as F
+import torch.utils.data as data
+
+from simulation_corpus import select_bands, class_label, soft_label
+
+'''
+큰 Simulation Dataset (input_data_4000_*, random_data_4000_* 등) 을 전체를 메모리에 올리지 않고 chunk 단위로 읽는 Reader
+파일은 mmap 으로 열어서 sample 축으로 chunk_size 개씩 읽고, chunk 마다 band 선택, Label 계산, (prior Model 확률분포) 를 한 뒤
+shuffle buffer 를 거쳐 batch 로 내보냄. 메모리는 파일 크기와 관계없이 shuffle_buffer + chunk_size sample 정도만 사용함.
+'''
+
+
+def open_simulation_file(file_path):
+    '''(band 64, sample, field) 배열, object array 로 저장된 파일은 mmap 이 안 되므로 전체를 읽음'''
+    try:
+        return np.load(file_path, mmap_mode='r')
+    except ValueError:
+        return np.load(file_path, allow_pickle=True)
+
+
+def simulation_chunks(file_list, input_dir=None, chunk_size=50000):
+    '''return : [(파일 이름, start, stop)] 모든 파일의 chunk 목록 (파일 header 만 읽음)'''
+    if input_dir is None:
+        input_dir = os.path.join(os.path.dirname(__file__), 'input_data')
+
+    chunks = []
+    for fn in file_list:
+        n_sample = open_simulation_file(os.path.join(input_dir, fn)).shape[1]
+        for start in range(0, n_sample, chunk_size):
+            chunks.append((fn, start, min(start + chunk_size, n_sample)))
+    return chunks
+
+
+def read_chunk(temp_data, start, stop):
+    '''open_simulation_file 결과의 chunk 하나 -> absorbance (n, 14) float32, value (n, 4) float32 (load_simulation_corpus 와 같은 계산)'''
+    absorbance = select_bands(np.transpose(np.asarray(temp_data[:, start:stop, 5], dtype=np.float64)))
+    value = np.array(temp_data[0, start:stop, 0:4], dtype=np.float32)
+    return absorbance, value
+
+
+class SimulationStream(data.IterableDataset):
+    '''
+    Simulation 파일 여러 개를 chunk 단위로 읽어서 학습 batch {'input', 'value', 'label', 'soft_label'} (CPU Tensor) 를 내보냄
+    cl : Label class_mode, stage1 : vitalsign_model.FusedStage1 (prior Model, 있으면 확률분포를 입력 뒤에 붙임)
+    shuffle_buffer : 섞는 buffer 크기 (sample), 0 이면 파일 순서 그대로
+    set_epoch(epoch) : chunk 순서와 buffer 섞는 순서를 (seed, epoch) 로 정함
+    DataLoader(num_workers > 0) 에서는 worker 마다 chunk 를 나누어 읽음 (batch_size=None 으로 사용)
+    '''
+    def __init__(self, file_list, cl, input_dir=None, batch_size=1000, chunk_size=50000, shuffle_buffer=200000, stage1=None, seed=0):
+        super(SimulationStream, self).__init__()
+        if input_dir is None:
+            input_dir = os.path.join(os.path.dirname(__file__), 'input_data')
+
+        self.input_dir = input_dir
+        self.cl = cl
+        self.batch_size = batch_size
+        self.shuffle_buffer = shuffle_buffer
+        self.stage1 = stage1
+        self.seed = seed
+        self.epoch = 0
+
+        self.chunks = simulation_chunks(file_list, input_dir, chunk_size)
+        self.n_samples = sum(stop - start for _, start, stop in self.chunks)
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def __len__(self):
+        '''epoch 당 batch 수 (worker 를 나누면 worker 별 마지막 batch 때문에 조금 많아질 수 있음)'''
+        return (self.n_samples + self.batch_size - 1) // self.batch_size
+
+    def _process(self, temp_data, start, stop):
+        absorbance, value = read_chunk(temp_data, start, stop)
+        x = torch.from_numpy(absorbance)
+
+        if self.stage1 is not None:
+            with torch.no_grad():
+                x = torch.cat([x] + [F.softmax(out, dim=1) for out in self.stage1(x)], dim=1)
+
+        return {
+            'input': x,
+            'value': torch.from_numpy(value),
+            'label': torch.from_numpy(class_label(value, self.cl)),
+            'soft_label': torch.from_numpy(soft_label(value, self.cl)),
+        }
+
+    def _batches(self, buffer, n):
+        for bi in range(0, n, self.batch_size):
+            yield {k: v[bi:min(bi + self.batch_size, n)] for k, v in buffer.items()}
+
+    def __iter__(self):
+        rng = np.random.default_rng([self.seed, self.epoch])
+
+        chunks = self.chunks
+        if self.shuffle_buffer > 0:
+            chunks = [chunks[i] for i in rng.permutation(len(chunks))]
+
+        worker = data.get_worker_info()
+        if worker is not None:
+            chunks = chunks[worker.id::worker.num_workers]
+            rng = np.random.default_rng([self.seed, self.epoch, worker.id])
+
+        # 같은 파일의 chunk 가 이어지면 다시 열지 않음 (object array 파일은 한 번 전체를 읽음)
+        opened = (None, None)
+        buffer = None
+        for fn, start, stop in chunks:
+            if opened[0] != fn:
+                opened = (fn, open_simulation_file(os.path.join(self.input_dir, fn)))
+            chunk = self._process(opened[1], start, stop)
+            buffer = chunk if buffer is None else {k: torch.cat([buffer[k], chunk[k]]) for k in chunk}
+
+            if len(buffer['input']) < self.shuffle_buffer:
+                continue
+
+            # buffer 를 섞고 shuffle_buffer / 2 개만 남겨서 다음 chunk 와 섞음
+            if self.shuffle_buffer > 0:
+                perm = torch.from_numpy(rng.permutation(len(buffer['input'])))
+                buffer = {k: v[perm] for k, v in buffer.items()}
+
+            n_out = (len(buffer['input']) - self.shuffle_buffer // 2) // self.batch_size * self.batch_size
+            yield from self._batches(buffer, n_out)
+            buffer = {k: v[n_out:] for k, v in buffer.items()}
+
+        if buffer is not None and len(buffer['input']) > 0:
+            if self.shuffle_buffer > 0:
+                perm = torch.from_numpy(rng.permutation(len(buffer['input'])))
+                buffer = {k: v[perm] for k, v in buffer.items()}
+            yield from self._batches(buffer, len(buffer['input']))
@@ -0,0 +1,253 @@
+import time
+
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+import torch.utils.data as data
+
+from simulation_corpus import TEST_FILE_LIST, load_simulation_corpus, VALUE_INDEX
+from simulation_stream import SimulationStream
+from vitalsign_model import VitalSign_Feature_mel_thickness, Classifier, Regression
+from train_engine import StagedTrainer, TripletSampler, ONLINE_TRIPLET_LOSS, soft_cross_entropy
+
+'''
+큰 Simulation Dataset (input_data_4000_*, random_data_4000_* 등) 용 StagedTrainer
+학습 Dataset 은 메모리에 올리지 않고 simulation_stream.SimulationStream 으로 chunk 단위로 읽고 (shuffle buffer 로 섞음),
+Validation Dataset 만 StagedTrainer 처럼 Device 에 올려둠.
+고정된 이전 단계 Model 출력은 cache 할 수 없으므로 batch 마다 계산함.
+Feature 단계 'random' Triplet 은 batch 안에서 positive / negative 를 고름 (batch_size 가 작으면 Class 별 sample 이 적어짐).
+'''
+
+
+class StreamingStagedTrainer(StagedTrainer):
+    def __init__(self, config, save_dir, use_gpu=False, train_file_list=None, test_file_list=TEST_FILE_LIST, input_dir=None,
+                 checkpoint_interval=100, resume=True, async_validation=True, augment=None,
+                 chunk_size=50000, shuffle_buffer=200000, num_workers=0, seed=0):
+        '''
+        train_file_list : 학습 Simulation 파일 (chunk 단위로 읽음), test_file_list : Validation 파일 (메모리에 올림)
+        chunk_size : 한 번에 읽는 sample 수, shuffle_buffer : 섞는 buffer 크기 (sample)
+        num_workers : DataLoader worker 수 (worker 마다 chunk 를 나누어 읽음), seed : chunk 순서 / buffer 섞는 순서
+        '''
+        self.stream_options = {'chunk_size': chunk_size, 'shuffle_buffer': shuffle_buffer, 'seed': seed}
+        self.num_workers = num_workers
+        self.stream = None
+
+        super(StreamingStagedTrainer, self).__init__(config, save_dir, use_gpu, train_file_list, test_file_list, input_dir,
+                                                     checkpoint_interval, resume, async_validation, augment=augment)
+
+    def _load_data(self, corpus, train_file_list, test_file_list, input_dir):
+        self.train_file_list = train_file_list
+        self.input_dir = input_dir
+
+        self.data = {'val': self._to_device(load_simulation_corpus(test_file_list, input_dir))}
+
+        # prior Model 확률분포 : Validation 은 한 번만 계산, 학습 chunk 는 Stream 이 읽을 때 계산 (worker 에서는 CPU)
+        self.stage1 = self._load_prior_stage1()
+        if self.stage1 is not None:
+            val = self.data['val']
+            with torch.no_grad():
+                prior_probs = [F.softmax(out, dim=1) for out in self.stage1(val['input'])]
+            val['input'] = torch.cat([val['input']] + prior_probs, dim=1)
+            self.stage1 = self.stage1.cpu()
+
+    def _train_loader(self, batch_size):
+        '''단계 batch_size 의 학습 batch DataLoader (SimulationStream 이 batch 를 만듦)'''
+        self.stream = SimulationStream(self.train_file_list, self.cl, self.input_dir, batch_size=batch_size,
+                                       stage1=self.stage1, **self.stream_options)
+        return data.DataLoader(self.stream, batch_size=None, num_workers=self.num_workers,
+                               persistent_workers=False, pin_memory=(self.device == 'cuda'))
+
+    def _set_epoch(self, epoch):
+        super(StreamingStagedTrainer, self)._set_epoch(epoch)
+        if self.stream is not None:
+            self.stream.set_epoch(epoch)
+
+    def _batches(self, loader):
+        '''Device 로 옮긴 학습 batch, 입력은 augment 가 있으면 Augmentation 적용'''
+        for batch in loader:
+            batch = {k: v.to(self.device, non_blocking=True) for k, v in batch.items()}
+            if self.augment is not None:
+                batch['input'] = self.augment(batch['input'])
+            yield batch
+
+    ############# 1. Train Feature Model ###################
+    def train_feature(self):
+        print("**************************************************")
+        print("************ 1.  Train Feature Model *************")
+        print("**************************************************")
+        cfg = self.config['feature']
+        val = self.data['val']
+        loader = self._train_loader(cfg['batch_size'])
+
+        feature_model = VitalSign_Feature_mel_thickness(input_dim=self.input_dim, hidden_dim=cfg.get('hidden_dim', 128)).to(self.device)
+        criterion = nn.TripletMarginLoss(margin=cfg['margin'], p=2)
+        mining = cfg.get('mining', 'random')
+
+        # Test triplet은 고정해서 epoch 간 Loss 비교가 가능하도록 함
+        val_generator = torch.Generator(device=self.device)
+        val_generator.manual_seed(0)
+        val_pos, val_neg = TripletSampler(val['label']).sample(torch.arange(len(val['label']), device=self.device), val_generator)
+
+        def train_epoch(optimizer):
+            running_loss = []
+            for batch in self._batches(loader):
+                # Class 가 하나뿐인 batch 는 negative 가 없음
+                if mining == 'random' and len(torch.unique(batch['label'])) < 2:
+                    continue
+
+                anc_out = feature_model(batch['input'])
+
+                if mining == 'random':
+                    pos_idx, neg_idx = TripletSampler(batch['label']).sample(torch.arange(len(batch['label']), device=self.device))
+                    loss = criterion(anc_out, anc_out[pos_idx], anc_out[neg_idx])
+                else:
+                    loss = ONLINE_TRIPLET_LOSS[mining](batch['label'], anc_out, margin=cfg['margin'])
+
+                optimizer.zero_grad()
+                loss.backward()
+                optimizer.step()
+
+                running_loss.append(loss.item())
+            return running_loss
+
+        def validate(model):
+            val_out = model(val['input'])
+            return (criterion(val_out, val_out[val_pos], val_out[val_neg]).item(),)
+
+        def log_format(epoch, epochs, mean_loss, test_loss):
+            t_stamp = time.ctime(time.time())
+            return "{} | Epoch: {}/{} - Loss: {:.4f} , Test Loss: {:.4f}".format(t_stamp, epoch + 1, epochs, mean_loss, test_loss)
+
+        def on_epoch_end(epoch, model):
+            if epoch in cfg['snapshot_epochs']:
+                torch.save(model.state_dict(), self.weight_path('feature_weight_data_{}'.format(epoch)))
+
+        self._fit('feature', feature_model, cfg, train_epoch, validate,
+                  ('feature_weight_data', 'feature_weight_data2', 'feature_weight_data3'), log_format,
+                  save2_message="[Save Feature Netwrok 2]", on_epoch_end=on_epoch_end)
+
+        self.feature_model = feature_model
+        return feature_model
+
+    ############# 2. Train Classification Model ###################
+    def train_classifier(self):
+        print("**************************************************")
+        print("****** 2.  Train Classification Model ************")
+        print("**************************************************")
+        cfg = self.config['classifier']
+        val = self.data['val']
+        loader = self._train_loader(cfg['batch_size'])
+
+        if self.feature_model is None:
+            self.feature_model = VitalSign_Feature_mel_thickness(input_dim=self.input_dim, hidden_dim=self.feature_dim).to(self.device)
+        self.feature_model.load_state_dict(torch.load(self.weight_path(cfg['feature_weight']), map_location=self.device))
+
+        self.feature_model.eval()
+        val_x = self._cache_outputs(self.feature_model, val['input'])
+
+        classifier_model = Classifier(cl_mode=self.cl, input_dim=self.feature_dim).to(self.device)
+
+        def train_epoch(optimizer):
+            running_loss = []
+            for batch in self._batches(loader):
+                train_x = self._cache_outputs(self.feature_model, batch['input'])
+
+                pred_prob = F.softmax(classifier_model(train_x), dim=1)
+                loss = soft_cross_entropy(pred_prob, batch['soft_label'])
+
+                optimizer.zero_grad()
+                loss.backward()
+                optimizer.step()
+
+                running_loss.append(loss.item())
+            return running_loss
+
+        def validate(model):
+            pred_prob = F.softmax(model(val_x), dim=1)
+            test_loss = soft_cross_entropy(pred_prob, val['soft_label']).item()
+            acc = (torch.argmax(pred_prob, dim=1) == val['label']).float().mean().item()
+            return test_loss, acc
+
+        def log_format(epoch, epochs, mean_loss, test_loss, acc):
+            return "Epoch: {}/{} - Loss: {:.4f} , Test loss : {:.4f},  Test Acc : {:.4f}".format(epoch + 1, epochs, mean_loss, test_loss, acc)
+
+        self._fit('classifier', classifier_model, cfg, train_epoch, validate,
+                  ('classification_weight_data', 'classification_weight_data2', None), log_format)
+
+        self.classifier_model = classifier_model
+        return classifier_model
+
+    ############# 3. Train Regression Model ###################
+    def train_regression(self):
+        cfg = self.config['regression']
+        val = self.data['val']
+        loader = self._train_loader(cfg['batch_size'])
+
+        if self.feature_model is None:
+            self.feature_model = VitalSign_Feature_mel_thickness(input_dim=self.input_dim, hidden_dim=self.feature_dim).to(self.device)
+            self.feature_model.load_state_dict(torch.load(self.weight_path(self.config['classifier']['feature_weight']), map_location=self.device))
+        if self.classifier_model is None:
+            self.classifier_model = Classifier(cl_mode=self.cl, input_dim=self.feature_dim).to(self.device)
+        self.classifier_model.load_state_dict(torch.load(self.weight_path(cfg['classifier_weight']), map_location=self.device))
+
+        def frozen(x):
+            return self._cache_outputs(self.classifier_model, self._cache_outputs(self.feature_model, x), softmax=True)
+
+        val_prob = frozen(val['input'])
+        criterion = nn.MSELoss()
+
+        def log_format(epoch, epochs, mean_loss, test_loss):
+            return "Epoch: {}/{} - Loss: {:.4f},  Test Loss: {:.4f}".format(epoch + 1, epochs, mean_loss, test_loss)
+
+        for target, prefix in cfg['targets'].items():
+            print("**************************************************")
+            print("****** 3.  Train Regression Model ({}) ************".format(target))
+            print("**************************************************")
+
+            value_index = VALUE_INDEX[target]
+            val_gt = val['value'][:, value_index]
+
+            reg_model = Regression(cl_mode=self.cl).to(self.device)
+
+            def train_epoch(optimizer):
+                running_loss = []
+                for batch in self._batches(loader):
+                    pred_value = reg_model(frozen(batch['input'])).squeeze(1)
+                    loss = torch.sqrt(criterion(pred_value, batch['value'][:, value_index]))
+
+                    optimizer.zero_grad()
+                    loss.backward()
+                    optimizer.step()
+
+                    running_loss.append(loss.item())
+                return running_loss
+
+            def validate(model):
+                pred_value = model(val_prob).squeeze(1)
+                return (torch.sqrt(criterion(pred_value, val_gt)).item(),)
+
+            self._fit('regression_{}'.format(target), reg_model, cfg, train_epoch, validate,
+                      ('{}_weight_data'.format(prefix), '{}_weight_data2'.format(prefix), None), log_format)
+
+            self.regression_models[target] = reg_model
+
+        return self.regression_models
+
+
+if __name__ == '__main__':
+    from train_engine import STAGE_CONFIG
+
+    # 4000 Dataset 처럼 메모리에 다 올릴 수 없는 학습 파일
+    train_file_list = ['input_data_4000_1.npy', 'input_data_4000_2.npy', 'input_data_4000_3.npy', 'input_data_4000_4.npy',
+                       'random_data_4000_1.npy', 'random_data_4000_2.npy', 'random_data_4000_3.npy',
+                       'random_data_4000_4.npy', 'random_data_4000_5.npy', 'random_data_4000_6.npy']
+    test_file_list = TEST_FILE_LIST
+
+    stage = 'mel'
+    save_dir = 'vitalsign_{}_stream'.format(stage)
+    use_gpu = torch.cuda.is_available()
+    num_workers = 4
+
+    trainer = StreamingStagedTrainer(STAGE_CONFIG[stage], save_dir, use_gpu=use_gpu, train_file_list=train_file_list,
+                                     test_file_list=test_file_list, num_workers=num_workers)
+    trainer.run()
@@ -0,0 +1,527 @@
+import numpy as np
+import os
+import time
+
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+import torch.optim as optim
+
+from simulation_corpus import TRAIN_FILE_LIST, TEST_FILE_LIST
+from simulation_corpus import load_simulation_corpus, class_label, soft_label, VALUE_INDEX
+from vitalsign_model import VitalSign_Feature_mel_thickness, Classifier, Regression, FusedStage1
+from online_triplet_loss.losses import batch_hard_triplet_loss, batch_hard_semi_triplet_loss, batch_all_triplet_loss
+from augmentation import build_augmentation
+from train_util import build_scheduler, scheduler_step, build_early_stopping, Checkpointer, AsyncValidator, config_fingerprint
+
+'''
+확률기반 Regression Model 학습 Engine
+1. Feature Model (Triplet Loss) -> 2. Classifier -> 3. Regression 순서로 학습하며,
+Dataset은 한 번만 읽어서 Device에 올려두고, 고정된(frozen) 이전 단계 Model의 출력은 단계 시작 시 한 번만 계산해서 재사용함.
+각 단계는 checkpoint_interval epoch 마다 Checkpoint를 저장하고, resume == True 이면 마지막 Checkpoint부터 이어서 학습함.
+Checkpoint 에는 단계 설정 hash 를 저장하므로, 같은 save_dir 로 설정을 바꿔 다시 실행하면 그 단계는 처음부터 학습함.
+async_validation == True 이면 Validation은 weight snapshot으로 별도 Thread에서 수행하고, 결과가 도착하는 대로 Best Model 선택에 반영함.
+augment 를 주면 학습 batch 입력에 Augmentation (noise, gain, offset) 을 매번 새로 적용하고 (Validation 은 그대로),
+이때는 고정된 이전 단계 Model 출력도 Augmentation 한 입력으로 batch 마다 다시 계산함.
+'''
+
+# 단계별 설정. lr_schedule : train_util.build_scheduler 참고 (multistep milestones : {epoch: lr})
+#            feature hidden_dim : Feature Model 출력 크기 (기본 128), mining : Triplet 선택 방식 (ONLINE_TRIPLET_LOSS 참고)
+#            early_stopping : Validation Loss 기준 조기 종료 (patience는 epoch 단위, None이면 사용 안함)
+STAGE_CONFIG = {
+    'mel': {
+        'class_mode': 'mel',
+        'prior_models': [],
+        'feature': {'epochs': 20000, 'batch_size': 2000, 'lr': 0.001, 'margin': 1.0,
+                    'lr_schedule': {'type': 'multistep', 'milestones': {2000: 0.0005, 4000: 0.0003, 6000: 0.0001, 10000: 0.00005, 15000: 0.00001}},
+                    'early_stopping': {'patience': 1000, 'min_delta': 0.0},
+                    'snapshot_epochs': []},
+        'classifier': {'epochs': 3000, 'batch_size': 3000, 'lr': 0.001,
+                       'lr_schedule': {'type': 'multistep', 'milestones': {1000: 0.0005, 2000: 0.0001}},
+                       'early_stopping': {'patience': 500, 'min_delta': 0.0},
+                       'feature_weight': 'feature_weight_data'},
+        'regression': {'epochs': 1000, 'batch_size': 3000, 'lr': 0.001,
+                       'lr_schedule': {'type': 'multistep', 'milestones': {500: 0.0005, 800: 0.0001}},
+                       'early_stopping': {'patience': 200, 'min_delta': 0.0},
+                       'classifier_weight': 'classification_weight_data2',
+                       'targets': {'mel': 'regression'}},
+    },
+    'thickness': {
+        'class_mode': 'thickness',
+        'prior_models': [],
+        'feature': {'epochs': 5000, 'batch_size': 1000, 'lr': 0.001, 'margin': 1.0,
+                    'lr_schedule': {'type': 'multistep', 'milestones': {2000: 0.0005, 4000: 0.0003}},
+                    'early_stopping': {'patience': 1000, 'min_delta': 0.0},
+                    'snapshot_epochs': [10000]},
+        'classifier': {'epochs': 3000, 'batch_size': 3000, 'lr': 0.001,
+                       'lr_schedule': {'type': 'multistep', 'milestones': {1000: 0.0005, 2000: 0.0001}},
+                       'early_stopping': {'patience': 500, 'min_delta': 0.0},
+                       'feature_weight': 'feature_weight_data'},
+        'regression': {'epochs': 1000, 'batch_size': 3000, 'lr': 0.001,
+                       'lr_schedule': {'type': 'multistep', 'milestones': {500: 0.0005, 800: 0.0001}},
+                       'early_stopping': {'patience': 200, 'min_delta': 0.0},
+                       'classifier_weight': 'classification_weight_data',
+                       'targets': {'thickness': 'regression'}},
+    },
+    # thb + sto combination, 입력은 Absorbance + 학습된 mel, thickness Model의 확률분포
+    'sto_thb': {
+        'class_mode': '',
+        'prior_models': [('mel', 'vitalsign_mel_0104_prob_01_input14_m1_epoch5000_addinput3'),
+                         ('thickness', 'vitalsign_thickness_0104_prob_01_input14_m1_epoch5000_addinput3')],
+        'feature': {'epochs': 5000, 'batch_size': 1000, 'lr': 0.001, 'margin': 0.5,
+                    'lr_schedule': {'type': 'multistep', 'milestones': {2000: 0.0005, 4000: 0.0003}},
+                    'early_stopping': {'patience': 1000, 'min_delta': 0.0},
+                    'snapshot_epochs': []},
+        'classifier': {'epochs': 3000, 'batch_size': 3000, 'lr': 0.001,
+                       'lr_schedule': {'type': 'multistep', 'milestones': {1000: 0.0005, 2000: 0.0001}},
+                       'early_stopping': {'patience': 500, 'min_delta': 0.0},
+                       'feature_weight': 'feature_weight_data'},
+        'regression': {'epochs': 1000, 'batch_size': 1000, 'lr': 0.001,
+                       'lr_schedule': {'type': 'multistep', 'milestones': {500: 0.0005, 800: 0.0001}},
+                       'early_stopping': {'patience': 200, 'min_delta': 0.0},
+                       'classifier_weight': 'classification_weight_data2',
+                       'targets': {'sto': 'regression_sto', 'thb': 'regression_thb'}},
+    },
+}
+
+
+# Feature Model Triplet 선택 방식. 'random' 은 TripletSampler로 positive/negative를 미리 고르고,
+# 나머지는 batch 안에서 online으로 고름 (online_triplet_loss)
+ONLINE_TRIPLET_LOSS = {
+    'hard': batch_hard_triplet_loss,
+    'semihard': batch_hard_semi_triplet_loss,
+    'all': lambda labels, embeddings, margin: batch_all_triplet_loss(labels, embeddings, margin)[0],
+}
+
+
+class TripletSampler():
+    '''
+    anchor 별로 같은 Class(positive), 다른 Class(negative) index를 한 번에 Random Sampling
+    labels : (N,) LongTensor
+    '''
+    def __init__(self, labels):
+        self.order = torch.argsort(labels)
+        self.labels = labels
+        self.count = torch.bincount(labels)
+        self.start = torch.cumsum(self.count, dim=0) - self.count
+
+    def sample(self, anchor_idx, generator=None):
+        anchor_label = self.labels[anchor_idx]
+        anchor_count = self.count[anchor_label]
+        anchor_start = self.start[anchor_label]
+
+        rand_p = torch.rand(len(anchor_idx), generator=generator, device=anchor_idx.device)
+        rand_n = torch.rand(len(anchor_idx), generator=generator, device=anchor_idx.device)
+
+        p_idx = anchor_start + (rand_p * anchor_count).long()
+
+        # 자기 Class 구간을 건너뛰어 다른 Class 중에서 고름
+        n_idx = (rand_n * (len(self.labels) - anchor_count)).long()
+        n_idx = n_idx + (n_idx >= anchor_start).long() * anchor_count
+
+        return self.order[p_idx], self.order[n_idx]
+
+
+def soft_cross_entropy(pred_prob, target_prob):
+    return torch.mean(-(torch.sum(target_prob * torch.log(pred_prob + 0.00000000001), dim=1)))
+
+
+class StagedTrainer():
+    def __init__(self, config, save_dir, use_gpu=False, train_file_list=TRAIN_FILE_LIST, test_file_list=TEST_FILE_LIST, input_dir=None,
+                 checkpoint_interval=100, resume=True, async_validation=True, corpus=None, augment=None):
+        '''
+        corpus : 미리 읽어둔 {'train': corpus, 'val': corpus} (simulation_corpus.cached_corpus), None이면 file_list에서 읽음
+        augment : augmentation.Augmentation 인자 dict (예 : augmentation.RANDOM20_3), None이면 사용 안함
+        '''
+        self.config = config
+        self.async_validation = async_validation
+        self.checkpoint_interval = checkpoint_interval
+        self.resume = resume
+        self.cl = config['class_mode']
+        self.device = 'cuda' if use_gpu else 'cpu'
+
+        path = os.path.dirname(__file__)
+        self.result_dir = os.path.join(path, 'result', save_dir)
+
+        if os.path.isdir(self.result_dir) == False:
+            os.makedirs(self.result_dir)
+
+        self._load_data(corpus, train_file_list, test_file_list, input_dir)
+
+        self.augment_config = augment
+        self.augment = build_augmentation(augment, self.device)
+
+        self.feature_model = None
+        self.classifier_model = None
+        self.regression_models = {}
+
+        # 단계별 최종 best_loss, best_test_loss (Sweep 결과 정리용)
+        self.metrics = {}
+
+    def _load_data(self, corpus, train_file_list, test_file_list, input_dir):
+        # Dataset은 한 번만 읽고, 모든 단계에서 같은 Tensor를 사용함
+        if corpus is None:
+            corpus = {'train': load_simulation_corpus(train_file_list, input_dir),
+                      'val': load_simulation_corpus(test_file_list, input_dir)}
+
+        self.data = {}
+        for name in ('train', 'val'):
+            self.data[name] = self._to_device(corpus[name])
+
+        self._append_prior_probs()
+
+    @property
+    def input_dim(self):
+        return self.data['val']['input'].shape[1]
+
+    @property
+    def feature_dim(self):
+        return self.config['feature'].get('hidden_dim', 128)
+
+    def weight_path(self, name):
+        return os.path.join(self.result_dir, name)
+
+    def checkpoint_fingerprint(self, cfg):
+        '''단계 설정 cfg 와 입력 구성 (class_mode, prior Model, Augmentation) 의 hash'''
+        return config_fingerprint({'class_mode': self.cl, 'prior_models': self.config['prior_models'],
+                                   'augment': self.augment_config, 'stage': cfg})
+
+    def checkpointer(self, stage, cfg):
+        return Checkpointer(self.weight_path('checkpoint_{}'.format(stage)), self.checkpoint_interval, self.resume,
+                            self.checkpoint_fingerprint(cfg))
+
+    def _to_device(self, corpus):
+        # mmap Cache는 읽기 전용이므로 복사해서 Tensor로 만듦
+        value = np.array(corpus['value'])
+        data = {
+            'input': torch.from_numpy(np.array(corpus['absorbance'])).to(self.device),
+            'value': torch.from_numpy(value).to(self.device),
+            'label': torch.from_numpy(class_label(value, self.cl)).to(self.device),
+            'soft_label': torch.from_numpy(soft_label(value, self.cl)).to(self.device),
+        }
+        return data
+
+    def _load_prior_stage1(self):
+        '''config 의 prior Model (학습된 mel, thickness) 을 묶은 FusedStage1, prior Model 이 없으면 None'''
+        if len(self.config['prior_models']) == 0:
+            return None
+
+        path = os.path.dirname(__file__)
+
+        prior_models = []
+        for prior_cl, prior_dir in self.config['prior_models']:
+            feature_model = VitalSign_Feature_mel_thickness().to(self.device)
+            classifier_model = Classifier(cl_mode=prior_cl).to(self.device)
+
+            feature_model.load_state_dict(torch.load(os.path.join(path, 'result', prior_dir, 'feature_weight_data'), map_location=self.device))
+            classifier_model.load_state_dict(torch.load(os.path.join(path, 'result', prior_dir, 'classification_weight_data2'), map_location=self.device))
+            prior_models.append((feature_model, classifier_model))
+
+        # 모든 prior Model 을 batched matmul 한 번으로 계산
+        stage1 = FusedStage1.from_models(prior_models, cl_modes=[cl for cl, _ in self.config['prior_models']])
+        stage1.eval()
+        return stage1
+
+    def _append_prior_probs(self):
+        '''학습된 mel, thickness Model의 확률분포를 입력에 붙임 (한 번만 계산)'''
+        stage1 = self._load_prior_stage1()
+        if stage1 is None:
+            return
+
+        prior_probs = {name: [] for name in self.data}
+        with torch.no_grad():
+            for name in prior_probs:
+                prior_probs[name] = [F.softmax(out, dim=1) for out in stage1(self.data[name]['input'])]
+
+        for name in prior_probs:
+            self.data[name]['input'] = torch.cat([self.data[name]['input']] + prior_probs[name], dim=1)
+
+    def _cache_outputs(self, model, inputs, softmax=False):
+        '''고정된 Model의 출력을 한 번만 계산'''
+        model.eval()
+        with torch.no_grad():
+            out = model(inputs)
+            if softmax:
+                out = F.softmax(out, dim=1)
+        return out
+
+    def _set_epoch(self, epoch):
+        '''epoch 마다 다시 정하는 random stream (Augmentation)'''
+        if self.augment is not None:
+            self.augment.set_epoch(epoch)
+
+    def _train_input(self, idx):
+        '''학습 입력 batch (augment 가 있으면 Augmentation 적용)'''
+        x = self.data['train']['input'][idx]
+        if self.augment is not None:
+            x = self.augment(x)
+        return x
+
+    def _frozen_batch(self, cached, frozen, idx, dim=0):
+        '''고정된 Model 출력 batch, augment 가 있으면 cache 대신 Augmentation 한 입력으로 다시 계산'''
+        if self.augment is None:
+            return cached.index_select(dim, idx)
+        with torch.no_grad():
+            return frozen(self._train_input(idx))
+
+    def run(self):
+        self.train_feature()
+        self.train_classifier()
+        self.train_regression()
+
+    def _fit(self, stage, model, cfg, train_epoch, validate, weight_names, log_format, save2_message=None, on_epoch_end=None):
+        '''
+        단계 공통 학습 Loop
+        train_epoch(optimizer) -> 한 epoch 학습 후 batch Loss list
+        validate(model) -> (test_loss, 추가 출력값...) : 10 epoch 마다 weight snapshot으로 (비동기) 계산
+        weight_names : (Training Loss 최소, Test Loss 최소, 그 외) 저장 파일 이름, 그 외가 None 이면 저장 안함
+        log_format(epoch, epochs, mean_loss, test_loss, ...) -> 출력 문자열
+        '''
+        optimizer = optim.Adam(model.parameters(), lr=cfg['lr'])
+        scheduler = build_scheduler(optimizer, cfg.get('lr_schedule'))
+        stopper = build_early_stopping(cfg.get('early_stopping'))
+
+        ckpt = self.checkpointer(stage, cfg)
+        metrics = ckpt.load(model, optimizer, scheduler, stopper)
+
+        best = {'best_loss': metrics.get('best_loss', float('inf')),
+                'best_test_loss': metrics.get('best_test_loss', float('inf'))}
+        epochs = cfg['epochs']
+
+        def report(epoch, mean_loss, result, state):
+            '''Validation 결과가 도착하면 Best Model 선택 및 저장, 학습을 멈춰야 하면 True'''
+            test_loss = result[0]
+
+            if mean_loss < best['best_loss']:
+                best['best_loss'] = mean_loss
+                print(log_format(epoch, epochs, mean_loss, *result) + " (Save Model)")
+                # Training data Loss가 줄어들 때, Model Save
+                torch.save(state, self.weight_path(weight_names[0]))
+            else:
+                print(log_format(epoch, epochs, mean_loss, *result))
+                if weight_names[2] is not None:
+                    torch.save(state, self.weight_path(weight_names[2]))
+
+            if test_loss < best['best_test_loss']:
+                best['best_test_loss'] = test_loss
+                # Test data Loss가 줄어들 때, Model Save
+                torch.save(state, self.weight_path(weight_names[1]))
+                if save2_message is not None:
+                    print(save2_message)
+
+            scheduler_step(scheduler, test_loss)
+
+            if stopper is not None and stopper.step(test_loss, epoch, state=state):
+                print("Early Stopping at Epoch {}/{} : {}".format(epoch + 1, epochs, stopper.reason))
+                return True
+            return False
+
+        validator = AsyncValidator(model, validate, asynchronous=self.async_validation)
+        stop = False
+
+        for epoch in ckpt.epoch_range(epochs):
+            self._set_epoch(epoch)
+
+            model.train()
+            running_loss = train_epoch(optimizer)
+
+            if on_epoch_end is not None:
+                on_epoch_end(epoch, model)
+
+            if epoch % 10 == 0:
+                validator.submit(epoch, model, np.mean(running_loss))
+
+            for v_epoch, mean_loss, result, state in validator.poll():
+                if stop == False:
+                    stop = report(v_epoch, mean_loss, result, state)
+
+            if stop:
+                break
+
+            scheduler_step(scheduler)
+            ckpt.step(epoch, model, optimizer, scheduler, stopper, best)
+
+        for v_epoch, mean_loss, result, state in validator.drain():
+            if stop == False:
+                stop = report(v_epoch, mean_loss, result, state)
+        validator.close()
+
+        ckpt.finish(model, optimizer, scheduler, stopper, best)
+        self.metrics[stage] = dict(best)
+
+        if stopper is not None:
+            stopper.restore(model)
+
+        return model
+
+    ############# 1. Train Feature Model ###################
+    def train_feature(self):
+        print("**************************************************")
+        print("************ 1.  Train Feature Model *************")
+        print("**************************************************")
+        cfg = self.config['feature']
+        train, val = self.data['train'], self.data['val']
+
+        feature_model = VitalSign_Feature_mel_thickness(input_dim=self.input_dim, hidden_dim=cfg.get('hidden_dim', 128)).to(self.device)
+        criterion = nn.TripletMarginLoss(margin=cfg['margin'], p=2)
+        mining = cfg.get('mining', 'random')
+
+        # Test triplet은 고정해서 epoch 간 Loss 비교가 가능하도록 함
+        val_generator = torch.Generator(device=self.device)
+        val_generator.manual_seed(0)
+        val_pos, val_neg = TripletSampler(val['label']).sample(torch.arange(len(val['label']), device=self.device), val_generator)
+        train_sampler = TripletSampler(train['label'])
+        n_train = len(train['label'])
+
+        def train_epoch(optimizer):
+            running_loss = []
+            perm = torch.randperm(n_train, device=self.device)
+            for bi in range(0, n_train, cfg['batch_size']):
+                anchor_idx = perm[bi:bi + cfg['batch_size']]
+                anc_out = feature_model(self._train_input(anchor_idx))
+
+                if mining == 'random':
+                    pos_idx, neg_idx = train_sampler.sample(anchor_idx)
+                    pos_out = feature_model(self._train_input(pos_idx))
+                    neg_out = feature_model(self._train_input(neg_idx))
+                    loss = criterion(anc_out, pos_out, neg_out)
+                else:
+                    loss = ONLINE_TRIPLET_LOSS[mining](train['label'][anchor_idx], anc_out, margin=cfg['margin'])
+
+                optimizer.zero_grad()
+                loss.backward()
+                optimizer.step()
+
+                running_loss.append(loss.item())
+            return running_loss
+
+        def validate(model):
+            val_out = model(val['input'])
+            return (criterion(val_out, val_out[val_pos], val_out[val_neg]).item(),)
+
+        def log_format(epoch, epochs, mean_loss, test_loss):
+            t_stamp = time.ctime(time.time())
+            return "{} | Epoch: {}/{} - Loss: {:.4f} , Test Loss: {:.4f}".format(t_stamp, epoch + 1, epochs, mean_loss, test_loss)
+
+        def on_epoch_end(epoch, model):
+            if epoch in cfg['snapshot_epochs']:
+                torch.save(model.state_dict(), self.weight_path('feature_weight_data_{}'.format(epoch)))
+
+        self._fit('feature', feature_model, cfg, train_epoch, validate,
+                  ('feature_weight_data', 'feature_weight_data2', 'feature_weight_data3'), log_format,
+                  save2_message="[Save Feature Netwrok 2]", on_epoch_end=on_epoch_end)
+
+        self.feature_model = feature_model
+        return feature_model
+
+    ############# 2. Train Classification Model ###################
+    def train_classifier(self):
+        print("**************************************************")
+        print("****** 2.  Train Classification Model ************")
+        print("**************************************************")
+        cfg = self.config['classifier']
+        train, val = self.data['train'], self.data['val']
+
+        if self.feature_model is None:
+            self.feature_model = VitalSign_Feature_mel_thickness(input_dim=self.input_dim, hidden_dim=self.feature_dim).to(self.device)
+        self.feature_model.load_state_dict(torch.load(self.weight_path(cfg['feature_weight']), map_location=self.device))
+
+        # Feature Model은 고정되어 있으므로 출력을 한 번만 계산 (augment 가 있으면 학습 batch 는 매번 계산)
+        self.feature_model.eval()
+        train_x = self._cache_outputs(self.feature_model, train['input']) if self.augment is None else None
+        val_x = self._cache_outputs(self.feature_model, val['input'])
+        n_train = len(train['input'])
+
+        classifier_model = Classifier(cl_mode=self.cl, input_dim=self.feature_dim).to(self.device)
+
+        def train_epoch(optimizer):
+            running_loss = []
+            perm = torch.randperm(n_train, device=self.device)
+            for bi in range(0, n_train, cfg['batch_size']):
+                idx = perm[bi:bi + cfg['batch_size']]
+
+                pred_prob = F.softmax(classifier_model(self._frozen_batch(train_x, self.feature_model, idx)), dim=1)
+                loss = soft_cross_entropy(pred_prob, train['soft_label'][idx])
+
+                optimizer.zero_grad()
+                loss.backward()
+                optimizer.step()
+
+                running_loss.append(loss.item())
+            return running_loss
+
+        def validate(model):
+            pred_prob = F.softmax(model(val_x), dim=1)
+            test_loss = soft_cross_entropy(pred_prob, val['soft_label']).item()
+            acc = (torch.argmax(pred_prob, dim=1) == val['label']).float().mean().item()
+            return test_loss, acc
+
+        def log_format(epoch, epochs, mean_loss, test_loss, acc):
+            return "Epoch: {}/{} - Loss: {:.4f} , Test loss : {:.4f},  Test Acc : {:.4f}".format(epoch + 1, epochs, mean_loss, test_loss, acc)
+
+        self._fit('classifier', classifier_model, cfg, train_epoch, validate,
+                  ('classification_weight_data', 'classification_weight_data2', None), log_format)
+
+        self.classifier_model = classifier_model
+        return classifier_model
+
+    ############# 3. Train Regression Model ###################
+    def train_regression(self):
+        cfg = self.config['regression']
+        train, val = self.data['train'], self.data['val']
+
+        if self.feature_model is None:
+            self.feature_model = VitalSign_Feature_mel_thickness(input_dim=self.input_dim, hidden_dim=self.feature_dim).to(self.device)
+            self.feature_model.load_state_dict(torch.load(self.weight_path(self.config['classifier']['feature_weight']), map_location=self.device))
+        if self.classifier_model is None:
+            self.classifier_model = Classifier(cl_mode=self.cl, input_dim=self.feature_dim).to(self.device)
+        self.classifier_model.load_state_dict(torch.load(self.weight_path(cfg['classifier_weight']), map_location=self.device))
+
+        # Feature, Classifier Model은 고정되어 있으므로 확률분포를 한 번만 계산 (augment 가 있으면 학습 batch 는 매번 계산)
+        def frozen(x):
+            return self._cache_outputs(self.classifier_model, self._cache_outputs(self.feature_model, x), softmax=True)
+
+        train_prob = frozen(train['input']) if self.augment is None else None
+        val_prob = frozen(val['input'])
+        n_train = len(train['input'])
+        criterion = nn.MSELoss()
+
+        def log_format(epoch, epochs, mean_loss, test_loss):
+            return "Epoch: {}/{} - Loss: {:.4f},  Test Loss: {:.4f}".format(epoch + 1, epochs, mean_loss, test_loss)
+
+        for target, prefix in cfg['targets'].items():
+            print("**************************************************")
+            print("****** 3.  Train Regression Model ({}) ************".format(target))
+            print("**************************************************")
+
+            train_gt = train['value'][:, VALUE_INDEX[target]]
+            val_gt = val['value'][:, VALUE_INDEX[target]]
+
+            reg_model = Regression(cl_mode=self.cl).to(self.device)
+
+            def train_epoch(optimizer):
+                running_loss = []
+                perm = torch.randperm(n_train, device=self.device)
+                for bi in range(0, n_train, cfg['batch_size']):
+                    idx = perm[bi:bi + cfg['batch_size']]
+
+                    pred_value = reg_model(self._frozen_batch(train_prob, frozen, idx)).squeeze(1)
+                    loss = torch.sqrt(criterion(pred_value, train_gt[idx]))
+
+                    optimizer.zero_grad()
+                    loss.backward()
+                    optimizer.step()
+
+                    running_loss.append(loss.item())
+                return running_loss
+
+            def validate(model):
+                pred_value = model(val_prob).squeeze(1)
+                return (torch.sqrt(criterion(pred_value, val_gt)).item(),)
+
+            self._fit('regression_{}'.format(target), reg_model, cfg, train_epoch, validate,
+                      ('{}_weight_data'.format(prefix), '{}_weight_data2'.format(prefix), None), log_format)
+
+            self.regression_models[target] = reg_model
+
+        return self.regression_models
@@ -0,0 +1,368 @@
+import copy
+import hashlib
+import json
+import math
+import numpy as np
+import os
+import random
+
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import torch
+import torch.optim as optim
+
+'''
+학습 Loop 공통 Utility
+Learning rate는 Optimizer를 새로 만들지 않고 Scheduler로 바꾸어 Adam의 moment 추정값을 유지함.
+'''
+
+
+def build_scheduler(optimizer, schedule=None):
+    '''
+    schedule 예시
+      {'type': 'multistep', 'milestones': {2000: 0.0005, 4000: 0.0003}}  : 해당 epoch부터 lr 변경
+      {'type': 'step', 'step_size': 1000, 'gamma': 0.5}
+      {'type': 'cosine', 'T_max': 5000, 'eta_min': 0.00001}
+      {'type': 'plateau', 'factor': 0.5, 'patience': 10, 'min_lr': 0.00001} : patience는 Validation 횟수 기준
+    '''
+    if schedule is None:
+        return None
+
+    if schedule['type'] == 'multistep':
+        base_lr = optimizer.param_groups[0]['lr']
+        milestones = sorted(schedule['milestones'].items())
+
+        def lr_lambda(epoch):
+            lr = base_lr
+            for m_epoch, m_lr in milestones:
+                if epoch >= m_epoch:
+                    lr = m_lr
+            return lr / base_lr
+
+        return optim.lr_scheduler.LambdaLR(optimizer, lr_lambda)
+    elif schedule['type'] == 'step':
+        return optim.lr_scheduler.StepLR(optimizer, step_size=schedule['step_size'], gamma=schedule.get('gamma', 0.1))
+    elif schedule['type'] == 'cosine':
+        return optim.lr_scheduler.CosineAnnealingLR(optimizer, T_max=schedule['T_max'], eta_min=schedule.get('eta_min', 0))
+    elif schedule['type'] == 'plateau':
+        return optim.lr_scheduler.ReduceLROnPlateau(optimizer, mode='min', factor=schedule.get('factor', 0.5),
+                                                    patience=schedule.get('patience', 10), min_lr=schedule.get('min_lr', 0))
+    else:
+        raise ValueError("Unknown lr schedule type : {}".format(schedule['type']))
+
+
+def scheduler_step(scheduler, metric=None):
+    '''
+    epoch 마다 호출. plateau Scheduler는 Validation Loss(metric)가 있을 때만 step 함.
+    '''
+    if scheduler is None:
+        return
+
+    if isinstance(scheduler, optim.lr_scheduler.ReduceLROnPlateau):
+        if metric is not None:
+            scheduler.step(metric)
+    elif metric is None:
+        scheduler.step()
+
+
+def set_lr(optimizer, lr):
+    '''Optimizer 상태(moment)를 유지한 채 lr만 변경'''
+    for param_group in optimizer.param_groups:
+        param_group['lr'] = lr
+
+
+def get_lr(optimizer):
+    return optimizer.param_groups[0]['lr']
+
+
+class BatchedAdam(optim.Optimizer):
+    '''
+    dim 0 으로 N개 Model의 weight를 쌓은 Parameter (vitalsign_model.BatchedMLP) 용 Adam
+    lr_scale : (N,) Model 별 lr 배율, 실제 lr = param_group lr (Scheduler가 변경) * lr_scale[i]
+    '''
+    def __init__(self, params, lr=0.001, betas=(0.9, 0.999), eps=1e-8, lr_scale=None):
+        defaults = dict(lr=lr, betas=betas, eps=eps, lr_scale=lr_scale)
+        super(BatchedAdam, self).__init__(params, defaults)
+
+    @torch.no_grad()
+    def step(self, closure=None):
+        loss = None
+        if closure is not None:
+            with torch.enable_grad():
+                loss = closure()
+
+        for group in self.param_groups:
+            beta1, beta2 = group['betas']
+
+            for p in group['params']:
+                if p.grad is None:
+                    continue
+
+                state = self.state[p]
+                if len(state) == 0:
+                    state['step'] = 0
+                    state['exp_avg'] = torch.zeros_like(p)
+                    state['exp_avg_sq'] = torch.zeros_like(p)
+
+                state['step'] += 1
+                exp_avg, exp_avg_sq = state['exp_avg'], state['exp_avg_sq']
+
+                exp_avg.mul_(beta1).add_(p.grad, alpha=1 - beta1)
+                exp_avg_sq.mul_(beta2).addcmul_(p.grad, p.grad, value=1 - beta2)
+
+                bias_correction1 = 1 - beta1 ** state['step']
+                bias_correction2 = 1 - beta2 ** state['step']
+
+                denom = (exp_avg_sq.sqrt() / math.sqrt(bias_correction2)).add_(group['eps'])
+                step_size = group['lr'] / bias_correction1
+
+                if group['lr_scale'] is None:
+                    p.addcdiv_(exp_avg, denom, value=-step_size)
+                else:
+                    scale = torch.as_tensor(group['lr_scale'], dtype=p.dtype, device=p.device)
+                    scale = scale.view(-1, *([1] * (p.dim() - 1)))
+                    p.addcdiv_(exp_avg * scale, denom, value=-step_size)
+
+        return loss
+
+
+def snapshot_state(model):
+    '''학습 중에도 변하지 않는 weight 복사본'''
+    return {k: v.detach().clone() for k, v in model.state_dict().items()}
+
+
+class EarlyStopping():
+    '''
+    Validation Loss가 patience epoch 동안 min_delta 이상 줄지 않으면 학습 중단
+    restore_best : 중단(또는 종료) 후 Validation Loss가 가장 낮았던 weight로 되돌림
+    '''
+    def __init__(self, patience=1000, min_delta=0.0, restore_best=True):
+        self.patience = patience
+        self.min_delta = min_delta
+        self.restore_best = restore_best
+
+        self.best_loss = float('inf')
+        self.best_epoch = -1
+        self.best_state = None
+        self.stop_epoch = None
+        self.reason = None
+
+    def step(self, val_loss, epoch, model=None, state=None):
+        '''
+        Validation 할 때마다 호출, 학습을 멈춰야 하면 True
+        state : Validation에 사용한 weight snapshot (AsyncValidator), 없으면 model의 현재 weight를 복사
+        '''
+        if val_loss < self.best_loss - self.min_delta:
+            self.best_loss = val_loss
+            self.best_epoch = epoch
+            if self.restore_best:
+                self.best_state = state if state is not None else snapshot_state(model)
+            return False
+
+        if epoch - self.best_epoch >= self.patience:
+            self.stop_epoch = epoch
+            self.reason = "Validation Loss did not improve by {} for {} epochs (best {:.4f} at epoch {})".format(
+                self.min_delta, epoch - self.best_epoch, self.best_loss, self.best_epoch + 1)
+            return True
+
+        return False
+
+    def restore(self, model):
+        if self.restore_best and self.best_state is not None:
+            model.load_state_dict(self.best_state)
+
+    def state_dict(self):
+        return {'best_loss': self.best_loss, 'best_epoch': self.best_epoch, 'best_state': self.best_state,
+                'stop_epoch': self.stop_epoch, 'reason': self.reason}
+
+    def load_state_dict(self, state):
+        for key, value in state.items():
+            setattr(self, key, value)
+
+
+def build_early_stopping(config=None):
+    '''config 예시 : {'patience': 1000, 'min_delta': 0.0001, 'restore_best': True}'''
+    if config is None:
+        return None
+    return EarlyStopping(**config)
+
+
+class AsyncValidator():
+    '''
+    weight snapshot에 대한 Validation을 별도 Thread에서 수행하여, Validation 중에도 학습이 계속 진행되도록 함
+    validate_fn(model) -> (test_loss, ...) : no_grad, eval mode 에서 호출됨
+    submit() 으로 요청하고, poll() / drain() 으로 끝난 결과를 epoch 순서대로 받음
+    asynchronous == False 이면 submit() 에서 바로 Validation 함 (기존 동기 방식)
+    '''
+    def __init__(self, model, validate_fn, asynchronous=True, max_pending=2):
+        self.validate_fn = validate_fn
+        self.asynchronous = asynchronous
+        self.max_pending = max_pending
+
+        if self.asynchronous:
+            self.eval_model = copy.deepcopy(model)
+            self.executor = ThreadPoolExecutor(max_workers=1)
+        else:
+            self.eval_model = model
+            self.executor = None
+
+        self.pending = deque()
+
+    def _validate(self, state):
+        self.eval_model.load_state_dict(state)
+        self.eval_model.eval()
+        with torch.no_grad():
+            return self.validate_fn(self.eval_model)
+
+    def submit(self, epoch, model, info=None):
+        '''info : 결과와 함께 돌려줄 값 (예: 해당 epoch의 Training Loss)'''
+        state = snapshot_state(model)
+
+        if self.asynchronous:
+            future = self.executor.submit(self._validate, state)
+        else:
+            future = Future()
+            future.set_result(self._validate(state))
+
+        self.pending.append((epoch, info, state, future))
+
+    def poll(self):
+        '''끝난 결과 (epoch, info, result, state) list. 밀린 요청이 max_pending 보다 많으면 기다림'''
+        results = []
+        while len(self.pending) > 0:
+            epoch, info, state, future = self.pending[0]
+            if future.done() == False and len(self.pending) <= self.max_pending:
+                break
+            self.pending.popleft()
+            results.append((epoch, info, future.result(), state))
+        return results
+
+    def drain(self):
+        '''남은 요청을 모두 기다려서 결과 반환'''
+        results = []
+        while len(self.pending) > 0:
+            epoch, info, state, future = self.pending.popleft()
+            results.append((epoch, info, future.result(), state))
+        return results
+
+    def close(self):
+        for _, _, _, future in self.pending:
+            future.cancel()
+        self.pending.clear()
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+
+
+def get_rng_state():
+    state = {'python': random.getstate(), 'numpy': np.random.get_state(), 'torch': torch.get_rng_state()}
+    if torch.cuda.is_available():
+        state['cuda'] = torch.cuda.get_rng_state_all()
+    return state
+
+
+def set_rng_state(state):
+    random.setstate(state['python'])
+    np.random.set_state(state['numpy'])
+    torch.set_rng_state(state['torch'])
+    if 'cuda' in state and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(state['cuda'])
+
+
+def save_atomic(obj, path):
+    '''임시 파일에 저장한 뒤 rename 하므로, 저장 중 중단되어도 이전 파일이 깨지지 않음'''
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        torch.save(obj, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def config_fingerprint(config):
+    '''학습 설정 (dict, list, 숫자, 문자열) 의 hash, Checkpoint 가 같은 설정으로 저장된 것인지 확인하는 데 사용'''
+    text = json.dumps(config, sort_keys=True, default=str)
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+class Checkpointer():
+    '''
+    학습 재개용 Checkpoint (model, optimizer, scheduler, early stopping, epoch, best metric, RNG state)
+    interval epoch 마다 path에 덮어씀. resume == True 이고 path가 있으면 load() 에서 이어서 학습할 상태로 복원
+    fingerprint : 학습 설정 hash (config_fingerprint), 저장된 Checkpoint 의 fingerprint 와 다르면 (설정이 바뀜)
+                  이어서 학습하지 않고 처음부터 학습함. 이전 Checkpoint 는 <path>.stale 로 옮겨둠
+    '''
+    def __init__(self, path, interval=100, resume=True, fingerprint=None):
+        self.path = path
+        self.interval = interval
+        self.resume = resume
+        self.fingerprint = fingerprint
+
+        self.start_epoch = 0
+        self.last_epoch = -1
+        self.finished = False
+
+    def load(self, model, optimizer=None, scheduler=None, stopper=None):
+        '''return : 저장되어 있던 metric dict (best_loss 등), Checkpoint가 없으면 {}'''
+        if self.resume == False or os.path.isfile(self.path) == False:
+            return {}
+
+        ckpt = torch.load(self.path, map_location='cpu', weights_only=False)
+
+        if ckpt.get('fingerprint') != self.fingerprint:
+            os.replace(self.path, self.path + '.stale')
+            print("[Checkpoint] {} : config changed, start from Epoch 1 (old checkpoint moved to {}.stale)".format(self.path, self.path))
+            return {}
+
+        model.load_state_dict(ckpt['model'])
+        if optimizer is not None and ckpt['optimizer'] is not None:
+            optimizer.load_state_dict(ckpt['optimizer'])
+        if scheduler is not None and ckpt['scheduler'] is not None:
+            scheduler.load_state_dict(ckpt['scheduler'])
+        if stopper is not None and ckpt['stopper'] is not None:
+            stopper.load_state_dict(ckpt['stopper'])
+        set_rng_state(ckpt['rng'])
+
+        self.start_epoch = ckpt['epoch'] + 1
+        self.last_epoch = ckpt['epoch']
+        self.finished = ckpt['finished']
+
+        if self.finished:
+            print("[Checkpoint] {} : already finished at Epoch {}".format(self.path, self.start_epoch))
+        else:
+            print("[Checkpoint] {} : resume from Epoch {}".format(self.path, self.start_epoch + 1))
+
+        return ckpt['metrics']
+
+    def epoch_range(self, epochs):
+        '''이어서 학습할 epoch 범위 (이미 끝난 단계면 빈 범위)'''
+        if self.finished:
+            return range(0)
+        return range(self.start_epoch, epochs)
+
+    def save(self, epoch, model, optimizer=None, scheduler=None, stopper=None, metrics=None, finished=False):
+        ckpt = {
+            'epoch': epoch,
+            'finished': finished,
+            'fingerprint': self.fingerprint,
+            'model': model.state_dict(),
+            'optimizer': optimizer.state_dict() if optimizer is not None else None,
+            'scheduler': scheduler.state_dict() if scheduler is not None else None,
+            'stopper': stopper.state_dict() if stopper is not None else None,
+            'metrics': metrics if metrics is not None else {},
+            'rng': get_rng_state(),
+        }
+        save_atomic(ckpt, self.path)
+
+    def step(self, epoch, model, optimizer=None, scheduler=None, stopper=None, metrics=None):
+        '''epoch 마다 호출, interval 마다 저장'''
+        self.last_epoch = epoch
+        if self.interval is not None and (epoch + 1) % self.interval == 0:
+            self.save(epoch, model, optimizer, scheduler, stopper, metrics)
+
+    def finish(self, model, optimizer=None, scheduler=None, stopper=None, metrics=None):
+        '''단계가 끝났을 때(마지막 epoch 또는 Early Stopping) 호출, 재실행 시 이 단계는 건너뜀'''
+        if self.finished:
+            return
+        self.save(self.last_epoch, model, optimizer, scheduler, stopper, metrics, finished=True)
+        self.finished = True
@@ -0,0 +1,231 @@
+import math
+
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+'''
+멜라닌, 피부두께, 산소포화도/혈류량 추정을 위한 확률기반 Regression Model 정의
+(Feature Model -> Classifier -> Regression)
+'''
+
+# class_mode 별 Class 개수 ('' 는 thb + sto combination)
+NUM_CLASSES = {'mel': 8, 'thb': 7, 'sto': 7, 'thickness': 3, '': 49}
+
+
+class VitalSign_Feature_mel_thickness(nn.Module):
+    def __init__(self, input_dim=14, hidden_dim=128):
+        super(VitalSign_Feature_mel_thickness, self).__init__()
+
+        self.input_dim = input_dim
+        self.hidden_dim = hidden_dim
+
+        self.common1 = nn.Linear(self.input_dim, self.hidden_dim)
+        self.common2 = nn.Linear(self.hidden_dim, self.hidden_dim)
+        self.common3 = nn.Linear(self.hidden_dim, self.hidden_dim)
+        self.common4 = nn.Linear(self.hidden_dim, self.hidden_dim)
+        self.common5 = nn.Linear(self.hidden_dim, self.hidden_dim)
+
+    def forward(self, x):
+        x = F.leaky_relu(self.common1(x))
+        x = F.leaky_relu(self.common2(x))
+        x = F.leaky_relu(self.common3(x))
+        x = F.leaky_relu(self.common4(x))
+        x = F.leaky_relu(self.common5(x))
+
+        return x
+
+
+class Classifier(nn.Module):
+    def __init__(self, cl_mode, input_dim=128):
+        super(Classifier, self).__init__()
+
+        self.input_dim = input_dim
+
+        self.layer11 = nn.Linear(self.input_dim, 128)
+        self.layer12 = nn.Linear(128, 128)
+        self.layer13 = nn.Linear(128, 128)
+        self.layer14 = nn.Linear(128, 128)
+        self.layer15 = nn.Linear(128, NUM_CLASSES.get(cl_mode, 49))
+
+    def forward(self, x):
+        x1 = F.leaky_relu(self.layer11(x))
+        x1 = F.leaky_relu(self.layer12(x1))
+        x1 = F.leaky_relu(self.layer13(x1))
+        x1 = F.leaky_relu(self.layer14(x1))
+        x1 = self.layer15(x1)
+
+        return x1
+
+
+class Regression(nn.Module):
+    def __init__(self, cl_mode):
+        super(Regression, self).__init__()
+
+        self.input_dim = NUM_CLASSES.get(cl_mode, 49)
+
+        self.layer11 = nn.Linear(self.input_dim, 128)
+        self.layer12 = nn.Linear(128, 128)
+        self.layer13 = nn.Linear(128, 128)
+        self.layer14 = nn.Linear(128, 64)
+        self.layer15 = nn.Linear(64, 1)
+
+    def forward(self, x):
+        x1 = F.leaky_relu(self.layer11(x))
+        x1 = F.leaky_relu(self.layer12(x1))
+        x1 = F.leaky_relu(self.layer13(x1))
+        x1 = F.leaky_relu(self.layer14(x1))
+        x1 = self.layer15(x1)
+
+        return x1
+
+
+class BatchedLinear(nn.Module):
+    '''
+    N개 Model의 nn.Linear를 dim 0 으로 쌓은 Layer, x : (N, batch, in) -> (N, batch, out)
+    weight : (N, in, out) (nn.Linear weight의 transpose), bias : (N, 1, out)
+    '''
+    def __init__(self, n_models, in_features, out_features):
+        super(BatchedLinear, self).__init__()
+
+        self.n_models = n_models
+        self.in_features = in_features
+        self.out_features = out_features
+
+        self.weight = nn.Parameter(torch.empty(n_models, in_features, out_features))
+        self.bias = nn.Parameter(torch.empty(n_models, 1, out_features))
+
+    def reset_parameters(self, i, generator=None):
+        # nn.Linear 기본 초기화와 같은 분포 U(-1/sqrt(in), 1/sqrt(in))
+        bound = 1 / math.sqrt(self.in_features)
+        with torch.no_grad():
+            self.weight[i].uniform_(-bound, bound, generator=generator)
+            self.bias[i].uniform_(-bound, bound, generator=generator)
+
+    def forward(self, x):
+        return torch.baddbmm(self.bias, x, self.weight)
+
+
+class BatchedMLP(nn.Module):
+    '''
+    같은 구조의 MLP N개를 한 번의 batched matmul로 학습/추론
+    Layer 이름은 단일 Model과 같게 두어서 model_state_dict(i)를 단일 Model에 그대로 load 할 수 있음
+    '''
+    def __init__(self, n_models, layer_names, dims, last_activation=True, seeds=None):
+        super(BatchedMLP, self).__init__()
+
+        self.n_models = n_models
+        self.layer_names = layer_names
+        self.last_activation = last_activation
+
+        for name, in_dim, out_dim in zip(layer_names, dims[:-1], dims[1:]):
+            setattr(self, name, BatchedLinear(n_models, in_dim, out_dim))
+
+        if seeds is None:
+            seeds = [None] * n_models
+        for i, seed in enumerate(seeds):
+            generator = None
+            if seed is not None:
+                generator = torch.Generator()
+                generator.manual_seed(seed)
+            for name in self.layer_names:
+                getattr(self, name).reset_parameters(i, generator)
+
+    def forward(self, x):
+        '''x : (N, batch, in) 또는 모든 Model에 같은 입력 (batch, in)'''
+        if x.dim() == 2:
+            x = x.unsqueeze(0).expand(self.n_models, -1, -1)
+
+        for li, name in enumerate(self.layer_names):
+            x = getattr(self, name)(x)
+            if li < len(self.layer_names) - 1 or self.last_activation:
+                x = F.leaky_relu(x)
+
+        return x
+
+    def model_state_dict(self, i, state=None):
+        '''i 번째 Model의 weight를 단일 Model(nn.Linear) state_dict 형식으로 반환'''
+        if state is None:
+            state = self.state_dict()
+
+        single = {}
+        for name in self.layer_names:
+            single[name + '.weight'] = state[name + '.weight'][i].t().contiguous()
+            single[name + '.bias'] = state[name + '.bias'][i, 0].clone()
+        return single
+
+    def load_model_state_dict(self, i, single):
+        with torch.no_grad():
+            for name in self.layer_names:
+                layer = getattr(self, name)
+                layer.weight[i].copy_(single[name + '.weight'].t())
+                layer.bias[i, 0].copy_(single[name + '.bias'])
+
+
+class Batched_Feature_mel_thickness(BatchedMLP):
+    def __init__(self, n_models, input_dim=14, hidden_dim=128, seeds=None):
+        super(Batched_Feature_mel_thickness, self).__init__(
+            n_models, ['common1', 'common2', 'common3', 'common4', 'common5'],
+            [input_dim] + [hidden_dim] * 5, last_activation=True, seeds=seeds)
+
+
+class BatchedClassifier(BatchedMLP):
+    def __init__(self, n_models, cl_mode, input_dim=128, seeds=None):
+        super(BatchedClassifier, self).__init__(
+            n_models, ['layer11', 'layer12', 'layer13', 'layer14', 'layer15'],
+            [input_dim, 128, 128, 128, 128, NUM_CLASSES.get(cl_mode, 49)], last_activation=False, seeds=seeds)
+
+
+class BatchedRegression(BatchedMLP):
+    def __init__(self, n_models, cl_mode, seeds=None):
+        super(BatchedRegression, self).__init__(
+            n_models, ['layer11', 'layer12', 'layer13', 'layer14', 'layer15'],
+            [NUM_CLASSES.get(cl_mode, 49), 128, 128, 128, 64, 1], last_activation=False, seeds=seeds)
+
+
+class FusedStage1(nn.Module):
+    '''
+    같은 입력 (Absorbance 14) 을 쓰는 멜라닌 / 피부두께 (Feature Model -> Classifier) 를 batched matmul 한 번으로 계산
+    마지막 Layer 는 가장 큰 Class 수로 0 padding 하고 출력에서 잘라냄
+    forward(x) : (batch, 14) -> cl_modes 순서대로 logits list [(batch, NUM_CLASSES[cl])]
+    '''
+    def __init__(self, cl_modes=('mel', 'thickness'), input_dim=14, hidden_dim=128):
+        super(FusedStage1, self).__init__()
+
+        self.cl_modes = list(cl_modes)
+        self.num_classes = [NUM_CLASSES.get(cl, 49) for cl in self.cl_modes]
+        self.n_models = len(self.cl_modes)
+
+        dims = [input_dim] + [hidden_dim] * 5 + [128, 128, 128, 128, max(self.num_classes)]
+        self.layers = nn.ModuleList([BatchedLinear(self.n_models, in_dim, out_dim) for in_dim, out_dim in zip(dims[:-1], dims[1:])])
+
+    @classmethod
+    def from_models(cls, prior_models, cl_modes=('mel', 'thickness')):
+        '''prior_models : cl_modes 순서의 [(VitalSign_Feature_mel_thickness, Classifier)]'''
+        feature_model = prior_models[0][0]
+        fused = cls(cl_modes=cl_modes, input_dim=feature_model.input_dim, hidden_dim=feature_model.hidden_dim)
+        fused.load_models(prior_models)
+        return fused.to(feature_model.common1.weight.device)
+
+    def load_models(self, prior_models):
+        with torch.no_grad():
+            for i, (feature_model, classifier_model) in enumerate(prior_models):
+                linears = [getattr(feature_model, 'common{}'.format(li)) for li in range(1, 6)]
+                linears += [getattr(classifier_model, 'layer1{}'.format(li)) for li in range(1, 6)]
+
+                for layer, linear in zip(self.layers, linears):
+                    layer.weight[i].zero_()
+                    layer.bias[i].zero_()
+                    layer.weight[i, :, :linear.out_features].copy_(linear.weight.t())
+                    layer.bias[i, 0, :linear.out_features].copy_(linear.bias)
+
+    def forward(self, x):
+        h = x.unsqueeze(0).expand(self.n_models, -1, -1)
+
+        last = len(self.layers) - 1
+        for li, layer in enumerate(self.layers):
+            h = layer(h)
+            if li != last:
+                h = F.leaky_relu(h)
+
+        return [h[i, :, :n] for i, n in enumerate(self.num_classes)]
@@ -0,0 +1,181 @@
+import copy
+import csv
+import hashlib
+import itertools
+import os
+import time
+import traceback
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import torch
+
+from simulation_corpus import TRAIN_FILE_LIST, TEST_FILE_LIST, cached_corpus
+from train_engine import StagedTrainer, STAGE_CONFIG
+
+'''
+확률기반 Regression Model Hyperparameter Sweep
+Parameter Grid를 펼쳐서 각 조합(trial)을 Process Pool에서 학습하고, 결과를 result/<sweep_name>.csv 로 정리함.
+전처리된 Dataset은 Cache(.npy)로 한 번만 만들고, 모든 Worker가 mmap으로 공유함.
+모든 trial 은 같은 seed 로 학습함 (조합 사이의 차이가 weight 초기화 / batch 순서가 아니라 Parameter 에서만 오도록).
+seed 에 따른 편차를 보려면 grid 에 'seed' 를 넣어서 seed 별 trial 을 따로 만듦.
+'''
+
+# save_dir 이름에 쓰는 Parameter 약어 (기존 result 폴더 이름 규칙 : m1, f128, epoch5000 ...)
+PARAM_SHORT = {
+    'feature.margin': 'm',
+    'feature.hidden_dim': 'f',
+    'feature.epochs': 'epoch',
+    'feature.mining': '',
+    'train_file_list': 'data',
+    'seed': 'seed',
+}
+
+def expand_grid(base_config, grid):
+    '''
+    grid : {'feature.margin': [0.5, 1.0], ...} ('.' 으로 단계 설정 안의 값을 지정, 'train_file_list'는 Dataset 조합,
+           'seed' 는 trial 의 torch seed, 없으면 run_sweep 의 seed)
+    return : [(params, config, train_file_list)]
+    '''
+    keys = list(grid.keys())
+    trials = []
+
+    for values in itertools.product(*[grid[k] for k in keys]):
+        params = dict(zip(keys, values))
+        config = copy.deepcopy(base_config)
+        train_file_list = TRAIN_FILE_LIST
+
+        for key, value in params.items():
+            if key == 'train_file_list':
+                train_file_list = value
+                continue
+            if key == 'seed':
+                continue
+            stage, name = key.split('.')
+            config[stage][name] = value
+
+        trials.append((params, config, train_file_list))
+
+    return trials
+
+
+def trial_name(prefix, params):
+    names = [prefix]
+    for key, value in params.items():
+        if key == 'train_file_list':
+            # 파일 수가 같은 다른 조합도 구분되도록 파일 목록 hash 를 붙임
+            value = '{}-{}'.format(len(value), _cache_name(value))
+        elif isinstance(value, float):
+            value = '{:g}'.format(value).replace('.', '')
+        names.append('{}{}'.format(PARAM_SHORT.get(key, key.split('.')[-1]), value))
+    return '_'.join(names)
+
+
+def _init_worker(num_threads):
+    # Worker 마다 thread 수를 제한해서 Process끼리 CPU를 나누어 씀
+    torch.set_num_threads(num_threads)
+
+
+def _cache_name(file_list):
+    return hashlib.md5('\n'.join(file_list).encode()).hexdigest()[:10]
+
+
+def _load_corpus(cache_dir, train_file_list, test_file_list, input_dir):
+    train_cache = os.path.join(cache_dir, 'train_{}'.format(_cache_name(train_file_list)))
+    val_cache = os.path.join(cache_dir, 'val_{}'.format(_cache_name(test_file_list)))
+
+    return {'train': cached_corpus(train_file_list, train_cache, input_dir),
+            'val': cached_corpus(test_file_list, val_cache, input_dir)}
+
+
+def run_trial(save_dir, config, train_file_list, test_file_list, cache_dir, input_dir, seed):
+    '''Worker에서 한 조합을 학습하고 결과 한 줄(dict)을 반환'''
+    torch.manual_seed(seed)
+    start = time.time()
+
+    row = {'save_dir': save_dir, 'status': 'ok'}
+    try:
+        corpus = _load_corpus(cache_dir, train_file_list, test_file_list, input_dir)
+        # Validation thread 를 만들지 않음 (Worker 당 threads_per_worker 보다 많은 thread 가 CPU 를 나누어 쓰지 않도록)
+        trainer = StagedTrainer(config, save_dir, use_gpu=False, corpus=corpus, async_validation=False)
+        trainer.run()
+
+        for stage, best in trainer.metrics.items():
+            row['{}_loss'.format(stage)] = best['best_loss']
+            row['{}_test_loss'.format(stage)] = best['best_test_loss']
+    except Exception:
+        row['status'] = 'error : ' + traceback.format_exc().splitlines()[-1]
+
+    row['time'] = time.time() - start
+    return row
+
+
+def run_sweep(class_mode, grid, sweep_name, num_workers=4, threads_per_worker=1,
+              test_file_list=TEST_FILE_LIST, input_dir=None, cache_dir=None, seed=0):
+    path = os.path.dirname(os.path.abspath(__file__))
+    if cache_dir is None:
+        cache_dir = os.path.join(path, 'input_data', 'cache')
+    result_csv = os.path.join(path, 'result', '{}.csv'.format(sweep_name))
+
+    trials = expand_grid(STAGE_CONFIG[class_mode], grid)
+
+    # 같은 save_dir 을 쓰는 trial 이 동시에 실행되면 weight / checkpoint 파일을 서로 덮어쓰거나 이어서 학습함
+    save_dirs = [trial_name(sweep_name, params) for params, _, _ in trials]
+    duplicated = sorted({name for name in save_dirs if save_dirs.count(name) > 1})
+    if len(duplicated) > 0:
+        raise ValueError("Sweep trials share save_dir : {}".format(', '.join(duplicated)))
+
+    # Worker 실행 전에 Cache를 만들어 두어서 여러 Worker가 동시에 만들지 않도록 함
+    for train_file_list in {tuple(t[2]) for t in trials}:
+        _load_corpus(cache_dir, list(train_file_list), test_file_list, input_dir)
+
+    print("Sweep {} : {} trials, {} workers x {} threads".format(sweep_name, len(trials), num_workers, threads_per_worker))
+
+    rows = []
+    with ProcessPoolExecutor(max_workers=num_workers, initializer=_init_worker, initargs=(threads_per_worker,)) as executor:
+        futures = {}
+        for (params, config, train_file_list), save_dir in zip(trials, save_dirs):
+            future = executor.submit(run_trial, save_dir, config, train_file_list, test_file_list, cache_dir, input_dir,
+                                     params.get('seed', seed))
+            futures[future] = params
+
+        for future in as_completed(futures):
+            row = dict(futures[future])
+            if 'train_file_list' in row:
+                row['train_file_list'] = '+'.join(row['train_file_list'])
+            row.update(future.result())
+            rows.append(row)
+
+            print("[{}/{}] {} - {} ({:.0f} s)".format(len(rows), len(trials), row['save_dir'], row['status'], row['time']))
+
+    fieldnames = []
+    for row in rows:
+        for key in row:
+            if key not in fieldnames:
+                fieldnames.append(key)
+
+    rows.sort(key=lambda r: r['save_dir'])
+    with open(result_csv, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(rows)
+
+    print("Save Sweep Result : {}".format(result_csv))
+    return rows
+
+
+if __name__ == '__main__':
+    class_mode = "mel"
+    sweep_name = "vitalsign_mel_sweep_margin_width_mining"
+
+    grid = {
+        'feature.margin': [0.5, 1.0],
+        'feature.hidden_dim': [28, 56, 128],
+        'feature.mining': ['random', 'semihard', 'hard'],
+    }
+
+    # CPU core 수 = num_workers * threads_per_worker 가 되도록 설정
+    num_workers = max(1, (os.cpu_count() or 1) // 2)
+    threads_per_worker = 2
+
+    run_sweep(class_mode, grid, sweep_name, num_workers=num_workers, threads_per_worker=threads_per_worker)
@@ -23,6 +23,8 @@ from online_triplet_loss.losses import batch_adapted_triplet_loss
 
 import time
 
+from train_util import set_lr
+
 '''
 멜라닌 추정을 위한 확률기반 Regression Model(Adapted Triplet Loss 방식) 학습
 '''
@@ -152,9 +154,9 @@ if __name__ == '__main__':
 
     for epoch in range(epochs):
         if epoch == 2000:
-            optimizer = optim.Adam(feature_model.parameters(), lr=0.0005)
+            set_lr(optimizer, 0.0005)
         if epoch == 4000:
-            optimizer = optim.Adam(feature_model.parameters(), lr=0.0001)
+            set_lr(optimizer, 0.0001)
 
         running_loss = []
         running_test_loss = []
@@ -243,9 +245,9 @@ if __name__ == '__main__':
 
     for epoch in range(epochs):
         if epoch == 1000:
-            optimizer = optim.Adam(classifier_model.parameters(), lr=0.0005)
+            set_lr(optimizer, 0.0005)
         elif epoch == 2000:
-            optimizer = optim.Adam(classifier_model.parameters(), lr=0.0001)
+            set_lr(optimizer, 0.0001)
 
         running_loss = []
         for anchor, m_label, m_label2, m_label3, tb_label, st_label, th_label, _, th_label3, total_label in data_loader:
@@ -355,9 +357,9 @@ if __name__ == '__main__':
 
     for epoch in range(epochs):
         if epoch == 500:
-            optimizer = optim.Adam(Reg_model.parameters(), lr=0.0005)
+            set_lr(optimizer, 0.0005)
         elif epoch == 800:
-            optimizer = optim.Adam(Reg_model.parameters(), lr=0.0001)
+            set_lr(optimizer, 0.0001)
 
         running_loss = []
         for anchor, m_label, tb_label, st_label, th_label, _, _, _, _ in data_loader:
@@ -0,0 +1,28 @@
+from batched_engine import BatchedStagedTrainer
+from train_engine import STAGE_CONFIG
+
+'''
+멜라닌 추정 Model 여러 개(seed, margin, lr 변형)를 한 번에 학습
+각 Model의 weight는 result/<save_dir>/model<i>/ 에 vitalsign_train_model2_mel.py 와 같은 이름으로 저장됨
+'''
+
+if __name__ == '__main__':
+    use_gpu = True
+    class_mode = "mel"
+
+    save_dir = "vitalsign_mel_prob_02_input14_batched"
+
+    variants = [
+        {'seed': 0, 'margin': 1.0},
+        {'seed': 1, 'margin': 1.0},
+        {'seed': 2, 'margin': 0.5},
+        {'seed': 3, 'margin': 0.5},
+        {'seed': 4, 'margin': 1.0, 'lr_scale': 0.5},
+        {'seed': 5, 'margin': 1.0, 'lr_scale': 2.0},
+    ]
+
+    # 중단된 학습은 result/<save_dir>/checkpoint_* 부터 이어서 진행, 처음부터 다시 학습하려면 False
+    resume = True
+
+    trainer = BatchedStagedTrainer(STAGE_CONFIG[class_mode], save_dir, variants, use_gpu=use_gpu, resume=resume)
+    trainer.run()
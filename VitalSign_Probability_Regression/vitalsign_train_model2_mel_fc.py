@@ -15,6 +15,8 @@ from dataset2 import ViatalSignDataset_regression_mel_thickness
 from sklearn.manifold import TSNE
 from sklearn.metrics import confusion_matrix
 
+from train_util import set_lr
+
 '''
 멜라닌 추정을 위한 Fully Connected 기반 Regression Model 학습
 '''
@@ -94,9 +96,9 @@ if __name__ == '__main__':
 
     for epoch in range(epochs):
         if epoch == 500:
-            optimizer = optim.Adam(Reg_model.parameters(), lr=0.0005)
+            set_lr(optimizer, 0.0005)
         elif epoch == 800:
-            optimizer = optim.Adam(Reg_model.parameters(), lr=0.0001)
+            set_lr(optimizer, 0.0001)
 
         running_loss = []
         # for anchor, m_label, tb_label, st_label, th_label in data_loader:
@@ -23,6 +23,8 @@ from online_triplet_loss.losses import batch_hard_semi_adapted_triplet_loss
 from online_triplet_loss.losses import batch_allpos_semi_triplet_loss
 from online_triplet_loss.losses import batch_all_triplet_loss
 
+from train_util import set_lr
+
 '''
 멜라닌 추정을 위한 확률기반 Regression Model(Online Triplet Loss 방식) 학습
 '''
@@ -155,15 +157,15 @@ if __name__ == '__main__':
 
     for epoch in range(10000, epochs):
         if epoch == 2000:
-            optimizer = optim.Adam(feature_model.parameters(), lr=0.0005)
+            set_lr(optimizer, 0.0005)
         if epoch == 4000:
-            optimizer = optim.Adam(feature_model.parameters(), lr=0.0003)
+            set_lr(optimizer, 0.0003)
         if epoch == 6000:
-            optimizer = optim.Adam(feature_model.parameters(), lr=0.0001)
+            set_lr(optimizer, 0.0001)
         if epoch == 10000:
-            optimizer = optim.Adam(feature_model.parameters(), lr=0.00005)
+            set_lr(optimizer, 0.00005)
         if epoch == 15000:
-            optimizer = optim.Adam(feature_model.parameters(), lr=0.00001)
+            set_lr(optimizer, 0.00001)
 
         running_loss = []
         running_test_loss = []
@@ -259,9 +261,9 @@ if __name__ == '__main__':
 
     for epoch in range(epochs):
         if epoch == 1000:
-            optimizer = optim.Adam(classifier_model.parameters(), lr=0.0005)
+            set_lr(optimizer, 0.0005)
         elif epoch == 2000:
-            optimizer = optim.Adam(classifier_model.parameters(), lr=0.0001)
+            set_lr(optimizer, 0.0001)
 
         running_loss = []
         for anchor, m_label, m_label2, m_label3, tb_label, st_label, th_label, _, th_label3, total_label in data_loader:
@@ -370,9 +372,9 @@ if __name__ == '__main__':
 
     for epoch in range(epochs):
         if epoch == 500:
-            optimizer = optim.Adam(Reg_model.parameters(), lr=0.0005)
+            set_lr(optimizer, 0.0005)
         elif epoch == 800:
-            optimizer = optim.Adam(Reg_model.parameters(), lr=0.0001)
+            set_lr(optimizer, 0.0001)
 
         running_loss = []
 
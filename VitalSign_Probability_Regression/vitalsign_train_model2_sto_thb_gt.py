@@ -17,6 +17,8 @@ from dataset2 import ViatalSignDataset_regression
 from sklearn.manifold import TSNE
 from sklearn.metrics import confusion_matrix
 
+from train_util import set_lr
+
 class VitalSign_Feature(nn.Module):
     def __init__(self):
         super(VitalSign_Feature, self).__init__()
@@ -243,9 +245,9 @@ if __name__ == '__main__':
 
     for epoch in range(epochs):
         if epoch == 1000:
-            optimizer = optim.Adam(classifier_model.parameters(), lr=0.0005)
+            set_lr(optimizer, 0.0005)
         elif epoch == 2000:
-            optimizer = optim.Adam(classifier_model.parameters(), lr=0.0001)
+            set_lr(optimizer, 0.0001)
 
         running_loss = []
         for anchor, m_label, tb_label, tb_label3, st_label, st_label3, th_label, total_label, total_label3 in data_loader:
@@ -351,9 +353,9 @@ if __name__ == '__main__':
 
     for epoch in range(epochs):
         if epoch == 500:
-            optimizer = optim.Adam(Reg_model.parameters(), lr=0.0005)
+            set_lr(optimizer, 0.0005)
         elif epoch == 800:
-            optimizer = optim.Adam(Reg_model.parameters(), lr=0.0001)
+            set_lr(optimizer, 0.0001)
 
         running_loss = []
         # for anchor, m_label, tb_label, st_label, th_label in data_loader:
@@ -434,9 +436,9 @@ if __name__ == '__main__':
 
     for epoch in range(epochs):
         if epoch == 500:
-            optimizer = optim.Adam(Reg_model2.parameters(), lr=0.0005)
+            set_lr(optimizer, 0.0005)
         elif epoch == 800:
-            optimizer = optim.Adam(Reg_model2.parameters(), lr=0.0001)
+            set_lr(optimizer, 0.0001)
 
         running_loss = []
         # for anchor, m_label, tb_label, st_label, th_label in data_loader:
@@ -17,6 +17,8 @@ from dataset2 import ViatalSignDataset_regression
 from sklearn.manifold import TSNE
 from sklearn.metrics import confusion_matrix
 
+from train_util import set_lr
+
 '''
 Sto, Thb 추정을 위한 Fully Connected 기반 Regression Model 학습
 '''
@@ -95,9 +97,9 @@ if __name__ == '__main__':
 
     for epoch in range(epochs):
         if epoch == 500:
-            optimizer = optim.Adam(Reg_model.parameters(), lr=0.0005)
+            set_lr(optimizer, 0.0005)
         elif epoch == 800:
-            optimizer = optim.Adam(Reg_model.parameters(), lr=0.0001)
+            set_lr(optimizer, 0.0001)
 
         running_loss = []
         # for anchor, m_label, tb_label, st_label, th_label in data_loader:
@@ -167,9 +169,9 @@ if __name__ == '__main__':
 
     for epoch in range(epochs):
         if epoch == 500:
-            optimizer = optim.Adam(Reg_model2.parameters(), lr=0.0005)
+            set_lr(optimizer, 0.0005)
         elif epoch == 800:
-            optimizer = optim.Adam(Reg_model2.parameters(), lr=0.0001)
+            set_lr(optimizer, 0.0001)
 
         running_loss = []
         # for anchor, m_label, tb_label, st_label, th_label in data_loader:
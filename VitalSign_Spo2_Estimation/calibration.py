@@ -0,0 +1,83 @@
+import json
+import numpy as np
+import os
+
+'''
+카메라 / ROI 별 band Calibration (반사율 x -> gain * x + offset)
+Session 폴더의 calibration.json 에 저장하고, cube 를 다시 저장하지 않고 읽을 때 적용함.
+Calibration 이 band 별 선형변환이므로 ROI 영역 평균을 먼저 구하고 (frame, band) 에 한 번에 적용해도
+Calibration 한 cube 의 평균 (예전 *_cali.npy) 과 같은 값이 됨.
+
+calibration.json : {'camera': 카메라 이름, 'roi': {roi: {'gain': [band 별], 'offset': [band 별]}}}
+'''
+
+CALIBRATION_FILE = 'calibration.json'
+
+
+class CalibrationProfile(object):
+    '''
+    ROI 하나의 band 별 gain, offset
+    gain / offset 길이보다 band 가 많으면 나머지 band 는 gain 1, offset 0
+    '''
+    def __init__(self, gain=None, offset=None):
+        self.gain = np.asarray(gain if gain is not None else [], dtype=np.float64)
+        self.offset = np.asarray(offset if offset is not None else [], dtype=np.float64)
+
+    @classmethod
+    def from_band_gain(cls, band_gain, n_band=14):
+        '''{band index: gain} -> profile (예 : {10: 1.28, 11: 1.28, 12: 1.28, 13: 1.28})'''
+        gain = np.ones(n_band)
+        for band, value in band_gain.items():
+            gain[band] = value
+        return cls(gain, np.zeros(n_band))
+
+    def vectors(self, n_band):
+        '''(n_band,) gain, offset'''
+        gain = np.ones(n_band)
+        offset = np.zeros(n_band)
+        n = min(n_band, len(self.gain))
+        gain[:n] = self.gain[:n]
+        n = min(n_band, len(self.offset))
+        offset[:n] = self.offset[:n]
+        return gain, offset
+
+    def apply(self, x, axis=-1):
+        '''x 의 axis (band 축) 에 gain, offset 적용 (새 배열)'''
+        x = np.asarray(x)
+        gain, offset = self.vectors(x.shape[axis])
+
+        shape = [1] * x.ndim
+        shape[axis] = -1
+        return x * gain.reshape(shape) + offset.reshape(shape)
+
+    def to_dict(self):
+        return {'gain': self.gain.tolist(), 'offset': self.offset.tolist()}
+
+
+def load_calibration(session_dir):
+    '''return : (camera 이름, {roi: CalibrationProfile}), calibration.json 이 없으면 (None, {})'''
+    file_path = os.path.join(session_dir, CALIBRATION_FILE)
+    if os.path.isfile(file_path) == False:
+        return None, {}
+
+    with open(file_path, encoding='utf-8') as f:
+        data = json.load(f)
+
+    profiles = {roi: CalibrationProfile(p.get('gain'), p.get('offset')) for roi, p in data.get('roi', {}).items()}
+    return data.get('camera'), profiles
+
+
+def save_calibration(session_dir, profiles, camera=None):
+    data = {'camera': camera, 'roi': {roi: p.to_dict() for roi, p in profiles.items()}}
+    with open(os.path.join(session_dir, CALIBRATION_FILE), 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=1)
+
+
+def calibration_vectors(profiles, roi_list, n_band=14):
+    '''여러 ROI 를 한 번에 적용하기 위한 (n_roi, n_band) gain, offset (profile 이 없는 ROI 는 그대로)'''
+    gain = np.ones((len(roi_list), n_band))
+    offset = np.zeros((len(roi_list), n_band))
+    for i, roi in enumerate(roi_list):
+        if roi in profiles:
+            gain[i], offset[i] = profiles[roi].vectors(n_band)
+    return gain, offset
@@ -0,0 +1,151 @@
+import csv
+import numpy as np
+import os
+import time
+import traceback
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import torch
+import torch.multiprocessing as mp
+import torch.nn as nn
+
+from lstm_trainer import train_spo2_lstm, LSTM_TRAIN_CONFIG
+from session_reader import load_session_corpus, sequence_end_index, SequenceLoader
+from spo2_model import VitalSign_Spo2
+
+'''
+Dataset1 Leave-one-subject-out Cross validation
+모든 Session을 한 번만 전처리하고(session_reader), 각 Fold는 Train/Test Sequence index 로만 구성해서
+Fold 별 학습을 여러 Process에서 동시에 진행함. 결과는 result/<save_dir>/crossvalidation.csv 에 정리함.
+'''
+
+# dataset1 Cross validation 실험자 (result/*_crossvali 의 weight_data*_<이름>)
+SUBJECT_LIST = ['1_ar', '3_js', '5_js', 'aron', 'hw', 'ij', 'jh', 'olfa', 'sh', 'sj', 'vania', 'yj']
+
+
+def fold_sessions(sessions, test_name):
+    '''dataset1 과 같이 Session 이름에 test_name 이 포함되면 Test, 나머지는 Train'''
+    test_sessions = [s for s in sessions if s.__contains__(test_name)]
+    train_sessions = [s for s in sessions if s.__contains__(test_name) == False]
+    return train_sessions, test_sessions
+
+
+def spo2_error(pred_spo2, spo2_data):
+    '''
+    vitalsign_test_predict_Spo2_from_LSTM1_crossvalidation.py 와 같은 계산
+    mse : nn.MSELoss (검증 Script에서 'RMSE'로 출력하던 값), rmse : sqrt(mse),
+    std : |error| 의 mse 기준 Standard variation
+    '''
+    abs_error = torch.abs(pred_spo2 - spo2_data)
+    mse = torch.mean(abs_error ** 2).item()
+    std = np.sqrt(torch.mean((abs_error - mse) ** 2).item())
+    return {'mse': mse, 'rmse': float(np.sqrt(mse)), 'std': float(std)}
+
+
+def _init_worker(num_threads):
+    torch.set_num_threads(num_threads)
+
+
+def run_fold(test_name, corpus, config, save_dir, seq_len=100, hidden_size=30, use_mel_thick=True, use_gpu=False, resume=True):
+    '''Fold 하나를 학습하고 weight_data2 로 Test data 오차를 계산'''
+    device = 'cuda' if use_gpu else 'cpu'
+    start = time.time()
+
+    row = {'test_name': test_name, 'status': 'ok'}
+    try:
+        train_sessions, test_sessions = fold_sessions(corpus['sessions'], test_name)
+        if len(test_sessions) == 0:
+            raise ValueError("no session matches test_name {}".format(test_name))
+
+        data_loader = SequenceLoader(corpus, sequence_end_index(corpus, train_sessions, seq_len), seq_len, batch_size=3000, device=device)
+        test_data_loader = SequenceLoader(corpus, sequence_end_index(corpus, test_sessions, seq_len), seq_len, batch_size=None, device=device)
+
+        feature_size = corpus['concat'].shape[1] if use_mel_thick else corpus['absorbance'].shape[1]
+        spo2_model = VitalSign_Spo2(feature_size=feature_size, hidden_size=hidden_size, seq_len=seq_len).to(device)
+
+        lstm_path1 = os.path.join(save_dir, 'weight_data1_{}'.format(test_name))
+        lstm_path2 = os.path.join(save_dir, 'weight_data2_{}'.format(test_name))
+
+        train_spo2_lstm(spo2_model, data_loader, test_data_loader, config, lstm_path1, lstm_path2, use_mel_thick=use_mel_thick, resume=resume)
+
+        if os.path.isfile(lstm_path2):
+            spo2_model.load_state_dict(torch.load(lstm_path2, map_location=device))
+
+        spo2_model.eval()
+        with torch.no_grad():
+            for batch_t in test_data_loader:
+                input_t = batch_t[1] if use_mel_thick else batch_t[0]
+                pred_spo2_t = torch.squeeze(spo2_model(input_t), dim=1)
+                row.update(spo2_error(pred_spo2_t, batch_t[4][:, -1]))
+        row['num_test'] = len(test_data_loader.end_index)
+    except Exception:
+        row['status'] = 'error : ' + traceback.format_exc().splitlines()[-1]
+
+    row['time'] = time.time() - start
+    return row
+
+
+def run_crossvalidation(save_dir, test_name_list=SUBJECT_LIST, roi='forehead', config=LSTM_TRAIN_CONFIG['dataset1_crossvalidation'],
+                        seq_len=100, hidden_size=30, use_mel_thick=True, use_gpu=False, resume=True,
+                        num_workers=4, threads_per_worker=1, data_dir=None):
+    '''
+    save_dir : result/ 아래 폴더 이름 (또는 절대 경로)
+    return : Fold 별 결과 list (test_name, mse, rmse, std, ...)
+    '''
+    path = os.path.dirname(os.path.abspath(__file__))
+    result_dir = os.path.join(path, 'result', save_dir)
+    if os.path.isdir(result_dir) == False:
+        os.makedirs(result_dir)
+
+    # 부모 Process 는 CUDA 를 쓰지 않음 (spawn worker 로 CUDA Tensor 를 넘기면 CUDA IPC 가 필요함)
+    corpus = load_session_corpus(roi, data_dir=data_dir, device='cpu')
+
+    # Worker 들은 Shared memory 로 같은 CPU corpus Tensor를 사용하고, batch 만 각자 device 로 옮김 (SequenceLoader)
+    for name in ('absorbance', 'concat', 'reflect', 'ppg', 'spo2', 'pulse'):
+        corpus[name].share_memory_()
+
+    print("Cross validation {} : {} folds, {} workers x {} threads".format(save_dir, len(test_name_list), num_workers, threads_per_worker))
+
+    rows = []
+    ctx = mp.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=num_workers, mp_context=ctx, initializer=_init_worker, initargs=(threads_per_worker,)) as executor:
+        futures = [executor.submit(run_fold, tn, corpus, config, result_dir, seq_len, hidden_size, use_mel_thick, use_gpu, resume)
+                   for tn in test_name_list]
+
+        for future in as_completed(futures):
+            row = future.result()
+            rows.append(row)
+
+            if row['status'] == 'ok':
+                print("[{}/{}] Test {} RMSE : {:.4f} , Standard variation : {:.4f} ({:.0f} s)".format(
+                    len(rows), len(test_name_list), row['test_name'], row['rmse'], row['std'], row['time']))
+            else:
+                print("[{}/{}] Test {} - {}".format(len(rows), len(test_name_list), row['test_name'], row['status']))
+
+    rows.sort(key=lambda r: test_name_list.index(r['test_name']))
+
+    ok_rows = [r for r in rows if r['status'] == 'ok']
+    if len(ok_rows) > 0:
+        summary = {'test_name': 'mean', 'status': 'ok'}
+        for key in ('mse', 'rmse', 'std', 'time'):
+            summary[key] = float(np.mean([r[key] for r in ok_rows]))
+        summary['num_test'] = int(np.sum([r['num_test'] for r in ok_rows]))
+        rows.append(summary)
+
+        print("Cross validation RMSE mean : {:.4f} , Standard variation mean : {:.4f}".format(summary['rmse'], summary['std']))
+
+    fieldnames = []
+    for row in rows:
+        for key in row:
+            if key not in fieldnames:
+                fieldnames.append(key)
+
+    result_csv = os.path.join(result_dir, 'crossvalidation.csv')
+    with open(result_csv, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(rows)
+
+    print("Save Cross validation Result : {}".format(result_csv))
+    return rows
@@ -0,0 +1,278 @@
+import json
+import numpy as np
+import os
+import zlib
+
+'''
+Hyperspectral ROI cube (re_*_human.npy, *_cali.npy) 용 chunk 저장 형식
+np.save 한 object array 는 mmap 이 안 되고, 일부 구간 / band 만 필요해도 전체 cube 를 읽어야 함.
+<name>.cube/ 폴더에 시간 축으로 chunk_len frame 씩 나누어 저장함.
+  - manifest.json : shape (frame, band, h, w), dtype (float32 / float16), chunk 목록, chunk 별 통계 (min, max, mean)
+  - chunk_00000.npy ... : 압축하지 않으면 np.save (mmap 으로 필요한 frame / band 만 읽음)
+  - chunk_00000.zlib ... : 압축하면 byte shuffle + zlib (무손실, chunk 단위로 풀어서 읽음)
+  - roi_mean.npy : (frame, band) ROI 영역 평균, 저장 dtype 으로 바꾸기 전 float64 값으로 미리 계산
+'''
+
+CUBE_SUFFIX = '.cube'
+MANIFEST_FILE = 'manifest.json'
+ROI_MEAN_FILE = 'roi_mean.npy'
+
+
+def cube_dir(npy_path):
+    '''re_forehead_human.npy -> re_forehead_human.cube'''
+    return os.path.splitext(npy_path)[0] + CUBE_SUFFIX
+
+
+def _shuffle_bytes(x):
+    # 같은 자리 byte 끼리 모으면 (float 지수부 등) zlib 압축률이 좋아짐
+    raw = np.frombuffer(np.ascontiguousarray(x).tobytes(), dtype=np.uint8)
+    return raw.reshape(-1, x.dtype.itemsize).T.tobytes()
+
+
+def _unshuffle_bytes(buf, dtype, shape):
+    dtype = np.dtype(dtype)
+    raw = np.frombuffer(buf, dtype=np.uint8).reshape(dtype.itemsize, -1).T
+    return np.ascontiguousarray(raw).view(dtype).reshape(shape)
+
+
+class CubeWriter(object):
+    '''
+    frame 을 순서대로 append 해서 chunk 단위로 저장 (전체 cube 를 메모리에 올리지 않음)
+    dtype : 저장 dtype (float32, float16), compress : zlib 압축 여부, level : zlib 압축 단계
+    '''
+    def __init__(self, path, dtype='float32', chunk_len=300, compress=True, level=1):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.chunk_len = chunk_len
+        self.compress = compress
+        self.level = level
+
+        os.makedirs(path, exist_ok=True)
+        self.frame_shape = None
+        self.pending = []
+        self.chunks = []
+        self.roi_mean = []
+        self.n_frames = 0
+
+    def append(self, frames):
+        '''frames : (n, band, h, w) 또는 frame 의 list / object array'''
+        for frame in frames:
+            frame = np.asarray(frame, dtype=np.float64)
+            if self.frame_shape is None:
+                self.frame_shape = frame.shape
+            elif frame.shape != self.frame_shape:
+                raise ValueError("Frame shape {} differs from {}".format(frame.shape, self.frame_shape))
+
+            self.pending.append(frame)
+            if len(self.pending) == self.chunk_len:
+                self._flush()
+
+    def _flush(self):
+        if len(self.pending) == 0:
+            return
+
+        block = np.stack(self.pending)
+        self.pending = []
+        self.roi_mean.append(block.reshape(block.shape[:2] + (-1,)).mean(axis=2))
+
+        data = block.astype(self.dtype)
+        index = len(self.chunks)
+        if self.compress == True:
+            file_name = 'chunk_{:05d}.zlib'.format(index)
+            with open(os.path.join(self.path, file_name), 'wb') as f:
+                f.write(zlib.compress(_shuffle_bytes(data), self.level))
+        else:
+            file_name = 'chunk_{:05d}.npy'.format(index)
+            np.save(os.path.join(self.path, file_name), data)
+
+        self.chunks.append({
+            'file': file_name,
+            'start': self.n_frames,
+            'stop': self.n_frames + len(data),
+            'min': float(block.min()),
+            'max': float(block.max()),
+            'mean': float(block.mean()),
+        })
+        self.n_frames += len(data)
+
+    def close(self):
+        '''남은 frame 을 저장하고 manifest 를 씀, return : CubeStore'''
+        self._flush()
+        if self.frame_shape is None:
+            raise ValueError("No frame was written to {}".format(self.path))
+
+        np.save(os.path.join(self.path, ROI_MEAN_FILE), np.concatenate(self.roi_mean, axis=0))
+
+        manifest = {
+            'shape': [self.n_frames] + list(self.frame_shape),
+            'dtype': self.dtype.name,
+            'chunk_len': self.chunk_len,
+            'compression': 'zlib_shuffle' if self.compress == True else None,
+            'chunks': self.chunks,
+        }
+        with open(os.path.join(self.path, MANIFEST_FILE), 'w') as f:
+            json.dump(manifest, f, indent=1)
+
+        return CubeStore(self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+
+
+def write_cube(frames, path, dtype='float32', chunk_len=300, compress=True, level=1):
+    writer = CubeWriter(path, dtype, chunk_len, compress, level)
+    writer.append(frames)
+    return writer.close()
+
+
+def convert_cube(npy_path, out_path=None, dtype='float32', chunk_len=300, compress=True, level=1):
+    '''np.save 로 저장한 cube (object array 포함) 를 chunk 형식으로 변환'''
+    if out_path is None:
+        out_path = cube_dir(npy_path)
+
+    try:
+        raw_data = np.load(npy_path, mmap_mode='r')
+    except ValueError:
+        raw_data = np.load(npy_path, allow_pickle=True)
+
+    return write_cube(raw_data, out_path, dtype, chunk_len, compress, level)
+
+
+class CubeStore(object):
+    '''
+    chunk 형식 cube Reader, 필요한 chunk 만 읽음
+    store[i] : frame 하나 (band, h, w), store[a:b] / read(start, stop, bands) : (n, band, h, w)
+    cache_chunks : 압축 chunk 를 풀어서 가지고 있을 개수 (frame 을 순서대로 읽을 때 같은 chunk 를 다시 풀지 않음)
+    '''
+    def __init__(self, path, cache_chunks=2):
+        self.path = path
+        with open(os.path.join(path, MANIFEST_FILE)) as f:
+            self.manifest = json.load(f)
+
+        self.shape = tuple(self.manifest['shape'])
+        self.dtype = np.dtype(self.manifest['dtype'])
+        self.chunks = self.manifest['chunks']
+        self.chunk_start = np.array([c['start'] for c in self.chunks] + [self.shape[0]])
+
+        self.cache_chunks = cache_chunks
+        self.cache = {}
+
+    def __len__(self):
+        return self.shape[0]
+
+    def _chunk(self, index):
+        if index in self.cache:
+            return self.cache[index]
+
+        chunk = self.chunks[index]
+        file_path = os.path.join(self.path, chunk['file'])
+        shape = (chunk['stop'] - chunk['start'],) + self.shape[1:]
+
+        if self.manifest['compression'] is None:
+            # mmap 은 풀 필요가 없으므로 cache 하지 않음
+            return np.load(file_path, mmap_mode='r')
+
+        with open(file_path, 'rb') as f:
+            data = _unshuffle_bytes(zlib.decompress(f.read()), self.dtype, shape)
+
+        if len(self.cache) >= self.cache_chunks:
+            self.cache.pop(next(iter(self.cache)))
+        self.cache[index] = data
+        return data
+
+    def read(self, start=0, stop=None, bands=None):
+        '''start ~ stop frame, bands (slice 또는 index list) 만 (n, band, h, w) 로 반환'''
+        if stop is None:
+            stop = len(self)
+        start, stop = max(start, 0), min(stop, len(self))
+        if bands is None:
+            bands = slice(None)
+
+        if stop <= start:
+            return np.zeros((0,) + self.shape[1:], dtype=self.dtype)[:, bands]
+
+        first = int(np.searchsorted(self.chunk_start, start, side='right')) - 1
+        last = int(np.searchsorted(self.chunk_start, stop, side='left'))
+
+        parts = []
+        for ci in range(first, last):
+            c0 = self.chunk_start[ci]
+            data = self._chunk(ci)
+            parts.append(data[max(start - c0, 0):stop - c0, bands])
+
+        if len(parts) == 1:
+            return np.array(parts[0])
+        return np.concatenate(parts, axis=0)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(len(self))
+            return self.read(start, stop)[::step]
+
+        key = int(key)
+        if key < 0:
+            key += len(self)
+        if key < 0 or key >= len(self):
+            raise IndexError("Frame {} out of range ({})".format(key, len(self)))
+        return self.read(key, key + 1)[0]
+
+    def roi_mean(self, start=0, stop=None, bands=None):
+        '''미리 계산한 ROI 영역 평균 (n, band), chunk 를 풀지 않음'''
+        mean = np.load(os.path.join(self.path, ROI_MEAN_FILE), mmap_mode='r')
+        if bands is None:
+            bands = slice(None)
+        return np.array(mean[start:stop, bands])
+
+    def chunk_stats(self):
+        '''chunk 별 {'start', 'stop', 'min', 'max', 'mean'} list'''
+        return [{k: c[k] for k in ('start', 'stop', 'min', 'max', 'mean')} for c in self.chunks]
+
+
+def open_cube(npy_path):
+    '''변환한 <name>.cube 가 있으면 CubeStore, 없으면 np.load 결과 (object array 는 frame 배열로 합침)'''
+    if os.path.isfile(os.path.join(cube_dir(npy_path), MANIFEST_FILE)):
+        return CubeStore(cube_dir(npy_path))
+
+    try:
+        return np.load(npy_path, mmap_mode='r')
+    except ValueError:
+        raw_data = np.load(npy_path, allow_pickle=True)
+        if raw_data.dtype == object:
+            raw_data = np.stack(raw_data)
+        return raw_data
+
+
+def cube_roi_mean(cube, n_band=14):
+    '''open_cube 결과 -> (frame, n_band) ROI 영역 평균'''
+    # CubeStore, VirtualCube 는 roi_mean 을 가지고 있음
+    if hasattr(cube, 'roi_mean'):
+        return cube.roi_mean(bands=slice(0, n_band))
+    return np.reshape(cube[:, :n_band], (len(cube), n_band, -1)).mean(axis=2)
+
+
+if __name__ == '__main__':
+    # session_reader 가 open_cube 를 쓰므로 변환 script 에서만 import
+    from session_reader import ROI_FILE, default_data_dir, session_names
+
+    # 저장 dtype (float16 은 크기가 절반, 반사율 상대오차 약 5e-4), 압축 여부
+    dtype = 'float32'
+    chunk_len = 300
+    compress = True
+
+    data_dir = default_data_dir()
+
+    for session in session_names(data_dir):
+        for roi, file_name in ROI_FILE.items():
+            npy_path = os.path.join(data_dir, session, file_name)
+            if os.path.isfile(npy_path) == False:
+                continue
+
+            store = convert_cube(npy_path, dtype=dtype, chunk_len=chunk_len, compress=compress)
+
+            src_size = os.path.getsize(npy_path)
+            dst_size = sum(os.path.getsize(os.path.join(store.path, f)) for f in os.listdir(store.path))
+            print("{} {} : {} frames , {:.1f} MB -> {:.1f} MB".format(session, roi, len(store), src_size / 2 ** 20, dst_size / 2 ** 20))
@@ -11,24 +11,12 @@ import torch.nn as nn
 import torch.nn.functional as F
 import csv
 
-from scipy.signal import butter, lfilter
-from scipy import fftpack
 from scipy import interpolate
 
-import copy
-
-
-def butter_bandpass(lowcut, highcut, fs, order=5):
-    nyq = 0.5 * fs
-    low = lowcut / nyq
-    high = highcut / nyq
-    b, a = butter(order, [low, high], btype='band')
-    return b, a
-
-def butter_bandpass_filter(data, lowcut, highcut, fs, order=5):
-    b, a = butter_bandpass(lowcut, highcut, fs, order=order)
-    y = lfilter(b, a, data)
-    return y
+from cube_store import open_cube
+from signal_filter import sliding_pulse_spectrum
+from virtual_session import is_virtual_session, VirtualSession
+from shared_data import shared_tensor, SequenceWindows
 
 
 def calculate_k(x, y, z):
@@ -145,6 +133,11 @@ class Regression(nn.Module):
 def read_measurement_elapsed_time(file_name):
     path = os.path.dirname(__file__)
 
+    # 가상 Session (session.json) 은 segment 측정 시간을 이어 붙임
+    session_dir = path + '/check_data/total_data1/{}'.format(file_name)
+    if is_virtual_session(session_dir):
+        return VirtualSession(session_dir, read_measurement_elapsed_time).measurement_time()
+
     f = open(path + '/check_data/total_data1/{}/time_stamp.csv'.format(file_name), encoding='utf-8')
     rdr = csv.reader(f)
 
@@ -181,6 +174,11 @@ def read_measurement_elapsed_time(file_name):
 def read_pulse_data(file_name):
     path = os.path.dirname(__file__)
 
+    session_dir = path + '/check_data/total_data1/{}'.format(file_name)
+    if is_virtual_session(session_dir):
+        pulse_list = VirtualSession(session_dir, read_measurement_elapsed_time).series(lambda name: read_pulse_data(name)[0], 1)
+        return pulse_list, np.arange(len(pulse_list))
+
     f = open(path + '/check_data/total_data1/{}/pulse_sto.csv'.format(file_name), encoding='utf-8')
     rdr = csv.reader(f)
 
@@ -206,6 +204,11 @@ def read_pulse_data(file_name):
 def read_spo2_data(file_name):
     path = os.path.dirname(__file__)
 
+    session_dir = path + '/check_data/total_data1/{}'.format(file_name)
+    if is_virtual_session(session_dir):
+        spo2_list = VirtualSession(session_dir, read_measurement_elapsed_time).series(lambda name: read_spo2_data(name)[0], 1)
+        return spo2_list, np.arange(len(spo2_list))
+
     f = open(path + '/check_data/total_data1/{}/pulse_sto.csv'.format(file_name), encoding='utf-8')
     rdr = csv.reader(f)
 
@@ -230,6 +233,11 @@ def read_spo2_data(file_name):
 
 def read_ppg_data(file_name):
     path = os.path.dirname(__file__)
+
+    session_dir = path + '/check_data/total_data1/{}'.format(file_name)
+    if is_virtual_session(session_dir):
+        ppg_wave = VirtualSession(session_dir, read_measurement_elapsed_time).series(lambda name: read_ppg_data(name)[0], 60)
+        return ppg_wave, np.arange(len(ppg_wave)) * (1 / 60)
     f = open(path + '/check_data/total_data1/{}/ppg_wave.csv'.format(file_name), encoding='utf-8')
 
     rdr = csv.reader(f)
@@ -254,6 +262,16 @@ def read_ppg_data(file_name):
     return ppg_wave, ppg_time
 
 
+def load_roi_cube(file_name, roi_file):
+    '''Session 의 ROI cube (가상 Session 이면 segment 를 이어 붙인 VirtualCube, 변환한 cube 는 CubeStore)'''
+    path = os.path.dirname(__file__)
+
+    session_dir = path + '/check_data/total_data1/{}'.format(file_name)
+    if is_virtual_session(session_dir):
+        return VirtualSession(session_dir, read_measurement_elapsed_time).cube(lambda name: load_roi_cube(name, roi_file))
+    return open_cube(session_dir + '/' + roi_file)
+
+
 
 class ViatalSignDataset_pulse_fft(data.Dataset):
     def __init__(self, mode='train'):
@@ -295,23 +313,15 @@ class ViatalSignDataset_pulse_fft(data.Dataset):
         for fn in fileNameList:
             print("Filename : ", fn)
             # temp_raw_data = np.load(path + '/check_data/total_data1/{}/re_forehead_human.npy'.format(fn), allow_pickle=True)
-            temp_raw_data = np.load(path + '/check_data/total_data1/{}/re_forehead_human.npy'.format(fn), allow_pickle=True)
+            temp_raw_data = load_roi_cube(fn, 're_forehead_human.npy')
 
-            roi_data = []
-            for i in range(len(temp_raw_data)):
-                temp_data = np.average(temp_raw_data[i][6][:, :])
-                roi_data.append(temp_data)
-
-            roi_data = np.array(roi_data)
+            roi_data = np.array([np.average(frame[6][:, :]) for frame in temp_raw_data])
 
             measure_time = read_measurement_elapsed_time(fn)
-            gt_pulse_list = read_pulse_data(fn)
+            gt_pulse_list, _ = read_pulse_data(fn)
 
             time_window = 10
 
-            temp_input_seq = []
-            temp_gt = []
-
             if name == 'train':
                 time_start_idx = 10
                 time_end_idx = 120
@@ -319,81 +329,16 @@ class ViatalSignDataset_pulse_fft(data.Dataset):
                 time_start_idx = 100
                 time_end_idx = 160
 
-            f_linear = interpolate.interp1d(measure_time[:len(roi_data)], roi_data, kind='linear')
-            # print("CHECK mearue time end : ", measure_time[len(roi_data)])
-
-            check_start_cnt = 0
-
             # Training data use first 2 min
-            # For using bandpass filter, start 10s
-            for ti in range(time_start_idx, time_end_idx-time_window):
-                start_idx = int(np.where(ti <= measure_time)[0][0])
-                end_idx = int(np.where(measure_time <= (ti + time_window))[0][-1])
-
-                # f_linear = interpolate.interp1d(measure_time[start_idx - 400:end_idx + 10],
-                #                                 roi_data[start_idx - 400:end_idx + 10], kind='linear')
-
-                fs = 48
-                sample_tiem = np.arange(ti-6, ti+time_window, (1/48))
-                # print("sample time shape : ", np.shape(sample_tiem))
-                # print("sample time : ", sample_tiem)
-
-                sample_ppg = f_linear(sample_tiem)
-
-                # print("sample ppg shape : ", np.shape(sample_ppg))
-                # print("sample ppg : ", sample_ppg)
-
-                # start_idx = int(np.where(ti <= measure_time)[0][0])
-                # end_idx = int(np.where(measure_time <= (ti + time_window))[0][-1])
-                #
-                # # Calculate Fps
-                # sub_time = []
-                # for i in range(start_idx, end_idx):
-                #     sub_time.append(measure_time[i] - measure_time[i - 1])
-                #
-                # fs = 1 / np.average(sub_time)
-
-                # bp_data = np.copy(roi_data[start_idx - 400:end_idx])
-                bp_data = np.copy(sample_ppg)
-
-                if fs < 10:
-                    fs = 10
-
-                bp_data2 = butter_bandpass_filter(bp_data, 0.5, 3, fs)
-
-                if len(bp_data2) < 400:
-                    bp_data2 = bp_data2
-                else:
-                    # bp_data2 = bp_data2[400:]
-                    bp_data2 = bp_data2[288:]
-
-                sig_fft = fftpack.fft(bp_data2)
-                power = np.abs(sig_fft)
-                sample_freq = fftpack.fftfreq(len(bp_data2), d=(1 / fs))
-                mask = (sample_freq > 0.5) & (sample_freq < 3)
-
-                # temp_power = np.array(power[mask])
-                # max_power = np.round(np.max(temp_power), 3)
-                # max_arg = np.argmax(temp_power)
-                # max_freq = np.round(sample_freq[mask][max_arg], 3)
-
-                # print("CHECK len power ", len(power[mask]))
-                # print("CHECK sample_freq ", sample_freq[mask])
-                # input power shape (25,)
-                # if len(power[mask]) != 24:
-                #     temp_input_seq.append(temp_input_seq[-1])
-                # else:
-                temp_input_seq.append(power[mask])
-
-                # temp_input_seq.append([max_freq])
-                temp_gt.append(gt_pulse_list[ti + time_window])
-
-                check_start_cnt = check_start_cnt+1
-
-                if check_start_cnt > 5:
-                    input_data.append(copy.deepcopy(temp_input_seq))
-                    gt_data.append(copy.deepcopy(temp_gt))
+            # For using bandpass filter, start 10s (window 앞 6초는 filter 안정화 구간)
+            # input power shape (n_window, 24)
+            temp_input_seq = sliding_pulse_spectrum(measure_time, roi_data, time_start_idx, time_end_idx, time_window)
+            temp_gt = gt_pulse_list[np.arange(time_start_idx, time_end_idx - time_window) + time_window]
 
+            # 6번째 window 부터 처음 ~ 현재 window 까지를 Sequence 로 사용 (복사하지 않고 view)
+            for check_start_cnt in range(6, len(temp_input_seq) + 1):
+                input_data.append(temp_input_seq[:check_start_cnt])
+                gt_data.append(temp_gt[:check_start_cnt])
 
         # input_data = np.array(input_data, dtype=np.float32)
         # gt_data = np.array(gt_data, dtype=np.float32)
@@ -405,24 +350,26 @@ class ViatalSignDataset_pulse_fft(data.Dataset):
 
 
 class ViatalSignDataset_triplet(data.Dataset):
-    def __init__(self, mode='train', cl='', use_gpu = False):
+    def __init__(self, mode='train', cl='', use_gpu = False, device = None):
         self.mode = mode
         self.cl = cl
         self.use_gpu = use_gpu
+        # 멜라닌, 피부두께 prior Model 을 올릴 device (None 이면 use_gpu 로 정함)
+        self.device = device if device is not None else ('cuda' if use_gpu == True else 'cpu')
 
         if mode == "train":
             reflect_list, ppg_label, spo2_label = self.read_vitalsign_dataset(name='train')
         else:
             reflect_list, ppg_label, spo2_label = self.read_vitalsign_dataset(name='test')
 
-        mel_feature_model = VitalSign_Feature_mel_thickness().to('cuda')
-        thickness_feature_model = VitalSign_Feature_mel_thickness().to('cuda')
+        mel_feature_model = VitalSign_Feature_mel_thickness().to(self.device)
+        thickness_feature_model = VitalSign_Feature_mel_thickness().to(self.device)
 
-        mel_classifier_model = Classifier(cl_mode="mel").to('cuda')
-        thickness_classifier_model = Classifier(cl_mode="thickness").to('cuda')
+        mel_classifier_model = Classifier(cl_mode="mel").to(self.device)
+        thickness_classifier_model = Classifier(cl_mode="thickness").to(self.device)
 
-        mel_regression_model = Regression(cl_mode="mel").to('cuda')
-        thickness_regression_model = Regression(cl_mode="thickness").to('cuda')
+        mel_regression_model = Regression(cl_mode="mel").to(self.device)
+        thickness_regression_model = Regression(cl_mode="thickness").to(self.device)
 
         path = os.path.dirname(__file__)
 
@@ -435,13 +382,13 @@ class ViatalSignDataset_triplet(data.Dataset):
         mel_regression_path = os.path.join(path, './result/Classify_Weight/vitalsign_mel_0104_prob_005_input14_m1_epoch5000_addinput3/regression_weight_data')
         thickness_regression_path = os.path.join(path, './result/Classify_Weight/vitalsign_thickness_0104_prob_005_input14_m1_epoch5000_addinput3/regression_weight_data')
 
-        mel_feature_model.load_state_dict(torch.load(mel_feature_path))
-        mel_classifier_model.load_state_dict(torch.load(mel_classify_path))
-        mel_regression_model.load_state_dict(torch.load(mel_regression_path))
+        mel_feature_model.load_state_dict(torch.load(mel_feature_path, map_location=self.device))
+        mel_classifier_model.load_state_dict(torch.load(mel_classify_path, map_location=self.device))
+        mel_regression_model.load_state_dict(torch.load(mel_regression_path, map_location=self.device))
 
-        thickness_feature_model.load_state_dict(torch.load(thickness_feature_path))
-        thickness_classifier_model.load_state_dict(torch.load(thickness_classify_path))
-        thickness_regression_model.load_state_dict(torch.load(thickness_regression_path))
+        thickness_feature_model.load_state_dict(torch.load(thickness_feature_path, map_location=self.device))
+        thickness_classifier_model.load_state_dict(torch.load(thickness_classify_path, map_location=self.device))
+        thickness_regression_model.load_state_dict(torch.load(thickness_regression_path, map_location=self.device))
 
         mv_window = 30
 
@@ -453,7 +400,7 @@ class ViatalSignDataset_triplet(data.Dataset):
                 mf_reflect_list.append(list(np.average(reflect_list[i - mv_window:i, :], axis=0)))
 
         # mel_x = mel_feature_model(torch.FloatTensor(reflect_list).to('cuda'))
-        mel_x = mel_feature_model(torch.FloatTensor(mf_reflect_list).to('cuda'))
+        mel_x = mel_feature_model(torch.FloatTensor(mf_reflect_list).to(self.device))
         mel_out = mel_classifier_model(mel_x)
         mel_prob = F.softmax(mel_out, dim=1)
 
@@ -491,7 +438,7 @@ class ViatalSignDataset_triplet(data.Dataset):
         mel_prob = mel_prob.detach().cpu().numpy()
 
         # thickness_x = thickness_feature_model(torch.FloatTensor(reflect_list).to('cuda'))
-        thickness_x = thickness_feature_model(torch.FloatTensor(mf_reflect_list).to('cuda'))
+        thickness_x = thickness_feature_model(torch.FloatTensor(mf_reflect_list).to(self.device))
         thickenss_out = thickness_classifier_model(thickness_x)
         thickness_prob = F.softmax(thickenss_out, dim=1)
         thickness_value = thickness_regression_model(thickness_prob)
@@ -579,7 +526,7 @@ class ViatalSignDataset_triplet(data.Dataset):
 
         for fn in fileNameList:
             # temp_raw_data = np.load(path + '/check_data/total_data1/{}/re_forehead_human.npy'.format(fn), allow_pickle=True)
-            temp_raw_data = np.load(path + '/check_data/total_data1/{}/re_under_nose_human.npy'.format(fn), allow_pickle=True)
+            temp_raw_data = load_roi_cube(fn, 're_under_nose_human.npy')
             measure_time = read_measurement_elapsed_time(fn)
             gt_ppg, gt_ppg_time = read_ppg_data(fn)
             gt_spo2, gt_spo2_time = read_spo2_data(fn)
@@ -717,24 +664,26 @@ class ViatalSignDataset_triplet(data.Dataset):
 
 
 class ViatalSignDataset_class(data.Dataset):
-    def __init__(self, mode='train', cl='', use_gpu = False):
+    def __init__(self, mode='train', cl='', use_gpu = False, device = None):
         self.mode = mode
         self.cl = cl
         self.use_gpu = use_gpu
+        # 멜라닌, 피부두께 prior Model 을 올릴 device (None 이면 use_gpu 로 정함)
+        self.device = device if device is not None else ('cuda' if use_gpu == True else 'cpu')
 
         if mode == "train":
             reflect_list, comb_label = self.read_vitalsign_dataset(name='train')
         else:
             reflect_list, comb_label = self.read_vitalsign_dataset(name='test')
 
-        mel_feature_model = VitalSign_Feature_mel_thickness().to('cuda')
-        thickness_feature_model = VitalSign_Feature_mel_thickness().to('cuda')
+        mel_feature_model = VitalSign_Feature_mel_thickness().to(self.device)
+        thickness_feature_model = VitalSign_Feature_mel_thickness().to(self.device)
 
-        mel_classifier_model = Classifier(cl_mode="mel").to('cuda')
-        thickness_classifier_model = Classifier(cl_mode="thickness").to('cuda')
+        mel_classifier_model = Classifier(cl_mode="mel").to(self.device)
+        thickness_classifier_model = Classifier(cl_mode="thickness").to(self.device)
 
-        mel_regression_model = Regression(cl_mode="mel").to('cuda')
-        thickness_regression_model = Regression(cl_mode="thickness").to('cuda')
+        mel_regression_model = Regression(cl_mode="mel").to(self.device)
+        thickness_regression_model = Regression(cl_mode="thickness").to(self.device)
 
         path = os.path.dirname(__file__)
 
@@ -747,13 +696,13 @@ class ViatalSignDataset_class(data.Dataset):
         mel_regression_path = os.path.join(path, './result/Classify_Weight/vitalsign_mel_0104_prob_005_input14_m1_epoch5000_addinput3/regression_weight_data')
         thickness_regression_path = os.path.join(path, './result/Classify_Weight/vitalsign_thickness_0104_prob_005_input14_m1_epoch5000_addinput3/regression_weight_data')
 
-        mel_feature_model.load_state_dict(torch.load(mel_feature_path))
-        mel_classifier_model.load_state_dict(torch.load(mel_classify_path))
-        mel_regression_model.load_state_dict(torch.load(mel_regression_path))
+        mel_feature_model.load_state_dict(torch.load(mel_feature_path, map_location=self.device))
+        mel_classifier_model.load_state_dict(torch.load(mel_classify_path, map_location=self.device))
+        mel_regression_model.load_state_dict(torch.load(mel_regression_path, map_location=self.device))
 
-        thickness_feature_model.load_state_dict(torch.load(thickness_feature_path))
-        thickness_classifier_model.load_state_dict(torch.load(thickness_classify_path))
-        thickness_regression_model.load_state_dict(torch.load(thickness_regression_path))
+        thickness_feature_model.load_state_dict(torch.load(thickness_feature_path, map_location=self.device))
+        thickness_classifier_model.load_state_dict(torch.load(thickness_classify_path, map_location=self.device))
+        thickness_regression_model.load_state_dict(torch.load(thickness_regression_path, map_location=self.device))
 
         mv_window = 30
 
@@ -765,7 +714,7 @@ class ViatalSignDataset_class(data.Dataset):
                 mf_reflect_list.append(list(np.average(reflect_list[i - mv_window:i, :], axis=0)))
 
         # mel_x = mel_feature_model(torch.FloatTensor(reflect_list).to('cuda'))
-        mel_x = mel_feature_model(torch.FloatTensor(mf_reflect_list).to('cuda'))
+        mel_x = mel_feature_model(torch.FloatTensor(mf_reflect_list).to(self.device))
         mel_out = mel_classifier_model(mel_x)
         mel_prob = F.softmax(mel_out, dim=1)
 
@@ -803,7 +752,7 @@ class ViatalSignDataset_class(data.Dataset):
         mel_prob = mel_prob.detach().cpu().numpy()
 
         # thickness_x = thickness_feature_model(torch.FloatTensor(reflect_list).to('cuda'))
-        thickness_x = thickness_feature_model(torch.FloatTensor(mf_reflect_list).to('cuda'))
+        thickness_x = thickness_feature_model(torch.FloatTensor(mf_reflect_list).to(self.device))
         thickenss_out = thickness_classifier_model(thickness_x)
         thickness_prob = F.softmax(thickenss_out, dim=1)
         thickness_value = thickness_regression_model(thickness_prob)
@@ -838,12 +787,9 @@ class ViatalSignDataset_class(data.Dataset):
         # reflect_list = np.concatenate((reflect_list, mel_prob2, thickness_prob2), axis=1)
         # reflect_list = np.concatenate((mf_reflect_list, mel_prob, thickness_prob), axis=1)
 
-        if self.use_gpu == True:
-            self.ref_list = torch.FloatTensor(reflect_list).to('cuda')
-            self.comb_label = torch.FloatTensor(comb_label).to('cuda')
-        else:
-            self.ref_list = torch.FloatTensor(reflect_list)
-            self.comb_label = torch.FloatTensor(comb_label)
+        # use_gpu 와 관계없이 CPU shared memory 에 한 벌만 둠 (batch 는 shared_data.batch_loader 가 device 로 옮김)
+        self.ref_list = shared_tensor(reflect_list)
+        self.comb_label = shared_tensor(comb_label)
 
         # self.positive_list = []
         # self.negative_list = []
@@ -883,7 +829,7 @@ class ViatalSignDataset_class(data.Dataset):
 
         for fn in fileNameList:
             # temp_raw_data = np.load(path + '/check_data/total_data1/{}/re_forehead_human.npy'.format(fn), allow_pickle=True)
-            temp_raw_data = np.load(path + '/check_data/total_data1/{}/re_under_nose_human.npy'.format(fn), allow_pickle=True)
+            temp_raw_data = load_roi_cube(fn, 're_under_nose_human.npy')
             measure_time = read_measurement_elapsed_time(fn)
             gt_ppg, gt_ppg_time = read_ppg_data(fn)
             gt_spo2, gt_spo2_time = read_spo2_data(fn)
@@ -986,24 +932,26 @@ class ViatalSignDataset_class(data.Dataset):
 
 
 class ViatalSignDataset_regression(data.Dataset):
-    def __init__(self, mode='train', cl='', use_gpu = False):
+    def __init__(self, mode='train', cl='', use_gpu = False, device = None):
         self.mode = mode
         self.cl = cl
         self.use_gpu = use_gpu
+        # 멜라닌, 피부두께 prior Model 을 올릴 device (None 이면 use_gpu 로 정함)
+        self.device = device if device is not None else ('cuda' if use_gpu == True else 'cpu')
 
         if mode == "train":
             reflect_list, gt_ppg_data, gt_spo2_data = self.read_vitalsign_dataset(name='train')
         else:
             reflect_list, gt_ppg_data, gt_spo2_data = self.read_vitalsign_dataset(name='test')
 
-        mel_feature_model = VitalSign_Feature_mel_thickness().to('cuda')
-        thickness_feature_model = VitalSign_Feature_mel_thickness().to('cuda')
+        mel_feature_model = VitalSign_Feature_mel_thickness().to(self.device)
+        thickness_feature_model = VitalSign_Feature_mel_thickness().to(self.device)
 
-        mel_classifier_model = Classifier(cl_mode="mel").to('cuda')
-        thickness_classifier_model = Classifier(cl_mode="thickness").to('cuda')
+        mel_classifier_model = Classifier(cl_mode="mel").to(self.device)
+        thickness_classifier_model = Classifier(cl_mode="thickness").to(self.device)
 
-        mel_regression_model = Regression(cl_mode="mel").to('cuda')
-        thickness_regression_model = Regression(cl_mode="thickness").to('cuda')
+        mel_regression_model = Regression(cl_mode="mel").to(self.device)
+        thickness_regression_model = Regression(cl_mode="thickness").to(self.device)
 
         path = os.path.dirname(__file__)
 
@@ -1016,13 +964,13 @@ class ViatalSignDataset_regression(data.Dataset):
         mel_regression_path = os.path.join(path, './result/Classify_Weight/vitalsign_mel_0104_prob_005_input14_m1_epoch5000_addinput3/regression_weight_data')
         thickness_regression_path = os.path.join(path, './result/Classify_Weight/vitalsign_thickness_0104_prob_005_input14_m1_epoch5000_addinput3/regression_weight_data')
 
-        mel_feature_model.load_state_dict(torch.load(mel_feature_path))
-        mel_classifier_model.load_state_dict(torch.load(mel_classify_path))
-        mel_regression_model.load_state_dict(torch.load(mel_regression_path))
+        mel_feature_model.load_state_dict(torch.load(mel_feature_path, map_location=self.device))
+        mel_classifier_model.load_state_dict(torch.load(mel_classify_path, map_location=self.device))
+        mel_regression_model.load_state_dict(torch.load(mel_regression_path, map_location=self.device))
 
-        thickness_feature_model.load_state_dict(torch.load(thickness_feature_path))
-        thickness_classifier_model.load_state_dict(torch.load(thickness_classify_path))
-        thickness_regression_model.load_state_dict(torch.load(thickness_regression_path))
+        thickness_feature_model.load_state_dict(torch.load(thickness_feature_path, map_location=self.device))
+        thickness_classifier_model.load_state_dict(torch.load(thickness_classify_path, map_location=self.device))
+        thickness_regression_model.load_state_dict(torch.load(thickness_regression_path, map_location=self.device))
 
         mv_window = 30
 
@@ -1034,7 +982,7 @@ class ViatalSignDataset_regression(data.Dataset):
                 mf_reflect_list.append(list(np.average(reflect_list[i - mv_window:i, :], axis=0)))
 
         # mel_x = mel_feature_model(torch.FloatTensor(reflect_list).to('cuda'))
-        mel_x = mel_feature_model(torch.FloatTensor(mf_reflect_list).to('cuda'))
+        mel_x = mel_feature_model(torch.FloatTensor(mf_reflect_list).to(self.device))
         mel_out = mel_classifier_model(mel_x)
         mel_prob = F.softmax(mel_out, dim=1)
 
@@ -1072,7 +1020,7 @@ class ViatalSignDataset_regression(data.Dataset):
         mel_prob = mel_prob.detach().cpu().numpy()
 
         # thickness_x = thickness_feature_model(torch.FloatTensor(reflect_list).to('cuda'))
-        thickness_x = thickness_feature_model(torch.FloatTensor(mf_reflect_list).to('cuda'))
+        thickness_x = thickness_feature_model(torch.FloatTensor(mf_reflect_list).to(self.device))
         thickenss_out = thickness_classifier_model(thickness_x)
         thickness_prob = F.softmax(thickenss_out, dim=1)
         thickness_value = thickness_regression_model(thickness_prob)
@@ -1107,14 +1055,10 @@ class ViatalSignDataset_regression(data.Dataset):
         # reflect_list = np.concatenate((reflect_list, mel_prob2, thickness_prob2), axis=1)
         # reflect_list = np.concatenate((mf_reflect_list, mel_prob, thickness_prob), axis=1)
 
-        if self.use_gpu == True:
-            self.ref_list = torch.FloatTensor(reflect_list).to('cuda')
-            self.gt_ppg_data = torch.FloatTensor(gt_ppg_data).to('cuda')
-            self.gt_spo2_data = torch.FloatTensor(gt_spo2_data).to('cuda')
-        else:
-            self.ref_list = torch.FloatTensor(reflect_list)
-            self.gt_ppg_data = torch.FloatTensor(gt_ppg_data)
-            self.gt_spo2_data = torch.FloatTensor(gt_spo2_data)
+        # use_gpu 와 관계없이 CPU shared memory 에 한 벌만 둠 (batch 는 shared_data.batch_loader 가 device 로 옮김)
+        self.ref_list = shared_tensor(reflect_list)
+        self.gt_ppg_data = shared_tensor(gt_ppg_data)
+        self.gt_spo2_data = shared_tensor(gt_spo2_data)
 
     def __getitem__(self, index):
         ref = self.ref_list[index]
@@ -1140,7 +1084,7 @@ class ViatalSignDataset_regression(data.Dataset):
 
         for fn in fileNameList:
             # temp_raw_data = np.load(path + '/check_data/total_data1/{}/re_forehead_human.npy'.format(fn), allow_pickle=True)
-            temp_raw_data = np.load(path + '/check_data/total_data1/{}/re_under_nose_human.npy'.format(fn), allow_pickle=True)
+            temp_raw_data = load_roi_cube(fn, 're_under_nose_human.npy')
             measure_time = read_measurement_elapsed_time(fn)
             gt_ppg, gt_ppg_time = read_ppg_data(fn)
             gt_spo2, gt_spo2_time = read_spo2_data(fn)
@@ -1220,10 +1164,12 @@ class ViatalSignDataset_regression(data.Dataset):
 
 # Personal data/ Training 2min, Test 1min
 class ViatalSignDataset_ppg_lstm(data.Dataset):
-    def __init__(self, mode='train', cl='', use_gpu = False, seq_len = 100, roi = 'forehead'):
+    def __init__(self, mode='train', cl='', use_gpu = False, seq_len = 100, roi = 'forehead', device = None):
         self.mode = mode
         self.cl = cl
         self.use_gpu = use_gpu
+        # 멜라닌, 피부두께 prior Model 을 올릴 device (None 이면 use_gpu 로 정함)
+        self.device = device if device is not None else ('cuda' if use_gpu == True else 'cpu')
         self.seq_len = seq_len
 
         if mode == "train":
@@ -1232,14 +1178,14 @@ class ViatalSignDataset_ppg_lstm(data.Dataset):
             reflect_list, absorption_list, gt_ppg_data, gt_spo2_data, gt_pulse_data, sample_time_list = self.read_vitalsign_dataset(name='test', roi=roi)
 
         # Mel, Thickness 추정 모델 Load
-        mel_feature_model = VitalSign_Feature_mel_thickness().to('cuda')
-        thickness_feature_model = VitalSign_Feature_mel_thickness().to('cuda')
+        mel_feature_model = VitalSign_Feature_mel_thickness().to(self.device)
+        thickness_feature_model = VitalSign_Feature_mel_thickness().to(self.device)
 
-        mel_classifier_model = Classifier(cl_mode="mel").to('cuda')
-        thickness_classifier_model = Classifier(cl_mode="thickness").to('cuda')
+        mel_classifier_model = Classifier(cl_mode="mel").to(self.device)
+        thickness_classifier_model = Classifier(cl_mode="thickness").to(self.device)
 
-        mel_regression_model = Regression(cl_mode="mel").to('cuda')
-        thickness_regression_model = Regression(cl_mode="thickness").to('cuda')
+        mel_regression_model = Regression(cl_mode="mel").to(self.device)
+        thickness_regression_model = Regression(cl_mode="thickness").to(self.device)
 
         path = os.path.dirname(__file__)
 
@@ -1252,13 +1198,13 @@ class ViatalSignDataset_ppg_lstm(data.Dataset):
         mel_regression_path = os.path.join(path, './result/Classify_Weight/vitalsign_mel_0104_prob_005_input14_m1_epoch5000_addinput3/regression_weight_data')
         thickness_regression_path = os.path.join(path, './result/Classify_Weight/vitalsign_thickness_0104_prob_005_input14_m1_epoch5000_addinput3/regression_weight_data')
 
-        mel_feature_model.load_state_dict(torch.load(mel_feature_path))
-        mel_classifier_model.load_state_dict(torch.load(mel_classify_path))
-        mel_regression_model.load_state_dict(torch.load(mel_regression_path))
+        mel_feature_model.load_state_dict(torch.load(mel_feature_path, map_location=self.device))
+        mel_classifier_model.load_state_dict(torch.load(mel_classify_path, map_location=self.device))
+        mel_regression_model.load_state_dict(torch.load(mel_regression_path, map_location=self.device))
 
-        thickness_feature_model.load_state_dict(torch.load(thickness_feature_path))
-        thickness_classifier_model.load_state_dict(torch.load(thickness_classify_path))
-        thickness_regression_model.load_state_dict(torch.load(thickness_regression_path))
+        thickness_feature_model.load_state_dict(torch.load(thickness_feature_path, map_location=self.device))
+        thickness_classifier_model.load_state_dict(torch.load(thickness_classify_path, map_location=self.device))
+        thickness_regression_model.load_state_dict(torch.load(thickness_regression_path, map_location=self.device))
 
         # 멜라닌과 Thickness 추정을 위해 Absorbance data에 Moving Average Filter 적용
         mv_window = 30
@@ -1271,7 +1217,7 @@ class ViatalSignDataset_ppg_lstm(data.Dataset):
                 mf_absorption_list.append(list(np.average(absorption_list[i - mv_window:i, :], axis=0)))
 
         # mel_x = mel_feature_model(torch.FloatTensor(reflect_list).to('cuda'))
-        mel_x = mel_feature_model(torch.FloatTensor(mf_absorption_list).to('cuda'))
+        mel_x = mel_feature_model(torch.FloatTensor(mf_absorption_list).to(self.device))
         mel_out = mel_classifier_model(mel_x)
         mel_prob = F.softmax(mel_out, dim=1)
 
@@ -1281,7 +1227,7 @@ class ViatalSignDataset_ppg_lstm(data.Dataset):
         mel_prob = mel_prob.detach().cpu().numpy()
 
         # thickness_x = thickness_feature_model(torch.FloatTensor(reflect_list).to('cuda'))
-        thickness_x = thickness_feature_model(torch.FloatTensor(mf_absorption_list).to('cuda'))
+        thickness_x = thickness_feature_model(torch.FloatTensor(mf_absorption_list).to(self.device))
         thickenss_out = thickness_classifier_model(thickness_x)
         thickness_prob = F.softmax(thickenss_out, dim=1)
         thickness_value = thickness_regression_model(thickness_prob)
@@ -1294,16 +1240,8 @@ class ViatalSignDataset_ppg_lstm(data.Dataset):
         reflect_list_ = np.concatenate((reflect_list, mel_prob, thickness_prob), axis=1)
         # reflect_list = np.concatenate((mf_reflect_list, mel_prob, thickness_prob), axis=1)
 
-        sequence_absorption = []
-        sequence_absorption_concat = []
-        sequence_reflectance = []
-        sequence_ppg = []
-        sequence_spo2 = []
-        sequence_pulse = []
-
-        mel_value_list = []
-        thickness_value_list = []
-
+        # Window 마지막 frame 위치 (Window 는 복사하지 않고 SequenceWindows 가 원래 배열의 index 로 만듦)
+        end_index = []
         file_start = 0
         file_check_idx = 0
 
@@ -1316,76 +1254,28 @@ class ViatalSignDataset_ppg_lstm(data.Dataset):
             if (seq_i - file_start) < self.seq_len:
                 continue
             else:
+                end_index.append(seq_i)
 
-                if self.use_gpu == True:
-                    sequence_absorption.append(absorption_list[seq_i-(self.seq_len-1):seq_i+1])
-                    sequence_absorption_concat.append(absorption_list_concat[seq_i-(self.seq_len-1):seq_i+1])
-                    sequence_reflectance.append(reflect_list[seq_i-(self.seq_len-1):seq_i+1])
-                    sequence_ppg.append(gt_ppg_data[seq_i-(self.seq_len-1):seq_i+1])
-                    sequence_spo2.append(gt_spo2_data[seq_i-(self.seq_len-1):seq_i+1])
-                    sequence_pulse.append(gt_pulse_data[seq_i-(self.seq_len-1):seq_i+1])
-
-                    mel_value_list.append(mel_value[seq_i + 1])
-                    thickness_value_list.append(thickness_value[seq_i + 1])
+        # use_gpu 와 관계없이 CPU shared memory 에 한 벌만 둠 (batch 는 shared_data.batch_loader 가 device 로 옮김)
+        self.absorption_list = shared_tensor(absorption_list)
+        self.absorption_concat_list = shared_tensor(absorption_list_concat)
+        self.gt_ppg_data = shared_tensor(gt_ppg_data)
+        self.gt_spo2_data = shared_tensor(gt_spo2_data)
 
-                else:
-                    sequence_absorption.append(absorption_list[seq_i-(self.seq_len-1):seq_i+1])
-                    sequence_absorption_concat.append(absorption_list_concat[seq_i-(self.seq_len-1):seq_i+1])
-                    sequence_reflectance.append(reflect_list[seq_i-(self.seq_len-1):seq_i+1])
-                    sequence_ppg.append(gt_ppg_data[seq_i-(self.seq_len-1):seq_i+1])
-                    sequence_spo2.append(gt_spo2_data[seq_i-(self.seq_len-1):seq_i+1])
-                    sequence_pulse.append(gt_pulse_data[seq_i - (self.seq_len - 1):seq_i + 1])
-
-                    mel_value_list.append(mel_value[seq_i + 1])
-                    thickness_value_list.append(thickness_value[seq_i + 1])
+        self.windows = SequenceWindows([self.absorption_list, self.absorption_concat_list, shared_tensor(reflect_list),
+                                        self.gt_ppg_data, self.gt_spo2_data, shared_tensor(gt_pulse_data)], end_index, self.seq_len)
 
-        if self.use_gpu == True:
-            self.absorption_list = torch.FloatTensor(absorption_list).to('cuda')
-            self.absorption_concat_list = torch.FloatTensor(absorption_list_concat).to('cuda')
-            self.gt_ppg_data = torch.FloatTensor(gt_ppg_data).to('cuda')
-            self.gt_spo2_data = torch.FloatTensor(gt_spo2_data).to('cuda')
-            self.sequence_absorption = torch.FloatTensor(sequence_absorption).to('cuda')
-            self.sequence_absorption_concat = torch.FloatTensor(sequence_absorption_concat).to('cuda')
-            self.sequence_reflectance = torch.FloatTensor(sequence_reflectance).to('cuda')
-            self.sequence_ppg = torch.FloatTensor(sequence_ppg).to('cuda')
-            self.sequence_spo2 = torch.FloatTensor(sequence_spo2).to('cuda')
-            self.sequence_pulse = torch.FloatTensor(sequence_pulse).to('cuda')
-
-            self.mel_value_list = mel_value_list
-            self.thickness_value_list = thickness_value_list
-
-        else:
-            self.absorption_list = torch.FloatTensor(absorption_list)
-            self.absorption_concat_list = torch.FloatTensor(absorption_list_concat)
-            self.gt_ppg_data = torch.FloatTensor(gt_ppg_data)
-            self.gt_spo2_data = torch.Tensor(gt_spo2_data)
-
-            self.mel_value_list = mel_value_list
-            self.thickness_value_list = thickness_value_list
-
-            self.sequence_absorption = torch.Tensor(sequence_absorption)
-            self.sequence_absorption_concat = torch.Tensor(sequence_absorption_concat)
-            self.sequence_reflectance = torch.Tensor(sequence_reflectance)
-            self.sequence_ppg = torch.Tensor(sequence_ppg)
-            self.sequence_spo2 = torch.Tensor(sequence_spo2)
-            self.sequence_pulse = torch.Tensor(sequence_pulse)
+        # Window 다음 frame 의 mel, thickness 추정값
+        next_index = np.asarray(end_index, dtype=np.int64) + 1
+        self.mel_value_list = shared_tensor(mel_value[next_index])
+        self.thickness_value_list = shared_tensor(thickness_value[next_index])
 
     def __getitem__(self, index):
-        # abs = self.absorption_list[index]
-        sequence_absorption = self.sequence_absorption[index]
-        sequence_absorption_concat = self.sequence_absorption_concat[index]
-        sequence_reflectance = self.sequence_reflectance[index]
-        ppg_data = self.sequence_ppg[index]
-        spo2_data = self.sequence_spo2[index]
-        pulse_data = self.sequence_pulse[index]
-
-        mel_value = self.mel_value_list[index]
-        thickness_value = self.thickness_value_list[index]
-
-        return sequence_absorption, sequence_absorption_concat, sequence_reflectance, ppg_data, spo2_data, pulse_data, mel_value, thickness_value
+        '''index : int 또는 index list (batch)'''
+        return self.windows[index] + (self.mel_value_list[index], self.thickness_value_list[index])
 
     def __len__(self):
-        return len(self.sequence_absorption)
+        return len(self.windows)
 
     def read_vitalsign_dataset(self, name, roi):
         '''
@@ -1411,17 +1301,13 @@ class ViatalSignDataset_ppg_lstm(data.Dataset):
             # Load Reflectance data, Reflectance Shape (time_stamp, spectral_band, x_axis, y_axis)
             print(fn)
             if roi == 'forehead':
-                temp_raw_data = np.load(path + '/check_data/total_data1/{}/re_forehead_human.npy'.format(fn),
-                                        allow_pickle=True)
+                temp_raw_data = load_roi_cube(fn, 're_forehead_human.npy')
             elif roi == 'ueye':
-                temp_raw_data = np.load(path + '/check_data/total_data1/{}/re_under_eye_human.npy'.format(fn),
-                                        allow_pickle=True)
+                temp_raw_data = load_roi_cube(fn, 're_under_eye_human.npy')
             elif roi == 'cheek':
-                temp_raw_data = np.load(path + '/check_data/total_data1/{}/re_cheek_human.npy'.format(fn),
-                                        allow_pickle=True)
+                temp_raw_data = load_roi_cube(fn, 're_cheek_human.npy')
             elif roi == 'unose':
-                temp_raw_data = np.load(path + '/check_data/total_data1/{}/re_under_nose_human.npy'.format(fn),
-                                        allow_pickle=True)
+                temp_raw_data = load_roi_cube(fn, 're_under_nose_human.npy')
 
             # Load Time, Ground Truth PPG, Spo2, Pulse data
             measure_time = read_measurement_elapsed_time(fn)
@@ -1519,10 +1405,12 @@ class ViatalSignDataset_ppg_lstm(data.Dataset):
 
 # Personal Data, Trainin data 9 person, Test 3 Person
 class ViatalSignDataset_ppg_lstm2(data.Dataset):
-    def __init__(self, mode='train', cl='', use_gpu = False, seq_len = 100, roi = 'forehead', test_name = ''):
+    def __init__(self, mode='train', cl='', use_gpu = False, seq_len = 100, roi = 'forehead', test_name = '', device = None):
         self.mode = mode
         self.cl = cl
         self.use_gpu = use_gpu
+        # 멜라닌, 피부두께 prior Model 을 올릴 device (None 이면 use_gpu 로 정함)
+        self.device = device if device is not None else ('cuda' if use_gpu == True else 'cpu')
         self.seq_len = seq_len
 
         if mode == "train":
@@ -1530,14 +1418,14 @@ class ViatalSignDataset_ppg_lstm2(data.Dataset):
         else:
             reflect_list, absorption_list, gt_ppg_data, gt_spo2_data, gt_pulse_data, sample_time_list = self.read_vitalsign_dataset(name='test', roi=roi, test_name=test_name)
 
-        mel_feature_model = VitalSign_Feature_mel_thickness().to('cuda')
-        thickness_feature_model = VitalSign_Feature_mel_thickness().to('cuda')
+        mel_feature_model = VitalSign_Feature_mel_thickness().to(self.device)
+        thickness_feature_model = VitalSign_Feature_mel_thickness().to(self.device)
 
-        mel_classifier_model = Classifier(cl_mode="mel").to('cuda')
-        thickness_classifier_model = Classifier(cl_mode="thickness").to('cuda')
+        mel_classifier_model = Classifier(cl_mode="mel").to(self.device)
+        thickness_classifier_model = Classifier(cl_mode="thickness").to(self.device)
 
-        mel_regression_model = Regression(cl_mode="mel").to('cuda')
-        thickness_regression_model = Regression(cl_mode="thickness").to('cuda')
+        mel_regression_model = Regression(cl_mode="mel").to(self.device)
+        thickness_regression_model = Regression(cl_mode="thickness").to(self.device)
 
         path = os.path.dirname(__file__)
 
@@ -1550,13 +1438,13 @@ class ViatalSignDataset_ppg_lstm2(data.Dataset):
         mel_regression_path = os.path.join(path, './result/Classify_Weight/vitalsign_mel_0104_prob_005_input14_m1_epoch5000_addinput3/regression_weight_data')
         thickness_regression_path = os.path.join(path, './result/Classify_Weight/vitalsign_thickness_0104_prob_005_input14_m1_epoch5000_addinput3/regression_weight_data')
 
-        mel_feature_model.load_state_dict(torch.load(mel_feature_path))
-        mel_classifier_model.load_state_dict(torch.load(mel_classify_path))
-        mel_regression_model.load_state_dict(torch.load(mel_regression_path))
+        mel_feature_model.load_state_dict(torch.load(mel_feature_path, map_location=self.device))
+        mel_classifier_model.load_state_dict(torch.load(mel_classify_path, map_location=self.device))
+        mel_regression_model.load_state_dict(torch.load(mel_regression_path, map_location=self.device))
 
-        thickness_feature_model.load_state_dict(torch.load(thickness_feature_path))
-        thickness_classifier_model.load_state_dict(torch.load(thickness_classify_path))
-        thickness_regression_model.load_state_dict(torch.load(thickness_regression_path))
+        thickness_feature_model.load_state_dict(torch.load(thickness_feature_path, map_location=self.device))
+        thickness_classifier_model.load_state_dict(torch.load(thickness_classify_path, map_location=self.device))
+        thickness_regression_model.load_state_dict(torch.load(thickness_regression_path, map_location=self.device))
 
         mv_window = 30
 
@@ -1568,7 +1456,7 @@ class ViatalSignDataset_ppg_lstm2(data.Dataset):
                 mf_absorption_list.append(list(np.average(absorption_list[i - mv_window:i, :], axis=0)))
 
         # mel_x = mel_feature_model(torch.FloatTensor(reflect_list).to('cuda'))
-        mel_x = mel_feature_model(torch.FloatTensor(mf_absorption_list).to('cuda'))
+        mel_x = mel_feature_model(torch.FloatTensor(mf_absorption_list).to(self.device))
         mel_out = mel_classifier_model(mel_x)
         mel_prob = F.softmax(mel_out, dim=1)
 
@@ -1578,7 +1466,7 @@ class ViatalSignDataset_ppg_lstm2(data.Dataset):
         mel_prob = mel_prob.detach().cpu().numpy()
 
         # thickness_x = thickness_feature_model(torch.FloatTensor(reflect_list).to('cuda'))
-        thickness_x = thickness_feature_model(torch.FloatTensor(mf_absorption_list).to('cuda'))
+        thickness_x = thickness_feature_model(torch.FloatTensor(mf_absorption_list).to(self.device))
         thickenss_out = thickness_classifier_model(thickness_x)
         thickness_prob = F.softmax(thickenss_out, dim=1)
         thickness_value = thickness_regression_model(thickness_prob)
@@ -1624,16 +1512,16 @@ class ViatalSignDataset_ppg_lstm2(data.Dataset):
                     sequence_pulse.append(gt_pulse_data[seq_i - (self.seq_len - 1):seq_i + 1])
 
         if self.use_gpu == True:
-            self.absorption_list = torch.FloatTensor(absorption_list).to('cuda')
-            self.gt_ppg_data = torch.FloatTensor(gt_ppg_data).to('cuda')
-            self.gt_spo2_data = torch.FloatTensor(gt_spo2_data).to('cuda')
-
-            self.sequence_absorption = torch.FloatTensor(sequence_absorption).to('cuda')
-            self.sequence_absorption_concat = torch.FloatTensor(sequence_absorption_concat).to('cuda')
-            self.sequence_reflectance = torch.FloatTensor(sequence_reflectance).to('cuda')
-            self.sequence_ppg = torch.FloatTensor(sequence_ppg).to('cuda')
-            self.sequence_spo2 = torch.FloatTensor(sequence_spo2).to('cuda')
-            self.sequence_pulse = torch.FloatTensor(sequence_pulse).to('cuda')
+            self.absorption_list = torch.FloatTensor(absorption_list).to(self.device)
+            self.gt_ppg_data = torch.FloatTensor(gt_ppg_data).to(self.device)
+            self.gt_spo2_data = torch.FloatTensor(gt_spo2_data).to(self.device)
+
+            self.sequence_absorption = torch.FloatTensor(sequence_absorption).to(self.device)
+            self.sequence_absorption_concat = torch.FloatTensor(sequence_absorption_concat).to(self.device)
+            self.sequence_reflectance = torch.FloatTensor(sequence_reflectance).to(self.device)
+            self.sequence_ppg = torch.FloatTensor(sequence_ppg).to(self.device)
+            self.sequence_spo2 = torch.FloatTensor(sequence_spo2).to(self.device)
+            self.sequence_pulse = torch.FloatTensor(sequence_pulse).to(self.device)
         else:
             self.absorption_list = torch.FloatTensor(absorption_list)
             self.gt_ppg_data = torch.FloatTensor(gt_ppg_data)
@@ -1692,17 +1580,13 @@ class ViatalSignDataset_ppg_lstm2(data.Dataset):
                     print(fn)
 
             if roi == 'forehead':
-                temp_raw_data = np.load(path + '/check_data/total_data1/{}/re_forehead_human.npy'.format(fn),
-                                        allow_pickle=True)
+                temp_raw_data = load_roi_cube(fn, 're_forehead_human.npy')
             elif roi == 'ueye':
-                temp_raw_data = np.load(path + '/check_data/total_data1/{}/re_under_eye_human.npy'.format(fn),
-                                        allow_pickle=True)
+                temp_raw_data = load_roi_cube(fn, 're_under_eye_human.npy')
             elif roi == 'cheek':
-                temp_raw_data = np.load(path + '/check_data/total_data1/{}/re_cheek_human.npy'.format(fn),
-                                        allow_pickle=True)
+                temp_raw_data = load_roi_cube(fn, 're_cheek_human.npy')
             elif roi == 'unose':
-                temp_raw_data = np.load(path + '/check_data/total_data1/{}/re_under_nose_human.npy'.format(fn),
-                                        allow_pickle=True)
+                temp_raw_data = load_roi_cube(fn, 're_under_nose_human.npy')
 
             # temp_raw_data = np.load(path + '/check_data/total_data1/{}/re_forehead_human.npy'.format(fn), allow_pickle=True)
 
@@ -1791,10 +1675,12 @@ class ViatalSignDataset_ppg_lstm2(data.Dataset):
 
 # keep breath model
 class ViatalSignDataset_ppg_lstm3(data.Dataset):
-    def __init__(self, mode='train', cl='', use_gpu = False, seq_len = 100, roi = 'forehead'):
+    def __init__(self, mode='train', cl='', use_gpu = False, seq_len = 100, roi = 'forehead', device = None):
         self.mode = mode
         self.cl = cl
         self.use_gpu = use_gpu
+        # 멜라닌, 피부두께 prior Model 을 올릴 device (None 이면 use_gpu 로 정함)
+        self.device = device if device is not None else ('cuda' if use_gpu == True else 'cpu')
         self.seq_len = seq_len
 
         if mode == "train":
@@ -1802,14 +1688,14 @@ class ViatalSignDataset_ppg_lstm3(data.Dataset):
         else:
             reflect_list, absorption_list, gt_ppg_data, gt_spo2_data, gt_pulse_data, sample_time_list = self.read_vitalsign_dataset(name='test', roi=roi)
 
-        mel_feature_model = VitalSign_Feature_mel_thickness().to('cuda')
-        thickness_feature_model = VitalSign_Feature_mel_thickness().to('cuda')
+        mel_feature_model = VitalSign_Feature_mel_thickness().to(self.device)
+        thickness_feature_model = VitalSign_Feature_mel_thickness().to(self.device)
 
-        mel_classifier_model = Classifier(cl_mode="mel").to('cuda')
-        thickness_classifier_model = Classifier(cl_mode="thickness").to('cuda')
+        mel_classifier_model = Classifier(cl_mode="mel").to(self.device)
+        thickness_classifier_model = Classifier(cl_mode="thickness").to(self.device)
 
-        mel_regression_model = Regression(cl_mode="mel").to('cuda')
-        thickness_regression_model = Regression(cl_mode="thickness").to('cuda')
+        mel_regression_model = Regression(cl_mode="mel").to(self.device)
+        thickness_regression_model = Regression(cl_mode="thickness").to(self.device)
 
         path = os.path.dirname(__file__)
 
@@ -1822,13 +1708,13 @@ class ViatalSignDataset_ppg_lstm3(data.Dataset):
         mel_regression_path = os.path.join(path, './result/Classify_Weight/vitalsign_mel_0104_prob_005_input14_m1_epoch5000_addinput3/regression_weight_data')
         thickness_regression_path = os.path.join(path, './result/Classify_Weight/vitalsign_thickness_0104_prob_005_input14_m1_epoch5000_addinput3/regression_weight_data')
 
-        mel_feature_model.load_state_dict(torch.load(mel_feature_path))
-        mel_classifier_model.load_state_dict(torch.load(mel_classify_path))
-        mel_regression_model.load_state_dict(torch.load(mel_regression_path))
+        mel_feature_model.load_state_dict(torch.load(mel_feature_path, map_location=self.device))
+        mel_classifier_model.load_state_dict(torch.load(mel_classify_path, map_location=self.device))
+        mel_regression_model.load_state_dict(torch.load(mel_regression_path, map_location=self.device))
 
-        thickness_feature_model.load_state_dict(torch.load(thickness_feature_path))
-        thickness_classifier_model.load_state_dict(torch.load(thickness_classify_path))
-        thickness_regression_model.load_state_dict(torch.load(thickness_regression_path))
+        thickness_feature_model.load_state_dict(torch.load(thickness_feature_path, map_location=self.device))
+        thickness_classifier_model.load_state_dict(torch.load(thickness_classify_path, map_location=self.device))
+        thickness_regression_model.load_state_dict(torch.load(thickness_regression_path, map_location=self.device))
 
         mv_window = 30
 
@@ -1840,7 +1726,7 @@ class ViatalSignDataset_ppg_lstm3(data.Dataset):
                 mf_absorption_list.append(list(np.average(absorption_list[i - mv_window:i, :], axis=0)))
 
         # mel_x = mel_feature_model(torch.FloatTensor(reflect_list).to('cuda'))
-        mel_x = mel_feature_model(torch.FloatTensor(mf_absorption_list).to('cuda'))
+        mel_x = mel_feature_model(torch.FloatTensor(mf_absorption_list).to(self.device))
         mel_out = mel_classifier_model(mel_x)
         mel_prob = F.softmax(mel_out, dim=1)
 
@@ -1850,7 +1736,7 @@ class ViatalSignDataset_ppg_lstm3(data.Dataset):
         mel_prob = mel_prob.detach().cpu().numpy()
 
         # thickness_x = thickness_feature_model(torch.FloatTensor(reflect_list).to('cuda'))
-        thickness_x = thickness_feature_model(torch.FloatTensor(mf_absorption_list).to('cuda'))
+        thickness_x = thickness_feature_model(torch.FloatTensor(mf_absorption_list).to(self.device))
         thickenss_out = thickness_classifier_model(thickness_x)
         thickness_prob = F.softmax(thickenss_out, dim=1)
         thickness_value = thickness_regression_model(thickness_prob)
@@ -1930,15 +1816,15 @@ class ViatalSignDataset_ppg_lstm3(data.Dataset):
         print("CHECK absorption shape22: ", len(sequence_absorption))
 
         if self.use_gpu == True:
-            self.absorption_list = torch.FloatTensor(absorption_list).to('cuda')
-            self.gt_ppg_data = torch.FloatTensor(gt_ppg_data).to('cuda')
-            self.gt_spo2_data = torch.FloatTensor(gt_spo2_data).to('cuda')
-
-            self.sequence_absorption = torch.FloatTensor(sequence_absorption).to('cuda')
-            self.sequence_reflectance = torch.FloatTensor(sequence_reflectance).to('cuda')
-            self.sequence_ppg = torch.FloatTensor(sequence_ppg).to('cuda')
-            self.sequence_spo2 = torch.FloatTensor(sequence_spo2).to('cuda')
-            self.sequence_pulse = torch.FloatTensor(sequence_pulse).to('cuda')
+            self.absorption_list = torch.FloatTensor(absorption_list).to(self.device)
+            self.gt_ppg_data = torch.FloatTensor(gt_ppg_data).to(self.device)
+            self.gt_spo2_data = torch.FloatTensor(gt_spo2_data).to(self.device)
+
+            self.sequence_absorption = torch.FloatTensor(sequence_absorption).to(self.device)
+            self.sequence_reflectance = torch.FloatTensor(sequence_reflectance).to(self.device)
+            self.sequence_ppg = torch.FloatTensor(sequence_ppg).to(self.device)
+            self.sequence_spo2 = torch.FloatTensor(sequence_spo2).to(self.device)
+            self.sequence_pulse = torch.FloatTensor(sequence_pulse).to(self.device)
         else:
             self.absorption_list = torch.FloatTensor(absorption_list)
             self.gt_ppg_data = torch.FloatTensor(gt_ppg_data)
@@ -1997,17 +1883,13 @@ class ViatalSignDataset_ppg_lstm3(data.Dataset):
                     print(fn)
 
             if roi == 'forehead':
-                temp_raw_data = np.load(path + '/check_data/total_data1/{}/re_forehead_human.npy'.format(fn),
-                                        allow_pickle=True)
+                temp_raw_data = load_roi_cube(fn, 're_forehead_human.npy')
             elif roi == 'ueye':
-                temp_raw_data = np.load(path + '/check_data/total_data1/{}/re_under_eye_human.npy'.format(fn),
-                                        allow_pickle=True)
+                temp_raw_data = load_roi_cube(fn, 're_under_eye_human.npy')
             elif roi == 'cheek':
-                temp_raw_data = np.load(path + '/check_data/total_data1/{}/re_cheek_human.npy'.format(fn),
-                                        allow_pickle=True)
+                temp_raw_data = load_roi_cube(fn, 're_cheek_human.npy')
             elif roi == 'unose':
-                temp_raw_data = np.load(path + '/check_data/total_data1/{}/re_under_nose_human.npy'.format(fn),
-                                        allow_pickle=True)
+                temp_raw_data = load_roi_cube(fn, 're_under_nose_human.npy')
 
             # temp_raw_data = np.load(path + '/check_data/total_data1/{}/re_forehead_human.npy'.format(fn), allow_pickle=True)
 
@@ -2107,10 +1989,12 @@ class ViatalSignDataset_ppg_lstm3(data.Dataset):
 
 
 class ViatalSignDataset_ppg_lstm_useregression(data.Dataset):
-    def __init__(self, mode='train', cl='', use_gpu = False, seq_len = 100):
+    def __init__(self, mode='train', cl='', use_gpu = False, seq_len = 100, device = None):
         self.mode = mode
         self.cl = cl
         self.use_gpu = use_gpu
+        # 멜라닌, 피부두께 prior Model 을 올릴 device (None 이면 use_gpu 로 정함)
+        self.device = device if device is not None else ('cuda' if use_gpu == True else 'cpu')
         self.seq_len = seq_len
 
         if mode == "train":
@@ -2118,14 +2002,14 @@ class ViatalSignDataset_ppg_lstm_useregression(data.Dataset):
         else:
             reflect_list, absorption_list, gt_ppg_data, gt_spo2_data, gt_pulse_data, sample_time_list = self.read_vitalsign_dataset(name='test')
 
-        mel_feature_model = VitalSign_Feature_mel_thickness().to('cuda')
-        thickness_feature_model = VitalSign_Feature_mel_thickness().to('cuda')
+        mel_feature_model = VitalSign_Feature_mel_thickness().to(self.device)
+        thickness_feature_model = VitalSign_Feature_mel_thickness().to(self.device)
 
-        mel_classifier_model = Classifier(cl_mode="mel").to('cuda')
-        thickness_classifier_model = Classifier(cl_mode="thickness").to('cuda')
+        mel_classifier_model = Classifier(cl_mode="mel").to(self.device)
+        thickness_classifier_model = Classifier(cl_mode="thickness").to(self.device)
 
-        mel_regression_model = Regression(cl_mode="mel").to('cuda')
-        thickness_regression_model = Regression(cl_mode="thickness").to('cuda')
+        mel_regression_model = Regression(cl_mode="mel").to(self.device)
+        thickness_regression_model = Regression(cl_mode="thickness").to(self.device)
 
         path = os.path.dirname(__file__)
 
@@ -2138,13 +2022,13 @@ class ViatalSignDataset_ppg_lstm_useregression(data.Dataset):
         mel_regression_path = os.path.join(path, './result/Classify_Weight/vitalsign_mel_0104_prob_005_input14_m1_epoch5000_addinput3/regression_weight_data')
         thickness_regression_path = os.path.join(path, './result/Classify_Weight/vitalsign_thickness_0104_prob_005_input14_m1_epoch5000_addinput3/regression_weight_data')
 
-        mel_feature_model.load_state_dict(torch.load(mel_feature_path))
-        mel_classifier_model.load_state_dict(torch.load(mel_classify_path))
-        mel_regression_model.load_state_dict(torch.load(mel_regression_path))
+        mel_feature_model.load_state_dict(torch.load(mel_feature_path, map_location=self.device))
+        mel_classifier_model.load_state_dict(torch.load(mel_classify_path, map_location=self.device))
+        mel_regression_model.load_state_dict(torch.load(mel_regression_path, map_location=self.device))
 
-        thickness_feature_model.load_state_dict(torch.load(thickness_feature_path))
-        thickness_classifier_model.load_state_dict(torch.load(thickness_classify_path))
-        thickness_regression_model.load_state_dict(torch.load(thickness_regression_path))
+        thickness_feature_model.load_state_dict(torch.load(thickness_feature_path, map_location=self.device))
+        thickness_classifier_model.load_state_dict(torch.load(thickness_classify_path, map_location=self.device))
+        thickness_regression_model.load_state_dict(torch.load(thickness_regression_path, map_location=self.device))
 
         mv_window = 30
 
@@ -2156,7 +2040,7 @@ class ViatalSignDataset_ppg_lstm_useregression(data.Dataset):
                 mf_absorption_list.append(list(np.average(absorption_list[i - mv_window:i, :], axis=0)))
 
         # mel_x = mel_feature_model(torch.FloatTensor(reflect_list).to('cuda'))
-        mel_x = mel_feature_model(torch.FloatTensor(mf_absorption_list).to('cuda'))
+        mel_x = mel_feature_model(torch.FloatTensor(mf_absorption_list).to(self.device))
         mel_out = mel_classifier_model(mel_x)
         mel_prob = F.softmax(mel_out, dim=1)
 
@@ -2166,7 +2050,7 @@ class ViatalSignDataset_ppg_lstm_useregression(data.Dataset):
         mel_prob = mel_prob.detach().cpu().numpy()
 
         # thickness_x = thickness_feature_model(torch.FloatTensor(reflect_list).to('cuda'))
-        thickness_x = thickness_feature_model(torch.FloatTensor(mf_absorption_list).to('cuda'))
+        thickness_x = thickness_feature_model(torch.FloatTensor(mf_absorption_list).to(self.device))
         thickenss_out = thickness_classifier_model(thickness_x)
         thickness_prob = F.softmax(thickenss_out, dim=1)
         thickness_value = thickness_regression_model(thickness_prob)
@@ -2250,16 +2134,16 @@ class ViatalSignDataset_ppg_lstm_useregression(data.Dataset):
         print("CHECK absorption shape22: ", len(sequence_absorption))
 
         if self.use_gpu == True:
-            self.absorption_list = torch.FloatTensor(absorption_list1).to('cuda')
-            self.gt_ppg_data = torch.FloatTensor(gt_ppg_data).to('cuda')
-            self.gt_spo2_data = torch.FloatTensor(gt_spo2_data).to('cuda')
-
-            self.sequence_absorption = torch.FloatTensor(sequence_absorption).to('cuda')
-            self.sequence_absorption2 = torch.FloatTensor(sequence_absorption2).to('cuda')
-            self.sequence_reflectance = torch.FloatTensor(sequence_reflectance).to('cuda')
-            self.sequence_ppg = torch.FloatTensor(sequence_ppg).to('cuda')
-            self.sequence_spo2 = torch.FloatTensor(sequence_spo2).to('cuda')
-            self.sequence_pulse = torch.FloatTensor(sequence_pulse).to('cuda')
+            self.absorption_list = torch.FloatTensor(absorption_list1).to(self.device)
+            self.gt_ppg_data = torch.FloatTensor(gt_ppg_data).to(self.device)
+            self.gt_spo2_data = torch.FloatTensor(gt_spo2_data).to(self.device)
+
+            self.sequence_absorption = torch.FloatTensor(sequence_absorption).to(self.device)
+            self.sequence_absorption2 = torch.FloatTensor(sequence_absorption2).to(self.device)
+            self.sequence_reflectance = torch.FloatTensor(sequence_reflectance).to(self.device)
+            self.sequence_ppg = torch.FloatTensor(sequence_ppg).to(self.device)
+            self.sequence_spo2 = torch.FloatTensor(sequence_spo2).to(self.device)
+            self.sequence_pulse = torch.FloatTensor(sequence_pulse).to(self.device)
         else:
             self.absorption_list = torch.FloatTensor(absorption_list1)
             self.gt_ppg_data = torch.FloatTensor(gt_ppg_data)
@@ -2307,7 +2191,7 @@ class ViatalSignDataset_ppg_lstm_useregression(data.Dataset):
 
         for fn in fileNameList:
             # temp_raw_data = np.load(path + '/check_data/total_data1/{}/re_forehead_human.npy'.format(fn), allow_pickle=True)
-            temp_raw_data = np.load(path + '/check_data/total_data1/{}/re_forehead_human.npy'.format(fn), allow_pickle=True)
+            temp_raw_data = load_roi_cube(fn, 're_forehead_human.npy')
             measure_time = read_measurement_elapsed_time(fn)
             gt_ppg, gt_ppg_time = read_ppg_data(fn)
             gt_spo2, gt_spo2_time = read_spo2_data(fn)
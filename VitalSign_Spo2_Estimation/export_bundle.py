@@ -0,0 +1,195 @@
+import json
+import os
+import sys
+import time
+
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+from session_reader import K_COEF, PRIOR_WEIGHT_DIR, load_prior_models, load_stage1
+from spo2_model import VitalSign_Spo2
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'VitalSign_Probability_Regression'))
+from vitalsign_model import Regression
+
+'''
+멜라닌/피부두께 + LSTM Spo2 추론 전체를 TorchScript 파일 하나로 저장
+저장된 파일은 torch.jit.load 만으로 실행되고 (Model class 정의, result/ weight 파일 불필요),
+Shading 보정 계수, 이동평균 window, seq_len 등 전처리 상수가 Graph 안에 포함됨.
+'''
+
+
+class Stage1(nn.Module):
+    '''FusedStage1 과 같은 출력 (logits list) 을 Model 별 nn.Linear 로 계산 (nn.Linear 만 바꾸는 동적 양자화용)'''
+    def __init__(self, prior_models):
+        super(Stage1, self).__init__()
+        self.chains = nn.ModuleList([nn.Sequential(feature_model, classifier_model) for feature_model, classifier_model in prior_models])
+
+    def forward(self, x):
+        return [chain(x) for chain in self.chains]
+
+
+class Spo2InferenceBundle(nn.Module):
+    '''
+    forward(absorbance) : (batch, L, 14) Absorbance window (L >= seq_len, 마지막 sample 이 추정 시점)
+      window 안에서 앞쪽 mv_window 개가 없는 위치는 dataset1 과 같이 현재 값을 그대로 사용하므로
+      L = seq_len + mv_window 이면 Session 중간, Session 시작부터 모든 sample 을 주면 Session 시작과 같은 결과
+    return : spo2 (batch,), mel_prob (batch, 8), thickness_prob (batch, 3), mel_value (batch,), thickness_value (batch,)
+      (확률분포와 값은 마지막 sample 기준)
+    '''
+    def __init__(self, spo2_model, stage1, regression_models, mv_window=30):
+        super(Spo2InferenceBundle, self).__init__()
+
+        self.spo2_model = spo2_model
+        self.stage1 = stage1
+        self.mel_regression, self.thickness_regression = regression_models
+
+        self.seq_len = spo2_model.seq_len
+        self.mv_window = mv_window
+
+        a, b, c, d = K_COEF
+        self.register_buffer('k_coef', torch.tensor([a, b, c], dtype=torch.float32) / (a + b + c))
+        self.k_bias = d / (a + b + c)
+
+    @torch.jit.export
+    def reflectance_to_absorbance(self, reflect):
+        '''ROI 평균 반사율 (..., 14) -> Shading 보정 Absorbance (..., 14)'''
+        log_ref = -torch.log(reflect)
+        k = log_ref[..., 0] * self.k_coef[0] + log_ref[..., 6] * self.k_coef[1] + log_ref[..., 13] * self.k_coef[2] + self.k_bias
+        return log_ref - k.unsqueeze(-1)
+
+    def moving_average(self, absorbance):
+        '''위치 j >= mv_window 이면 absorbance[:, j-mv_window:j] 평균, 그 전은 현재 값'''
+        if absorbance.size(1) <= self.mv_window:
+            return absorbance
+
+        cumsum = torch.cumsum(F.pad(absorbance, (0, 0, 1, 0)), dim=1)
+        mean = (cumsum[:, self.mv_window:-1] - cumsum[:, :-self.mv_window - 1]) / self.mv_window
+        return torch.cat([absorbance[:, :self.mv_window], mean], dim=1)
+
+    def forward(self, absorbance):
+        batch = absorbance.size(0)
+
+        mf_absorbance = self.moving_average(absorbance)[:, -self.seq_len:]
+        absorbance = absorbance[:, -self.seq_len:]
+
+        logits = self.stage1(mf_absorbance.reshape(batch * self.seq_len, -1))
+        mel_prob = F.softmax(logits[0], dim=1)
+        thickness_prob = F.softmax(logits[1], dim=1)
+
+        concat = torch.cat([absorbance, mel_prob.reshape(batch, self.seq_len, -1), thickness_prob.reshape(batch, self.seq_len, -1)], dim=2)
+        spo2 = self.spo2_model(concat)[:, 0]
+
+        mel_prob = mel_prob.reshape(batch, self.seq_len, -1)[:, -1]
+        thickness_prob = thickness_prob.reshape(batch, self.seq_len, -1)[:, -1]
+
+        mel_value = self.mel_regression(mel_prob)[:, 0]
+        thickness_value = self.thickness_regression(thickness_prob)[:, 0]
+
+        return spo2, mel_prob, thickness_prob, mel_value, thickness_value
+
+
+def load_regression_models(device='cpu', weight_dir=None):
+    if weight_dir is None:
+        weight_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'result', 'Classify_Weight')
+
+    regression_models = []
+    for cl, prior_dir in PRIOR_WEIGHT_DIR.items():
+        regression_model = Regression(cl_mode=cl).to(device)
+        regression_model.load_state_dict(torch.load(os.path.join(weight_dir, prior_dir, 'regression_weight_data'), map_location=device))
+        regression_model.eval()
+        regression_models.append(regression_model)
+
+    return regression_models
+
+
+def build_bundle(spo2_weight, feature_size=25, hidden_size=30, seq_len=100, mv_window=30, fuse_stage1=True):
+    '''
+    weight 파일로 eager Spo2InferenceBundle 생성 (Script 전, 양자화 등에 사용)
+    fuse_stage1 : 멜라닌, 피부두께 Model 을 FusedStage1 로 묶음 (False 이면 nn.Linear 그대로, 양자화용)
+    '''
+    spo2_model = VitalSign_Spo2(feature_size=feature_size, hidden_size=hidden_size, seq_len=seq_len)
+    spo2_model.load_state_dict(torch.load(spo2_weight, map_location='cpu'))
+
+    prior_models = load_prior_models('cpu')
+    stage1 = load_stage1('cpu', prior_models=prior_models) if fuse_stage1 == True else Stage1(prior_models)
+
+    bundle = Spo2InferenceBundle(spo2_model, stage1, load_regression_models('cpu'), mv_window=mv_window)
+    bundle.eval()
+    return bundle
+
+
+def save_bundle(bundle, out_path, metadata=None):
+    '''
+    Script 후 freeze (weight 상수화) + optimize_for_inference 로 CPU 호출 overhead 를 줄이고 metadata 와 함께 저장
+    '''
+    scripted = torch.jit.script(bundle)
+    scripted = torch.jit.optimize_for_inference(torch.jit.freeze(scripted, preserved_attrs=['reflectance_to_absorbance']))
+
+    metadata = dict(metadata) if metadata is not None else {}
+    metadata.update({
+        'prior_weight': PRIOR_WEIGHT_DIR,
+        'seq_len': bundle.seq_len,
+        'mv_window': bundle.mv_window,
+        'k_coef': list(K_COEF),
+        'input': 'absorbance (batch, L >= seq_len, 14)',
+        'output': ['spo2', 'mel_prob', 'thickness_prob', 'mel_value', 'thickness_value'],
+    })
+    torch.jit.save(scripted, out_path, _extra_files={'metadata.json': json.dumps(metadata)})
+
+    print("Save Inference Bundle : {}".format(out_path))
+    return scripted
+
+
+def export_bundle(spo2_weight, out_path, feature_size=25, hidden_size=30, seq_len=100, mv_window=30, num_threads=None):
+    '''
+    spo2_weight : VitalSign_Spo2 weight 파일, out_path : 저장할 TorchScript 파일
+    '''
+    bundle = build_bundle(spo2_weight, feature_size, hidden_size, seq_len, mv_window)
+
+    metadata = {
+        'spo2_weight': os.path.basename(spo2_weight),
+        'feature_size': feature_size,
+        'hidden_size': hidden_size,
+        'num_threads': num_threads,
+    }
+    return save_bundle(bundle, out_path, metadata)
+
+
+def load_bundle(path, num_threads=None):
+    '''저장된 Bundle 과 metadata 를 읽음 (Python Model 정의 불필요)'''
+    extra_files = {'metadata.json': ''}
+    bundle = torch.jit.load(path, map_location='cpu', _extra_files=extra_files)
+    metadata = json.loads(extra_files['metadata.json'])
+
+    if num_threads is None:
+        num_threads = metadata.get('num_threads')
+    if num_threads is not None:
+        torch.set_num_threads(num_threads)
+
+    # 첫 호출의 Graph 최적화를 미리 수행
+    with torch.no_grad():
+        for _ in range(2):
+            bundle(torch.ones(1, metadata['seq_len'] + metadata['mv_window'], 14))
+
+    return bundle, metadata
+
+
+if __name__ == '__main__':
+    seq_len = 100
+    hidden_size = 30
+    roi = 'forehead'
+
+    path = os.path.dirname(os.path.abspath(__file__))
+    save_dir = "vitalsign_0408_predict_spo2_lstm_l2_dropno_dataset1_{}_seq{}_hidden{}".format(roi, seq_len, hidden_size)
+
+    spo2_weight = os.path.join(path, 'result', save_dir, 'weight_data2')
+    out_path = os.path.join(path, 'result', save_dir, 'spo2_bundle.pt')
+
+    export_bundle(spo2_weight, out_path, feature_size=25, hidden_size=hidden_size, seq_len=seq_len)
+
+    start = time.perf_counter()
+    bundle, metadata = load_bundle(out_path)
+    print("Load Inference Bundle : {:.1f} ms".format((time.perf_counter() - start) * 1000))
+    print(metadata)
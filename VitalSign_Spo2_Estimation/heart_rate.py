@@ -0,0 +1,130 @@
+import numpy as np
+
+from signal_filter import butter_bandpass, StreamingFilter
+from signal_quality import band_snr
+
+'''
+실시간 심박수 (BPM) 추정
+30 fps Absorbance sample 이 들어올 때마다 선택한 band, ROI 신호를 Bandpass filter 하고
+최근 window 의 spectrum 을 sliding DFT 로 갱신해서 (sample 당 계산량이 window 길이와 무관),
+update_interval 마다 모든 channel 의 power 를 합친 spectrum 의 0.5 ~ 3 Hz peak 를 BPM 으로 출력함.
+'''
+
+PULSE_BAND = (0.5, 3.0)
+
+
+class SlidingDFT(object):
+    '''
+    최근 window 개 sample 의 DTFT 를 freqs (Hz) 위치에서 sample 마다 갱신
+    X(n) = x(n) + e^{-jw} X(n-1) - e^{-jwN} x(n-N) 는 정수 bin 이 아닌 frequency 에서도 정확하므로
+    FFT (0.1 Hz 간격, 10초 window) 보다 촘촘한 격자를 쓸 수 있음.
+    float 반올림 오차가 쌓이지 않도록 resync_interval sample 마다 buffer 로 다시 계산함.
+    '''
+    def __init__(self, freqs, fs, window, channel_shape=(), resync_interval=None):
+        self.freqs = np.asarray(freqs, dtype=np.float64)
+        self.window = window
+        self.channel_shape = tuple(channel_shape)
+        self.resync_interval = resync_interval if resync_interval is not None else window
+
+        omega = 2 * np.pi * self.freqs / fs
+        expand = (slice(None),) + (np.newaxis,) * len(self.channel_shape)
+        self.rotate = np.exp(-1j * omega)[expand]
+        self.rotate_out = np.exp(-1j * omega * window)[expand]
+
+        # resync 용 (freq, window) 계수, buffer 는 오래된 sample 부터 순서대로
+        self.basis = np.exp(-1j * omega[:, np.newaxis] * np.arange(window - 1, -1, -1))
+
+        self.reset()
+
+    def reset(self):
+        self.buffer = np.zeros((self.window,) + self.channel_shape)
+        self.spectrum = np.zeros((len(self.freqs),) + self.channel_shape, dtype=np.complex128)
+        self.count = 0
+
+    def update(self, x):
+        pos = self.count % self.window
+        x_out = self.buffer[pos].copy()
+        self.buffer[pos] = x
+        self.count += 1
+
+        self.spectrum = x + self.rotate * self.spectrum - self.rotate_out * x_out
+
+        if self.count % self.resync_interval == 0:
+            self.resync()
+
+    def resync(self):
+        pos = self.count % self.window
+        ordered = np.concatenate([self.buffer[pos:], self.buffer[:pos]], axis=0)
+        self.spectrum = np.tensordot(self.basis, ordered, axes=(1, 0))
+
+    @property
+    def full(self):
+        return self.count >= self.window
+
+    def power(self):
+        return np.abs(self.spectrum) ** 2
+
+
+def spectrum_peak(freqs, power):
+    '''
+    power : (freq, channel...) -> 모든 channel 을 합친 spectrum 의 peak frequency (parabolic 보간), peak 비율
+    peak 비율 : peak 주변 (±1 격자) power / 전체 power, 신호가 주기적일수록 1 에 가까움
+    '''
+    total = power.reshape(len(freqs), -1).sum(axis=1)
+    k = int(np.argmax(total))
+
+    peak_freq = freqs[k]
+    if 0 < k < len(freqs) - 1:
+        y0, y1, y2 = total[k - 1], total[k], total[k + 1]
+        denom = y0 - 2 * y1 + y2
+        if denom < 0:
+            peak_freq = freqs[k] + 0.5 * (y0 - y2) / denom * (freqs[1] - freqs[0])
+
+    ratio = total[max(k - 1, 0):k + 2].sum() / max(total.sum(), 1e-30)
+    return float(peak_freq), float(ratio)
+
+
+class HeartRateEstimator(object):
+    '''
+    sample : (n_roi, 14) 또는 (14,) Absorbance (fps 간격)
+    bands : 사용할 band index, window_sec : spectrum window 길이, freq_step : frequency 격자 간격 (Hz)
+    update_interval : BPM 출력 간격 (초)
+    '''
+    def __init__(self, fps=30, sample_shape=(14,), bands=(6,), window_sec=10, band=PULSE_BAND, freq_step=0.02,
+                 update_interval=1.0, filter_order=5):
+        self.fps = fps
+        self.bands = list(bands)
+        self.window = int(round(window_sec * fps))
+        self.update_every = max(1, int(round(update_interval * fps)))
+
+        channel_shape = tuple(sample_shape[:-1]) + (len(self.bands),)
+        self.freqs = np.arange(band[0], band[1] + freq_step / 2, freq_step)
+
+        self.filter = StreamingFilter(butter_bandpass(band[0], band[1], fps, filter_order), channel_shape, steady_state=True)
+        self.sdft = SlidingDFT(self.freqs, fps, self.window, channel_shape)
+
+        self.reset()
+
+    def reset(self):
+        self.filter.reset()
+        self.sdft.reset()
+        self.latest = None
+
+    def push(self, sample):
+        '''return : 새 추정값 {'bpm', 'peak_ratio', 'channel_bpm', 'channel_snr' (dB)} 또는 None (아직 window 가 안 찼거나 출력 시점이 아님)'''
+        x = self.filter.process_sample(np.asarray(sample)[..., self.bands])
+        self.sdft.update(x)
+
+        if self.sdft.full == False or (self.sdft.count - self.window) % self.update_every != 0:
+            return None
+
+        power = self.sdft.power()
+        peak_freq, ratio = spectrum_peak(self.freqs, power)
+
+        self.latest = {
+            'bpm': peak_freq * 60,
+            'peak_ratio': ratio,
+            'channel_bpm': self.freqs[np.argmax(power, axis=0)] * 60,
+            'channel_snr': band_snr(power),
+        }
+        return self.latest
@@ -0,0 +1,148 @@
+import numpy as np
+import os
+import sys
+
+import torch
+import torch.nn as nn
+import torch.optim as optim
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'VitalSign_Probability_Regression'))
+from train_util import build_scheduler, scheduler_step, build_early_stopping, Checkpointer, AsyncValidator, config_fingerprint
+
+'''
+VitalSign_Spo2 (LSTM) Model 공통 학습 Loop
+Learning rate는 Optimizer를 새로 만들지 않고 lr_schedule(train_util.build_scheduler)로 변경함.
+checkpoint_interval epoch 마다 <lstm_path1>_checkpoint 를 저장하고, resume == True 이면 이어서 학습함 (설정이 바뀌었으면 처음부터).
+Test data Loss는 weight snapshot으로 별도 Thread에서 계산하므로 (async_validation) Validation 중에도 학습이 계속됨.
+'''
+
+# 학습 Script 별 설정. min_test_loss : Test Loss가 이 값보다 클 때만 weight_data2 저장
+#                   early_stopping : Test Loss 기준 조기 종료 (train_util.EarlyStopping, patience는 epoch 단위)
+#                   checkpoint_interval : 학습 재개용 Checkpoint 저장 주기 (epoch)
+#                   async_validation : Test Loss를 별도 Thread에서 계산 (기본 True)
+LSTM_TRAIN_CONFIG = {
+    'dataset1': {'epochs': 5000, 'lr': 0.03,
+                 'lr_schedule': {'type': 'multistep', 'milestones': {300: 0.001, 1000: 0.0005, 2000: 0.0003, 3000: 0.0001, 4000: 0.00005}},
+                 'early_stopping': {'patience': 1000, 'min_delta': 0.0}, 'checkpoint_interval': 100},
+    'dataset1_crossvalidation': {'epochs': 1000, 'lr': 0.001, 'min_test_loss': 0.5,
+                                 'lr_schedule': {'type': 'multistep', 'milestones': {300: 0.001, 1000: 0.0005, 2000: 0.0003, 3000: 0.0001, 4000: 0.00005}},
+                                 'early_stopping': {'patience': 300, 'min_delta': 0.0}, 'checkpoint_interval': 100},
+    'dataset2': {'epochs': 30000, 'lr': 0.03,
+                 'lr_schedule': {'type': 'multistep', 'milestones': {300: 0.001, 1000: 0.00005, 2000: 0.0003, 3000: 0.0001, 20000: 0.00002}},
+                 'early_stopping': {'patience': 3000, 'min_delta': 0.0}, 'checkpoint_interval': 500},
+}
+
+
+def train_spo2_lstm(spo2_model, data_loader, test_data_loader, config, lstm_path1, lstm_path2, use_mel_thick=True, resume=True):
+    '''
+    data_loader batch : (input_data, input_concat_data, input_ref, ppg_data, spo2_data, ...)
+    lstm_path1 : Training Loss 최소일 때 저장, lstm_path2 : Test Loss 최소일 때 저장
+    '''
+    # 학습을 위한 Optimizer 선언
+    optimizer = optim.Adam(spo2_model.parameters(), lr=config['lr'])
+    scheduler = build_scheduler(optimizer, config.get('lr_schedule'))
+    stopper = build_early_stopping(config.get('early_stopping'))
+
+    # Loss Function
+    criterion = nn.MSELoss()
+
+    fingerprint = config_fingerprint({'config': config, 'use_mel_thick': use_mel_thick})
+    ckpt = Checkpointer(lstm_path1 + '_checkpoint', config.get('checkpoint_interval', 100), resume, fingerprint)
+    metrics = ckpt.load(spo2_model, optimizer, scheduler, stopper)
+
+    best = {'best_loss': metrics.get('best_loss', 700),
+            'best_test_loss': metrics.get('best_test_loss', 700)}
+    epochs = config['epochs']
+    min_test_loss = config.get('min_test_loss', 0)
+
+    def validate(model):
+        running_test_loss = []
+        for batch_t in test_data_loader:
+            input_data_t, input_concat_data_t, spo2_data_t = batch_t[0], batch_t[1], batch_t[4]
+            if use_mel_thick == True:
+                pred_spo2_t = model(input_concat_data_t)
+            else:
+                pred_spo2_t = model(input_data_t)
+
+            pred_spo2_t = torch.squeeze(pred_spo2_t)
+            spo2_data_t = spo2_data_t[:, -1]
+
+            test_loss = criterion(pred_spo2_t, spo2_data_t)
+
+            running_test_loss.append(test_loss.detach().cpu().numpy())
+
+        return np.mean(running_test_loss)
+
+    def report(epoch, mean_loss, mean_test_loss, state):
+        '''Test Loss가 도착하면 Model Save, 학습을 멈춰야 하면 True'''
+        if mean_loss < best['best_loss']:
+            best['best_loss'] = mean_loss
+            print("Epoch: {}/{} - Loss: {:.4f} , Test Loss: {:.4f} (Save Model)".format(epoch + 1, epochs, mean_loss, mean_test_loss))
+            torch.save(state, lstm_path1)
+
+        else:
+            print("Epoch: {}/{} - Loss: {:.4f} , Test Loss: {:.4f}".format(epoch + 1, epochs, mean_loss, mean_test_loss))
+
+        if mean_test_loss < best['best_test_loss'] and mean_test_loss > min_test_loss:
+            best['best_test_loss'] = mean_test_loss
+            torch.save(state, lstm_path2)
+            print("[Save Feature Netwrok 2]")
+
+        scheduler_step(scheduler, mean_test_loss)
+
+        if stopper is not None and stopper.step(mean_test_loss, epoch, state=state):
+            print("Early Stopping at Epoch {}/{} : {}".format(epoch + 1, epochs, stopper.reason))
+            return True
+        return False
+
+    validator = AsyncValidator(spo2_model, validate, asynchronous=config.get('async_validation', True))
+    stop = False
+
+    # Start Train
+    for epoch in ckpt.epoch_range(epochs):
+        running_loss = []
+        for batch in data_loader:
+            input_data, input_concat_data, spo2_data = batch[0], batch[1], batch[4]
+            spo2_model.train()
+
+            if use_mel_thick == True:
+                pred_spo2 = spo2_model(input_concat_data)
+            else:
+                pred_spo2 = spo2_model(input_data)
+
+            pred_spo2 = torch.squeeze(pred_spo2)
+            spo2_data = spo2_data[:, -1]
+
+            loss = criterion(pred_spo2, spo2_data)
+
+            optimizer.zero_grad()
+            loss.backward()
+            optimizer.step()
+
+            running_loss.append(loss.detach().cpu().numpy())
+
+        # 10 Epoch 단위로 Test data에 대한 Loss를 확인하고 Model을 Save함.
+        if epoch % 10 == 0:
+            validator.submit(epoch, spo2_model, np.mean(running_loss))
+
+        for v_epoch, mean_loss, mean_test_loss, state in validator.poll():
+            if stop == False:
+                stop = report(v_epoch, mean_loss, mean_test_loss, state)
+
+        if stop:
+            break
+
+        scheduler_step(scheduler)
+        ckpt.step(epoch, spo2_model, optimizer, scheduler, stopper, best)
+
+    for v_epoch, mean_loss, mean_test_loss, state in validator.drain():
+        if stop == False:
+            stop = report(v_epoch, mean_loss, mean_test_loss, state)
+    validator.close()
+
+    ckpt.finish(spo2_model, optimizer, scheduler, stopper, best)
+
+    if stopper is not None:
+        stopper.restore(spo2_model)
+
+    return spo2_model
@@ -0,0 +1,498 @@
+import numpy as np
+import os
+import queue
+import threading
+import time
+
+import torch
+
+from calibration import load_calibration, calibration_vectors
+from heart_rate import HeartRateEstimator
+from signal_quality import clipping_fraction, SignalQualityMonitor
+from session_reader import ROI_FILE, K_COEF, default_data_dir, read_measurement_elapsed_time, load_stage1, session_cube
+from spo2_fusion import CPF_ROI_LIST, CPFFusion
+from spo2_model import VitalSign_Spo2, GroupedSpo2
+
+'''
+Hyperspectral frame -> Spo2 실시간 추정 Pipeline
+frame source -> ROI 평균 -> 30 fps Resampling -> Absorbance (shading 보정) -> (심박수) -> (신호 품질) -> 멜라닌/피부두께 확률분포 -> LSTM -> CPF Fusion
+각 단계는 Thread 하나이고 크기가 정해진 Queue로 연결됨 (뒤 단계가 느리면 앞 단계가 기다림).
+ROI 여러 곳은 모든 단계에서 (n_roi, ...) 배열로 함께 계산함.
+Resampling을 Absorbance보다 먼저 하는 것은 session_reader (dataset1) 와 같은 값을 얻기 위해서임.
+'''
+
+
+class RingBuffer(object):
+    '''최근 capacity 개 sample 저장 (sample shape 고정)'''
+    def __init__(self, capacity, shape, dtype=np.float32):
+        self.capacity = capacity
+        self.data = np.zeros((capacity,) + tuple(shape), dtype=dtype)
+        self.count = 0
+
+    def append(self, x):
+        self.data[self.count % self.capacity] = x
+        self.count += 1
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def view(self):
+        '''오래된 sample 부터 순서대로 (len, ...) 복사본'''
+        if self.count <= self.capacity:
+            return self.data[:self.count].copy()
+        start = self.count % self.capacity
+        return np.concatenate([self.data[start:], self.data[:start]], axis=0)
+
+    def reset(self):
+        self.count = 0
+
+
+class SessionState(object):
+    '''
+    Session 하나의 Streaming 상태 (30 fps Absorbance sample 단위)
+    - moving_average : dataset1 과 같이 이전 mv_window 개 Absorbance 평균 (그 전에는 현재 값)
+    - push_input : LSTM 입력 (concat) 을 쌓고, dataset1 Sequence 위치 (1, 1 + stride, ..., seq_len 이상) 이면 window 반환
+    shape : sample 앞쪽 shape (ROI 여러 곳이면 (n_roi,), 하나면 ())
+    '''
+    def __init__(self, shape=(), seq_len=100, mv_window=30, stride=3, n_band=14, n_input=25):
+        self.mv_window = mv_window
+        self.seq_len = seq_len
+        self.stride = stride
+
+        self.abs_buffer = RingBuffer(mv_window, tuple(shape) + (n_band,), np.float64)
+        self.abs_sum = np.zeros(tuple(shape) + (n_band,))
+        self.seq_buffer = RingBuffer(seq_len, tuple(shape) + (n_input,))
+        self.sample_count = 0
+
+    def moving_average(self, absorption):
+        if self.abs_buffer.count < self.mv_window:
+            mf_absorption = absorption
+        else:
+            mf_absorption = self.abs_sum / self.mv_window
+            self.abs_sum -= self.abs_buffer.data[self.abs_buffer.count % self.mv_window]
+
+        self.abs_buffer.append(absorption)
+        self.abs_sum += absorption
+        return mf_absorption
+
+    def push_input(self, concat):
+        '''return : (seq_len, ...) window 또는 None'''
+        self.seq_buffer.append(concat)
+        i = self.sample_count
+        self.sample_count += 1
+
+        if i < self.seq_len or (i - 1) % self.stride != 0:
+            return None
+        return self.seq_buffer.view()
+
+
+class ReplaySource(object):
+    '''
+    기록된 Session (re_<roi>_human.npy, time_stamp.csv) 을 기록된 시간 간격으로 재생하는 frame source
+    speed : 재생 속도 배율 (None 이면 기다리지 않고 최대 속도)
+    calibration : Session 의 calibration.json ({roi: CalibrationProfile}, 없으면 {}), Pipeline 에 넘겨서 ROI 평균에 적용
+    frame : {'time': 측정 시작 후 시간 (초), 'cube': {roi: (band, h, w)}}
+    '''
+    def __init__(self, session, roi_list=CPF_ROI_LIST, data_dir=None, speed=1.0, time_end=None):
+        if data_dir is None:
+            data_dir = default_data_dir()
+        session_dir = os.path.join(data_dir, session)
+
+        self.roi_list = roi_list
+        self.speed = speed
+        self.measure_time = read_measurement_elapsed_time(session_dir)
+        self.camera, self.calibration = load_calibration(session_dir)
+        self.cubes = {roi: session_cube(session_dir, ROI_FILE[roi]) for roi in roi_list}
+
+        self.n_frames = min([len(self.measure_time)] + [len(c) for c in self.cubes.values()])
+        if time_end is not None:
+            self.n_frames = min(self.n_frames, int(np.searchsorted(self.measure_time, time_end + 1, side='right')))
+
+    def __iter__(self):
+        start = time.perf_counter()
+        for i in range(self.n_frames):
+            t = float(self.measure_time[i])
+            if self.speed is not None:
+                delay = start + t / self.speed - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+
+            yield {'time': t, 'cube': {roi: self.cubes[roi][i] for roi in self.roi_list}}
+
+
+class StageStats(object):
+    '''단계별 처리 시간, 입력 Queue 대기 시간 (초)'''
+    def __init__(self, name):
+        self.name = name
+        self.process = []
+        self.wait = []
+        self.count = 0
+
+    def summary(self):
+        if len(self.process) == 0:
+            return "{:>10} : no data".format(self.name)
+        process = np.array(self.process) * 1000
+        wait = np.array(self.wait) * 1000
+        return "{:>10} : {} items , process mean {:.3f} ms / p95 {:.3f} ms , queue wait mean {:.3f} ms".format(
+            self.name, self.count, process.mean(), np.percentile(process, 95), wait.mean())
+
+
+class Stage(threading.Thread):
+    '''
+    fn(item) -> 다음 단계로 보낼 item list
+    None 을 받으면 (입력 종료) 다음 단계에 None 을 전달하고 종료
+    stop : Pipeline 공통 Event, 어느 단계든 오류가 나면 set 되고 모든 단계는 그 뒤 item 을 처리하지 않고 버림
+           (입력 Queue 는 None 까지 계속 비우므로 앞 단계와 frame 을 넣는 쪽이 가득 찬 Queue 에서 멈추지 않음)
+    '''
+    def __init__(self, name, fn, in_queue, out_queue, stop):
+        super(Stage, self).__init__(name=name, daemon=True)
+        self.fn = fn
+        self.in_queue = in_queue
+        self.out_queue = out_queue
+        self.stop = stop
+        self.stats = StageStats(name)
+        self.error = None
+
+    def run(self):
+        try:
+            while True:
+                t0 = time.perf_counter()
+                item = self.in_queue.get()
+                t1 = time.perf_counter()
+
+                if item is None:
+                    break
+                if self.stop.is_set():
+                    continue
+
+                try:
+                    outputs = self.fn(item)
+                except Exception as e:
+                    self.error = e
+                    self.stop.set()
+                    continue
+                t2 = time.perf_counter()
+
+                self.stats.wait.append(t1 - t0)
+                self.stats.process.append(t2 - t1)
+                self.stats.count += 1
+
+                for out in outputs:
+                    self.out_queue.put(out)
+        finally:
+            self.out_queue.put(None)
+
+
+class RealtimeSpo2Pipeline(object):
+    '''
+    models : ROI 순서대로 VitalSign_Spo2 (멜라닌, 피부두께 확률분포 입력, feature_size 25)
+    cov : CPF 공분산 (n_roi, n_roi), 없으면 최근 fusion_window 개 추정값의 ROI 중앙값 잔차로 계산 (spo2_fusion.sliding_covariance)
+    stride : 추정 간격 (sample), dataset1 Sequence 와 같은 위치 (1, 1 + stride, ...) 에서 추정
+    heart_rate : HeartRateEstimator (sample_shape (n_roi, 14)), 있으면 Absorbance 로 심박수도 추정해서 결과에 최신 BPM 을 붙임
+    quality : SignalQualityMonitor (n_roi, seq_len 같게), 있으면 LSTM window 품질이 낮은 ROI 는 LSTM 추론을 건너뛰고
+              Fusion 에서 뺌 (그 ROI 의 roi_spo2 는 마지막 추정값 유지), 모든 ROI 가 쓸 수 없는 window 는 결과 없음
+    calibration : {roi: CalibrationProfile}, ROI 평균 단계에서 band gain / offset 을 (n_roi, 14) 에 한 번에 적용
+    '''
+    def __init__(self, models, roi_list=CPF_ROI_LIST, prior_models=None, cov=None, fusion_window=30,
+                 set_fps=30, mv_window=30, stride=3, queue_size=64, device='cpu', heart_rate=None, quality=None,
+                 calibration=None):
+        self.roi_list = roi_list
+        self.n_roi = len(roi_list)
+        self.set_fps = set_fps
+        self.mv_window = mv_window
+        self.stride = stride
+        self.queue_size = queue_size
+        self.device = device
+
+        self.models = list(models)
+        self.spo2_model = GroupedSpo2(self.models).to(device)
+        self.spo2_model.eval()
+        # 쓸 수 있는 ROI 조합 별 GroupedSpo2 (품질 판정으로 일부 ROI 만 추론할 때, 처음 쓰일 때 만듦)
+        self.subset_models = {tuple(range(self.n_roi)): self.spo2_model}
+        self.seq_len = self.spo2_model.seq_len
+
+        self.stage1 = load_stage1(device, prior_models=prior_models)
+        self.fusion = CPFFusion(n_roi=self.n_roi, cov=cov, window=fusion_window)
+        self.hr_estimator = heart_rate
+        self.quality_monitor = quality
+
+        self.calibration = None
+        if calibration:
+            self.calibration = calibration_vectors(calibration, roi_list)
+
+        self.reset()
+
+    def reset(self):
+        '''새 Session 시작 (Resampling, 이동평균, LSTM 입력 Buffer, Fusion 상태 초기화)'''
+        self.prev_sample = None
+        self.next_index = 0
+
+        self.state = SessionState((self.n_roi,), self.seq_len, self.mv_window, self.stride)
+
+        self.fusion.reset()
+        if self.hr_estimator is not None:
+            self.hr_estimator.reset()
+        if self.quality_monitor is not None:
+            self.quality_monitor.reset()
+
+        self.probs = None
+        self.skipped = 0
+        self.roi_skipped = np.zeros(self.n_roi, dtype=np.int64)
+        self.last_roi_spo2 = None
+
+    ############# 단계별 계산 (Queue item 하나 -> 다음 단계 item list) ###################
+    def roi_mean(self, item):
+        # (n_roi, 14) ROI 영역 평균
+        cubes = [np.reshape(np.asarray(item['cube'][roi][:14]), (14, -1)) for roi in self.roi_list]
+        reflect = np.stack([cube.mean(axis=1) for cube in cubes])
+        if self.calibration is not None:
+            gain, offset = self.calibration
+            reflect = reflect * gain + offset
+
+        out = {'time': item['time'], 'reflect': reflect, 'captured': item['captured']}
+
+        if self.quality_monitor is not None:
+            out['clip'] = np.array([clipping_fraction(cube) for cube in cubes])
+        return [out]
+
+    def resample(self, item):
+        '''이전 frame 과 현재 frame 사이에 있는 set_fps 격자 시점을 선형보간 (첫 frame 시간 = 0)'''
+        outputs = []
+        t, reflect = item['time'], item['reflect']
+
+        if self.prev_sample is None:
+            self.prev_sample = (t, reflect)
+
+        t_prev, reflect_prev = self.prev_sample
+        while self.next_index / self.set_fps <= t:
+            ts = self.next_index / self.set_fps
+            if t > t_prev:
+                w = (ts - t_prev) / (t - t_prev)
+                sample = reflect_prev + (reflect - reflect_prev) * max(w, 0.0)
+            else:
+                sample = reflect
+
+            out = {'time': ts, 'reflect': sample, 'captured': item['captured'], 'gap': t - t_prev}
+            if 'clip' in item:
+                out['clip'] = item['clip']
+            outputs.append(out)
+            self.next_index += 1
+
+        self.prev_sample = (t, reflect)
+        return outputs
+
+    def absorbance(self, item):
+        a, b, c, d = K_COEF
+        log_ref = -np.log(item['reflect'])
+        k = (a * log_ref[:, 0] + b * log_ref[:, 6] + c * log_ref[:, 13] + d) / (a + b + c)
+
+        item['absorbance'] = log_ref - k[:, np.newaxis]
+        return [item]
+
+    def heart_rate(self, item):
+        '''sample 마다 spectrum 을 갱신, BPM 은 HeartRateEstimator 의 update_interval 마다 바뀜'''
+        self.hr_estimator.push(item['absorbance'])
+
+        latest = self.hr_estimator.latest
+        item['bpm'] = latest['bpm'] if latest is not None else None
+        return [item]
+
+    def signal_quality(self, item):
+        '''sample 별 clipping, frame 간격, 움직임, (심박수 SNR) 로 ROI 별 LSTM window 품질을 갱신'''
+        snr = None
+        if self.hr_estimator is not None and self.hr_estimator.latest is not None:
+            # (n_roi, band) -> ROI 별 평균
+            snr = self.hr_estimator.latest['channel_snr'].mean(axis=-1)
+
+        monitor = self.quality_monitor
+        item['quality'] = monitor.update(item['clip'], item['gap'], item['absorbance'], snr)
+        item['sample_bad'] = monitor.last_flags()
+        return [item]
+
+    def prior(self, item):
+        '''
+        이동평균한 Absorbance 로 멜라닌, 피부두께 확률분포를 구하고 LSTM 입력 (n_roi, 25) 를 만듦
+        모든 ROI 가 나쁜 sample 이면 stage 1 을 건너뛰고 이전 확률분포를 다시 씀
+        '''
+        absorption = item['absorbance']
+        mf_absorption = self.state.moving_average(absorption)
+
+        if self.probs is None or 'sample_bad' not in item or np.all(item['sample_bad']) == False:
+            x = torch.as_tensor(mf_absorption, dtype=torch.float32, device=self.device)
+            with torch.no_grad():
+                self.probs = [torch.softmax(out, dim=1).cpu().numpy() for out in self.stage1(x)]
+
+        item['concat'] = np.concatenate([absorption.astype(np.float32)] + self.probs, axis=1)
+        return [item]
+
+    def roi_model(self, roi_index):
+        '''roi_index (tuple) ROI 들만 한 번의 LSTM 호출로 계산하는 GroupedSpo2'''
+        if roi_index not in self.subset_models:
+            model = GroupedSpo2([self.models[r] for r in roi_index]).to(self.device)
+            model.eval()
+            self.subset_models[roi_index] = model
+        return self.subset_models[roi_index]
+
+    def lstm(self, item):
+        '''
+        최근 seq_len 개 입력으로 ROI 별 Spo2 추정 (쓸 수 있는 ROI 한 번에)
+        window 품질이 낮은 ROI 는 추론하지 않고 마지막 추정값 (처음이면 추론한 ROI 들의 중앙값) 을 유지함
+        '''
+        window = self.state.push_input(item['concat'])
+        if window is None:
+            return []
+
+        roi_index = tuple(range(self.n_roi))
+        if 'quality' in item:
+            usable = self.quality_monitor.usable(item['quality'])
+            if np.any(usable) == False:
+                self.skipped += 1
+                return []
+            self.roi_skipped += ~usable
+            item['roi_usable'] = usable
+            roi_index = tuple(np.flatnonzero(usable).tolist())
+
+        window = torch.as_tensor(window, device=self.device)
+        with torch.no_grad():
+            pred = self.roi_model(roi_index)([window[:, r].unsqueeze(0) for r in roi_index])[0]
+        pred = pred.cpu().numpy().astype(np.float64)
+
+        if self.last_roi_spo2 is None:
+            roi_spo2 = np.full(self.n_roi, np.median(pred))
+        else:
+            roi_spo2 = self.last_roi_spo2.copy()
+        roi_spo2[list(roi_index)] = pred
+        self.last_roi_spo2 = roi_spo2
+
+        item['roi_spo2'] = roi_spo2.copy()
+        return [item]
+
+    def fuse(self, item):
+        quality = None
+        if 'quality' in item:
+            # window 품질이 min_quality 보다 낮은 ROI (LSTM 추론을 건너뜀) 는 weight 0
+            quality = item['quality'] * item['roi_usable']
+        item['spo2'], item['spo2_var'] = self.fusion.update(item['roi_spo2'], quality=quality)
+        item['latency'] = time.perf_counter() - item['captured']
+        return [item]
+
+    ############# 실행 ###################
+    def run(self, source, on_result=None):
+        '''
+        source 의 frame 을 모두 처리하고 결과 list 반환
+        결과 : {'time', 'spo2', 'spo2_var', 'roi_spo2', 'bpm' (심박수 미사용 또는 아직 없으면 None),
+                'quality' (ROI 별 window 품질, 품질 판정 미사용이면 None), 'latency'(frame 입력 -> Fusion 결과, 초)}
+        '''
+        self.reset()
+
+        stage_fns = [('roi_mean', self.roi_mean), ('resample', self.resample), ('absorbance', self.absorbance)]
+        if self.hr_estimator is not None:
+            stage_fns.append(('heart_rate', self.heart_rate))
+        if self.quality_monitor is not None:
+            stage_fns.append(('quality', self.signal_quality))
+        stage_fns += [('prior', self.prior), ('lstm', self.lstm), ('fusion', self.fuse)]
+
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in range(len(stage_fns) + 1)]
+        stop = threading.Event()
+        self.stages = [Stage(name, fn, queues[si], queues[si + 1], stop) for si, (name, fn) in enumerate(stage_fns)]
+        for stage in self.stages:
+            stage.start()
+
+        results = []
+        collect_error = []
+
+        def collect():
+            while True:
+                item = queues[-1].get()
+                if item is None:
+                    break
+                if stop.is_set():
+                    continue
+                result = {k: item[k] for k in ('time', 'spo2', 'spo2_var', 'roi_spo2', 'latency')}
+                result['bpm'] = item.get('bpm')
+                result['quality'] = item.get('quality')
+                results.append(result)
+                if on_result is not None:
+                    try:
+                        on_result(result)
+                    except Exception as e:
+                        collect_error.append(e)
+                        stop.set()
+
+        collector = threading.Thread(target=collect, daemon=True)
+        collector.start()
+
+        # 단계에서 오류가 나면 frame 을 더 넣지 않음 (source 에서 오류가 나도 None 을 넣어서 모든 Thread 가 끝나도록 함)
+        try:
+            for frame in source:
+                if stop.is_set():
+                    break
+                frame['captured'] = time.perf_counter()
+                queues[0].put(frame)
+        finally:
+            queues[0].put(None)
+
+        collector.join()
+        for stage in self.stages:
+            stage.join()
+        for stage in self.stages:
+            if stage.error is not None:
+                raise stage.error
+        if len(collect_error) > 0:
+            raise collect_error[0]
+
+        return results
+
+    def report(self, results=None):
+        print("************  Pipeline Latency  ************")
+        for stage in self.stages:
+            print(stage.stats.summary())
+
+        if results:
+            latency = np.array([r['latency'] for r in results]) * 1000
+            print("{:>10} : {} results , mean {:.3f} ms / p95 {:.3f} ms / max {:.3f} ms".format(
+                'end-to-end', len(results), latency.mean(), np.percentile(latency, 95), latency.max()))
+
+        if self.quality_monitor is not None:
+            print("{:>10} : {} windows skipped (no usable ROI)".format('quality', self.skipped))
+            print("{:>10} : ROI windows skipped {}".format('quality', dict(zip(self.roi_list, self.roi_skipped.tolist()))))
+
+
+if __name__ == '__main__':
+    use_gpu = False
+    device = 'cuda' if use_gpu == True else 'cpu'
+
+    seq_len = 100
+    hidden_size = 30
+
+    # 재생할 Session, 재생 속도 (1.0 : 기록된 시간 그대로, None : 최대 속도)
+    session = 'TPR1_ar'
+    speed = 1.0
+
+    path = os.path.dirname(os.path.abspath(__file__))
+
+    models = []
+    for roi in CPF_ROI_LIST:
+        save_dir = "vitalsign_0408_predict_spo2_lstm_l2_dropno_dataset1_{}_seq{}_hidden{}".format(roi, seq_len, hidden_size)
+        spo2_model = VitalSign_Spo2(feature_size=25, hidden_size=hidden_size, seq_len=seq_len)
+        spo2_model.load_state_dict(torch.load(os.path.join(path, 'result', save_dir, 'weight_data2'), map_location='cpu'))
+        models.append(spo2_model)
+
+    # 심박수 : 모든 ROI 의 band 6 신호, 10초 window, 1초마다 갱신
+    heart_rate = HeartRateEstimator(fps=30, sample_shape=(len(CPF_ROI_LIST), 14), bands=(6,), window_sec=10, update_interval=1.0)
+
+    # 신호 품질 : LSTM window 안 나쁜 sample 이 20% 를 넘는 ROI 는 LSTM 추론, Fusion 에서 제외
+    # 심박 대역 SNR (heart_rate 의 channel_snr) 이 min_snr dB 보다 낮으면 나쁜 sample (맥박이 보이는 신호는 약 0 dB, 잡음만 있으면 약 -10 dB)
+    quality = SignalQualityMonitor(n_roi=len(CPF_ROI_LIST), seq_len=seq_len, max_clip=0.05, max_gap=0.2, max_motion=0.05, min_snr=-5.0,
+                                   min_quality=0.8)
+
+    source = ReplaySource(session, speed=speed, time_end=160)
+    pipeline = RealtimeSpo2Pipeline(models, device=device, heart_rate=heart_rate, quality=quality, calibration=source.calibration)
+
+    def print_result(result):
+        bpm = "{:.1f}".format(result['bpm']) if result['bpm'] is not None else '-'
+        print("{:7.2f} s | Spo2 : {:.2f} (var {:.3f}) | BPM : {} | latency {:.1f} ms".format(result['time'], result['spo2'], result['spo2_var'],
+                                                                                           bpm, result['latency'] * 1000))
+
+    results = pipeline.run(source, on_result=print_result)
+    pipeline.report(results)
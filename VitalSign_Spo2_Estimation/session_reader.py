@@ -0,0 +1,310 @@
+import csv
+import numpy as np
+import os
+import sys
+
+import torch
+import torch.nn.functional as F
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'VitalSign_Probability_Regression'))
+from vitalsign_model import VitalSign_Feature_mel_thickness, Classifier, FusedStage1
+
+from calibration import load_calibration
+from cube_store import open_cube, cube_roi_mean
+from virtual_session import is_virtual_session, VirtualSession
+
+'''
+Dataset1 (check_data/total_data1/<session>) 전처리
+dataset1.ViatalSignDataset_ppg_lstm2.read_vitalsign_dataset 와 같은 계산을 Session 단위 numpy 연산으로 수행함.
+모든 Session을 한 번만 읽어서 이어 붙인 corpus를 만들고, Fold(Train/Test)는 corpus의 index로만 구분함.
+'''
+
+ROI_FILE = {
+    'forehead': 're_forehead_human.npy',
+    'ueye': 're_under_eye_human.npy',
+    'cheek': 're_cheek_human.npy',
+    'unose': 're_under_nose_human.npy',
+}
+
+# 멜라닌, 피부두께 확률분포 Model (dataset1 과 같은 weight)
+PRIOR_WEIGHT_DIR = {
+    'mel': 'vitalsign_mel_0104_prob_005_input14_m1_epoch5000_addinput3',
+    'thickness': 'vitalsign_thickness_0104_prob_005_input14_m1_epoch5000_addinput3',
+}
+
+# calculate_k 의 평면 계수
+K_COEF = (-54.540945783151464, 21.095479254243322, 78.56709080853545, -4.968144415839242)
+
+
+def default_data_dir():
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), 'check_data', 'total_data1')
+
+
+def _virtual_session(session_dir):
+    # segment 이름은 가상 Session 폴더의 상위 폴더 기준
+    data_dir = os.path.dirname(os.path.normpath(session_dir))
+    return VirtualSession(session_dir, lambda name: read_measurement_elapsed_time(os.path.join(data_dir, name))), data_dir
+
+
+def read_measurement_elapsed_time(session_dir):
+    if is_virtual_session(session_dir):
+        return _virtual_session(session_dir)[0].measurement_time()
+
+    measure_time = []
+    first_time = 0
+
+    with open(os.path.join(session_dir, 'time_stamp.csv'), encoding='utf-8') as f:
+        for line in csv.reader(f):
+            if line[0] != 'number' and line[0] != '':
+                str_time = line[1]
+                total_time = (int(str_time[-15:-13]) * 60 * 60 * 100000 + int(str_time[-12:-10]) * 60 * 100000
+                              + int(str_time[-9:-7]) * 100000 + int(str_time[-6:-1]))
+
+                if first_time == 0:
+                    first_time = total_time
+                measure_time.append((total_time - first_time) / 100000)
+
+    return np.array(measure_time)
+
+
+def read_pulse_sto(session_dir):
+    '''return : spo2 (1초 간격), pulse (1초 간격)'''
+    if is_virtual_session(session_dir):
+        virtual, data_dir = _virtual_session(session_dir)
+        return (virtual.series(lambda name: read_pulse_sto(os.path.join(data_dir, name))[0], 1),
+                virtual.series(lambda name: read_pulse_sto(os.path.join(data_dir, name))[1], 1))
+
+    spo2_list = []
+    pulse_list = []
+
+    with open(os.path.join(session_dir, 'pulse_sto.csv'), encoding='utf-8') as f:
+        for line in csv.reader(f):
+            if line[2] != 'SPO2' and line[2] != '':
+                spo2_list.append(int(line[2]))
+            if line[3] != 'PULSE' and line[3] != '':
+                pulse_list.append(int(line[3]))
+
+    return np.array(spo2_list), np.array(pulse_list)
+
+
+def read_ppg_data(session_dir):
+    '''return : ppg wave (60 Hz)'''
+    if is_virtual_session(session_dir):
+        virtual, data_dir = _virtual_session(session_dir)
+        return virtual.series(lambda name: read_ppg_data(os.path.join(data_dir, name)), 60)
+
+    ppg_wave = []
+
+    with open(os.path.join(session_dir, 'ppg_wave.csv'), encoding='utf-8') as f:
+        for line in csv.reader(f):
+            if line[0] != 'Wave':
+                ppg_wave.append(int(line[0]))
+
+    return np.array(ppg_wave)
+
+
+def session_cube(session_dir, roi_file):
+    '''Session 의 ROI cube (가상 Session 이면 VirtualCube, cube_store 로 변환했으면 CubeStore)'''
+    if is_virtual_session(session_dir):
+        virtual, data_dir = _virtual_session(session_dir)
+        return virtual.cube(lambda name: session_cube(os.path.join(data_dir, name), roi_file))
+    return open_cube(os.path.join(session_dir, roi_file))
+
+
+def read_session(session, roi='forehead', data_dir=None, set_fps=30, time_start=0, time_end=160, calibrate=True):
+    '''
+    Session 하나를 set_fps 로 Resampling
+    calibrate : Session 의 calibration.json 에 roi profile 이 있으면 ROI 평균에 적용
+    return : {'reflect': (T, 14), 'ppg': (T,), 'spo2': (T,), 'pulse': (T,)}
+    '''
+    if data_dir is None:
+        data_dir = default_data_dir()
+    session_dir = os.path.join(data_dir, session)
+
+    # ROI 영역 평균 (frame, 14), cube_store 로 변환한 Session 은 미리 계산한 평균을 읽음
+    roi_data = cube_roi_mean(session_cube(session_dir, ROI_FILE[roi]))
+
+    if calibrate == True:
+        _, profiles = load_calibration(session_dir)
+        if roi in profiles:
+            roi_data = profiles[roi].apply(roi_data)
+
+    measure_time = read_measurement_elapsed_time(session_dir)
+    gt_ppg = read_ppg_data(session_dir)
+    gt_spo2, gt_pulse = read_pulse_sto(session_dir)
+
+    start_idx = int(np.where(time_start - 1 <= measure_time)[0][0])
+    end_idx = int(np.where(measure_time <= time_end + 1)[0][-1])
+
+    sample_time = np.arange(time_start, time_end, (1 / set_fps))
+
+    measure_time = measure_time[start_idx:end_idx]
+    reflect = np.stack([np.interp(sample_time, measure_time, roi_data[start_idx:end_idx, wave]) for wave in range(14)], axis=1)
+
+    return {
+        'reflect': reflect,
+        'ppg': np.interp(sample_time, np.arange(len(gt_ppg)) * (1 / 60), gt_ppg),
+        'spo2': np.interp(sample_time, np.arange(len(gt_spo2)), gt_spo2),
+        'pulse': np.interp(sample_time, np.arange(len(gt_pulse)), gt_pulse),
+    }
+
+
+def absorbance(reflect):
+    '''calculate_k 로 구한 shading k 를 뺀 Absorbance (T, 14)'''
+    a, b, c, d = K_COEF
+    log_ref = -np.log(reflect)
+
+    # k = x - (x + t) = -t
+    k = (a * log_ref[:, 0] + b * log_ref[:, 6] + c * log_ref[:, 13] + d) / (a + b + c)
+
+    return log_ref - k[:, np.newaxis]
+
+
+def moving_average(x, window=30):
+    '''i >= window 이면 x[i-window:i] 의 평균, 그 전은 x[i] 그대로'''
+    out = np.array(x, copy=True)
+    if len(x) <= window:
+        return out
+
+    cumsum = np.concatenate([np.zeros((1,) + x.shape[1:]), np.cumsum(x, axis=0)], axis=0)
+    out[window:] = (cumsum[window:-1] - cumsum[:-window - 1]) / window
+    return out
+
+
+def load_prior_models(device='cpu', weight_dir=None):
+    '''멜라닌, 피부두께 (Feature Model, Classifier) list'''
+    if weight_dir is None:
+        weight_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'result', 'Classify_Weight')
+
+    prior_models = []
+    for cl, prior_dir in PRIOR_WEIGHT_DIR.items():
+        feature_model = VitalSign_Feature_mel_thickness().to(device)
+        classifier_model = Classifier(cl_mode=cl).to(device)
+
+        feature_model.load_state_dict(torch.load(os.path.join(weight_dir, prior_dir, 'feature_weight_data'), map_location=device))
+        classifier_model.load_state_dict(torch.load(os.path.join(weight_dir, prior_dir, 'classification_weight_data'), map_location=device))
+        feature_model.eval()
+        classifier_model.eval()
+
+        prior_models.append((feature_model, classifier_model))
+
+    return prior_models
+
+
+def load_stage1(device='cpu', weight_dir=None, prior_models=None):
+    '''멜라닌, 피부두께 Model 을 묶은 FusedStage1 (두 확률분포를 batched matmul 한 번으로 계산)'''
+    if prior_models is None:
+        prior_models = load_prior_models(device, weight_dir)
+
+    stage1 = FusedStage1.from_models(prior_models, cl_modes=list(PRIOR_WEIGHT_DIR.keys()))
+    stage1.eval()
+    return stage1
+
+
+def prior_probs(absorption, device='cpu', weight_dir=None, stage1=None):
+    '''멜라닌, 피부두께 확률분포 (T, 8 + 3)'''
+    if stage1 is None:
+        stage1 = load_stage1(device, weight_dir)
+
+    x = torch.FloatTensor(absorption).to(device)
+
+    with torch.no_grad():
+        probs = torch.cat([F.softmax(out, dim=1) for out in stage1(x)], dim=1)
+
+    return probs.cpu().numpy()
+
+
+def session_names(data_dir=None):
+    if data_dir is None:
+        data_dir = default_data_dir()
+    return sorted(os.listdir(data_dir))
+
+
+def load_session_corpus(roi='forehead', sessions=None, data_dir=None, device='cpu', mv_window=30, time_start=0, time_end=160):
+    '''
+    모든 Session을 한 번 읽어서 이어 붙임
+    이동평균은 Session 안에서만 계산함 (Fold 구성과 관계없이 같은 값이 되도록)
+    time_start, time_end : 사용할 측정 구간 (초), dataset1 Train 0 ~ 120, Test 100 ~ 160
+    return : {'absorbance': (T, 14), 'concat': (T, 25), 'reflect', 'ppg', 'spo2', 'pulse' : (T,) Tensor,
+              'sessions': Session 이름 list, 'offsets': Session 시작 index (len(sessions) + 1)}
+    '''
+    if sessions is None:
+        sessions = session_names(data_dir)
+
+    parts = {'reflect': [], 'absorbance': [], 'mf_absorbance': [], 'ppg': [], 'spo2': [], 'pulse': []}
+    offsets = [0]
+
+    for session in sessions:
+        print("Read Session {} ({})".format(session, roi))
+        s = read_session(session, roi, data_dir, time_start=time_start, time_end=time_end)
+        absorption = absorbance(s['reflect'])
+
+        parts['reflect'].append(s['reflect'])
+        parts['absorbance'].append(absorption)
+        parts['mf_absorbance'].append(moving_average(absorption, mv_window))
+        for name in ('ppg', 'spo2', 'pulse'):
+            parts[name].append(s[name])
+        offsets.append(offsets[-1] + len(absorption))
+
+    data = {name: np.concatenate(value, axis=0).astype(np.float32) for name, value in parts.items()}
+
+    # 멜라닌, 피부두께 확률분포는 이동평균한 Absorbance로 계산
+    probs = prior_probs(data.pop('mf_absorbance'), device).astype(np.float32)
+
+    corpus = {
+        'absorbance': torch.from_numpy(data['absorbance']),
+        'concat': torch.from_numpy(np.concatenate([data['absorbance'], probs], axis=1)),
+        'reflect': torch.from_numpy(data['reflect']),
+        'ppg': torch.from_numpy(data['ppg']),
+        'spo2': torch.from_numpy(data['spo2']),
+        'pulse': torch.from_numpy(data['pulse']),
+        'sessions': list(sessions),
+        'offsets': np.array(offsets),
+    }
+    return corpus
+
+
+def sequence_end_index(corpus, sessions, seq_len=100, stride=3):
+    '''
+    선택한 Session들에서 seq_len 길이 Sequence의 마지막 index
+    (dataset1 과 같이 Session 안에서 1, 1 + stride, ... 위치 중 앞의 seq_len 이 모두 같은 Session인 것만 사용)
+    '''
+    end_index = []
+    for si, session in enumerate(corpus['sessions']):
+        if session not in sessions:
+            continue
+        start, end = corpus['offsets'][si], corpus['offsets'][si + 1]
+        local = np.arange(1, end - start, stride)
+        end_index.append(start + local[local >= seq_len])
+
+    if len(end_index) == 0:
+        return np.zeros(0, dtype=np.int64)
+    return np.concatenate(end_index).astype(np.int64)
+
+
+class SequenceLoader(object):
+    '''
+    corpus 의 index view 로 만든 Sequence batch Iterator (DataLoader shuffle=False 와 같은 순서)
+    batch : (absorbance, concat, reflect, ppg, spo2, pulse), 각 (batch, seq_len, ...)
+    corpus 는 CPU (shared memory) 에 그대로 두고, batch 만 만들어서 device 로 옮김 (shared_data.DeviceLoader 와 같음)
+    '''
+    def __init__(self, corpus, end_index, seq_len=100, batch_size=3000, device='cpu'):
+        self.seq_len = seq_len
+        self.batch_size = batch_size if batch_size is not None else max(1, len(end_index))
+        self.device = device
+        self.end_index = torch.as_tensor(end_index)
+        self.offset = torch.arange(-(seq_len - 1), 1)
+
+        self.tensors = [corpus[name] for name in ('absorbance', 'concat', 'reflect', 'ppg', 'spo2', 'pulse')]
+
+    def __len__(self):
+        return (len(self.end_index) + self.batch_size - 1) // self.batch_size
+
+    def __iter__(self):
+        for bi in range(0, len(self.end_index), self.batch_size):
+            window = self.end_index[bi:bi + self.batch_size, None] + self.offset
+            batch = tuple(t[window] for t in self.tensors)
+            if self.device == 'cpu':
+                yield batch
+            else:
+                yield tuple(b.to(self.device, non_blocking=True) for b in batch)
@@ -0,0 +1,72 @@
+import numpy as np
+
+import torch
+import torch.utils.data as data
+
+'''
+Dataset (dataset1, dataset2) 의 배열을 CPU shared memory 에 한 벌만 두고, DataLoader worker 가 batch 를 병렬로 만들기 위한 Helper
+  - shared_tensor : 배열 -> shared memory Tensor, worker 에는 복사 / pickle 없이 handle 만 전달됨
+  - SequenceWindows : LSTM Sequence 를 Window 마다 복사하지 않고 (seq_len 배 메모리) 원래 배열의 index 로 만듦
+  - batch_loader : sample 별 __getitem__ + collate 대신 dataset[index list] 로 batch 를 한 번에 읽고,
+                   num_workers 개 worker 가 다음 batch 를 미리 만들며, pin_memory / device 로 옮기는 것까지 처리함
+Dataset 은 use_gpu 와 관계없이 CPU 에 두고, batch 만 device 로 옮김.
+'''
+
+
+def shared_tensor(x, dtype=torch.float32):
+    '''numpy / list / Tensor -> CPU shared memory Tensor (dtype 이 같은 numpy 배열은 중간 복사 없이 한 번만 복사)'''
+    if isinstance(x, torch.Tensor) == False:
+        x = np.asarray(x)
+    return torch.as_tensor(x, dtype=dtype).contiguous().share_memory_()
+
+
+class SequenceWindows(object):
+    '''
+    series : frame 축이 같은 배열 list (shared_tensor), end_index : Window 마지막 frame 위치
+    windows[index] : series 마다 end_index[index] - (seq_len - 1) ~ end_index[index] 구간, index 는 int 또는 index list
+    '''
+    def __init__(self, series, end_index, seq_len):
+        self.series = series
+        self.end_index = torch.as_tensor(np.asarray(end_index, dtype=np.int64)).share_memory_()
+        self.offset = torch.arange(-(seq_len - 1), 1)
+
+    def __len__(self):
+        return len(self.end_index)
+
+    def __getitem__(self, index):
+        window = self.end_index[index].unsqueeze(-1) + self.offset
+        return tuple(s[window] for s in self.series)
+
+
+class DeviceLoader(object):
+    '''DataLoader batch (Tensor tuple) 를 device 로 옮겨서 내보냄'''
+    def __init__(self, loader, device='cpu'):
+        self.loader = loader
+        self.device = device
+
+    def __len__(self):
+        return len(self.loader)
+
+    def __iter__(self):
+        for batch in self.loader:
+            if self.device == 'cpu':
+                yield batch
+            else:
+                yield tuple(b.to(self.device, non_blocking=True) for b in batch)
+
+
+def batch_loader(dataset, batch_size=None, shuffle=False, num_workers=0, pin_memory=False, device='cpu', drop_last=False):
+    '''
+    dataset[index list] 로 batch 를 읽는 DataLoader (Dataset 의 __getitem__ 이 index list 를 받아야 함)
+    batch_size : None 이면 전체를 batch 하나로 (Test data), num_workers : batch 를 만드는 worker 수 (0 이면 main process)
+    pin_memory : GPU 로 옮길 batch 를 page-locked memory 에 만듦 (device 가 cpu 면 무시)
+    return : device 로 옮긴 batch 를 내보내는 Iterator
+    '''
+    if batch_size is None:
+        batch_size = max(1, len(dataset))
+
+    sampler = data.RandomSampler(dataset) if shuffle == True else data.SequentialSampler(dataset)
+    loader = data.DataLoader(dataset, sampler=data.BatchSampler(sampler, batch_size, drop_last), batch_size=None,
+                             num_workers=num_workers, pin_memory=(pin_memory == True and device != 'cpu'),
+                             persistent_workers=(num_workers > 0))
+    return DeviceLoader(loader, device)
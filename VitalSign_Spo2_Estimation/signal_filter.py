@@ -0,0 +1,111 @@
+import functools
+import numpy as np
+
+from scipy import interpolate
+from scipy.signal import butter, sosfilt, sosfilt_zi
+
+'''
+Butterworth filter bank
+설계는 (band, fs, order) 별로 한 번만 하고 SOS (second-order sections) 형태로 저장함.
+(b, a) + lfilter 는 order 가 크면 (test 의 order=9 lowpass 등) 계수 반올림 오차로 불안정해질 수 있음.
+  - butter_bandpass_filter / butter_lowpass_filter : 여러 channel (축 하나) 을 한 번에 filter
+  - StreamingFilter : chunk 단위로 들어오는 신호를 filter 상태를 유지하면서 filter (실시간 Pipeline 용)
+  - sliding_pulse_spectrum : 1초 간격 window 별 Bandpass filter + FFT power (dataset1, dataset2 맥박 spectrum)
+'''
+
+
+@functools.lru_cache(maxsize=None)
+def butter_sos(band, fs, order=5, btype='band'):
+    '''
+    band : bandpass 는 (lowcut, highcut), lowpass / highpass 는 cutoff (Hz)
+    return : (n_sections, 6) SOS 계수 (cache 를 공유하므로 수정하지 않아야 함)
+    '''
+    nyq = 0.5 * fs
+    if btype == 'band':
+        wn = [band[0] / nyq, band[1] / nyq]
+    else:
+        wn = band / nyq
+
+    return butter(order, wn, btype=btype, output='sos')
+
+
+def butter_bandpass(lowcut, highcut, fs, order=5):
+    return butter_sos((float(lowcut), float(highcut)), float(fs), order, 'band')
+
+
+def butter_lowpass(cutoff, fs, order=9):
+    return butter_sos(float(cutoff), float(fs), order, 'low')
+
+
+def butter_bandpass_filter(data, lowcut, highcut, fs, order=5, axis=-1):
+    '''data 의 axis (시간 축) 를 따라 filter, 나머지 축은 channel 로 한 번에 계산'''
+    return sosfilt(butter_bandpass(lowcut, highcut, fs, order), data, axis=axis)
+
+
+def butter_lowpass_filter(data, cutoff, fs, order=9, axis=-1):
+    return sosfilt(butter_lowpass(cutoff, fs, order), data, axis=axis)
+
+
+def sliding_pulse_spectrum(measure_time, roi_data, time_start, time_end, time_window=10, pre_time=6, fs=48, lowcut=0.5, highcut=3):
+    '''
+    ti = time_start ~ time_end - time_window - 1 (1초 간격) 마다 ti - pre_time ~ ti + time_window 구간을 fs 로 Resampling,
+    Bandpass filter 후 앞 pre_time 구간 (filter transient) 을 버린 신호의 FFT power (lowcut ~ highcut Hz)
+    전체 구간은 한 번만 Resampling 하고, window 는 strided view 로 만들어서 filter / FFT 를 window 축으로 한 번에 계산
+    return : (window 수, frequency bin 수)
+    '''
+    n_window = time_end - time_window - time_start
+    window_len = (pre_time + time_window) * fs
+
+    f_linear = interpolate.interp1d(measure_time[:len(roi_data)], roi_data, kind='linear')
+    sample_time = (time_start - pre_time) + np.arange((n_window - 1) * fs + window_len) / fs
+    sample_ppg = f_linear(sample_time)
+
+    windows = np.lib.stride_tricks.sliding_window_view(sample_ppg, window_len)[::fs]
+    bp_data = butter_bandpass_filter(windows, lowcut, highcut, fs)[:, pre_time * fs:]
+
+    power = np.abs(np.fft.rfft(bp_data, axis=1))
+    sample_freq = np.fft.rfftfreq(bp_data.shape[1], d=(1 / fs))
+    mask = (sample_freq > lowcut) & (sample_freq < highcut)
+
+    return power[:, mask]
+
+
+class StreamingFilter(object):
+    '''
+    SOS filter 상태 (zi) 를 chunk 사이에 유지하는 filter
+    같은 신호를 chunk 로 나누어 넣어도 전체를 한 번에 filter 한 것과 같은 결과
+    sos : butter_bandpass / butter_lowpass 결과, channel_shape : 시간 축을 뺀 입력 shape (예 : (n_roi,))
+    steady_state : True 이면 첫 sample 값이 계속 들어왔던 것처럼 상태를 초기화 (시작 transient 감소)
+    '''
+    def __init__(self, sos, channel_shape=(), steady_state=False):
+        self.sos = np.asarray(sos)
+        self.channel_shape = tuple(channel_shape)
+        self.steady_state = steady_state
+        self.reset()
+
+    def reset(self):
+        self.zi = None
+
+    def _init_state(self, first):
+        # zi : (n_sections, 2, channel...), sosfilt 의 시간 축 (chunk 의 0 번 축) 자리에 상태 2 개
+        zi = np.zeros((len(self.sos), 2) + self.channel_shape)
+        if self.steady_state == True:
+            zi_unit = sosfilt_zi(self.sos).reshape((len(self.sos), 2) + (1,) * len(self.channel_shape))
+            zi = zi_unit * np.asarray(first, dtype=np.float64)
+        return zi
+
+    def process(self, chunk):
+        '''chunk : (T,) + channel_shape, 시간 축은 0 -> filter 결과 (같은 shape)'''
+        chunk = np.asarray(chunk, dtype=np.float64)
+        if len(chunk) == 0:
+            return chunk
+
+        if self.zi is None:
+            self.zi = self._init_state(chunk[0])
+
+        out, self.zi = sosfilt(self.sos, chunk, axis=0, zi=self.zi)
+        return out
+
+    def process_sample(self, sample):
+        '''sample 하나 (channel_shape) -> filter 결과 (channel_shape)'''
+        return self.process(np.asarray(sample, dtype=np.float64)[np.newaxis])[0]
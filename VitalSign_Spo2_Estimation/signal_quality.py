@@ -0,0 +1,127 @@
+import numpy as np
+
+'''
+신호 품질 지표 (ROI 별)
+  - clipping : ROI 영역에서 포화 (반사율 >= high) 또는 0 이하인 pixel 비율
+  - gap : 이전 frame 과의 시간 간격 (frame 누락, 초)
+  - motion : 연속 sample 사이 Absorbance 변화량 (band 평균), 움직임 / 조명 변화
+  - snr : 심박 대역 spectrum 의 peak 주변 power 와 나머지 power 의 비 (dB)
+sample 마다 ROI 별로 나쁨 여부를 정하고, LSTM 입력 window (seq_len) 안에서 좋은 sample 비율을 window 품질로 사용함.
+'''
+
+
+def clipping_fraction(cube, low=0.0, high=1.0):
+    '''cube : (band, ...) ROI 반사율 -> 포화 또는 0 이하 pixel 비율'''
+    cube = np.asarray(cube)
+    return float(np.mean((cube >= high) | (cube <= low)))
+
+
+def motion_index(prev, cur):
+    '''prev, cur : (..., band) Absorbance -> (...) band 평균 절대 변화량'''
+    return np.mean(np.abs(np.asarray(cur) - np.asarray(prev)), axis=-1)
+
+
+def band_snr(power, eps=1e-30):
+    '''
+    power : (freq, channel...) 심박 대역 power spectrum -> (channel...) SNR (dB)
+    channel 마다 peak ±1 격자 power 를 signal, 나머지를 noise 로 봄
+    '''
+    n_freq = power.shape[0]
+    k = np.argmax(power, axis=0)
+
+    index = np.arange(n_freq).reshape((n_freq,) + (1,) * (power.ndim - 1))
+    near = np.abs(index - k[np.newaxis]) <= 1
+
+    signal = np.sum(power * near, axis=0)
+    noise = np.sum(power * ~near, axis=0)
+    return 10 * np.log10((signal + eps) / (noise + eps))
+
+
+def session_flags(absorbance, max_motion=0.05, snr=None, min_snr=None):
+    '''
+    offline : 한 Session 의 absorbance (T, n_roi, band), snr (T, n_roi) (없으면 사용 안 함) -> (T, n_roi) 나쁜 sample 여부
+    SignalQualityMonitor.sample_flags 와 같은 기준 중 기록된 data 로 다시 계산할 수 있는 움직임, SNR 만 사용함
+    '''
+    absorbance = np.asarray(absorbance)
+    bad = np.zeros(absorbance.shape[:-1], dtype=np.bool_)
+    bad[1:] = motion_index(absorbance[:-1], absorbance[1:]) > max_motion
+
+    if min_snr is not None and snr is not None:
+        bad = bad | (np.asarray(snr) < min_snr)
+    return bad
+
+
+def window_quality(bad, end_index, seq_len=100):
+    '''
+    offline : bad (T, n_roi) sample 별 나쁨 여부, end_index (N,) Sequence 마지막 index
+    return : (N, n_roi) window 안 좋은 sample 비율
+    '''
+    bad = np.asarray(bad, dtype=np.float64)
+    cumsum = np.concatenate([np.zeros((1,) + bad.shape[1:]), np.cumsum(bad, axis=0)], axis=0)
+    n_bad = cumsum[end_index + 1] - cumsum[end_index + 1 - seq_len]
+    return 1.0 - n_bad / seq_len
+
+
+class SignalQualityMonitor(object):
+    '''
+    Streaming 품질 판정, update 마다 sample 하나의 지표를 받아서 ROI 별 window 품질 (0 ~ 1) 을 반환
+    max_clip, max_gap (초), max_motion, min_snr (dB, None 이면 사용 안 함) 중 하나라도 넘으면 나쁜 sample
+    min_quality : window 품질이 이 값 이상인 ROI 만 LSTM / Fusion 에 사용
+    '''
+    def __init__(self, n_roi=4, seq_len=100, max_clip=0.05, max_gap=0.2, max_motion=0.05, min_snr=None, min_quality=0.8):
+        self.n_roi = n_roi
+        self.seq_len = seq_len
+        self.max_clip = max_clip
+        self.max_gap = max_gap
+        self.max_motion = max_motion
+        self.min_snr = min_snr
+        self.min_quality = min_quality
+
+        # 최근 seq_len 개 sample 의 flag (ring buffer)
+        self.flags = np.zeros((seq_len, n_roi), dtype=np.bool_)
+        self.reset()
+
+    def reset(self):
+        self.flags[:] = False
+        self.count = 0
+        self.n_bad = np.zeros(self.n_roi, dtype=np.int64)
+        self.prev_absorbance = None
+
+    def sample_flags(self, clip, gap, absorbance, snr=None):
+        '''return : (n_roi,) 나쁜 sample 여부'''
+        bad = np.asarray(clip) > self.max_clip
+        bad = bad | (gap > self.max_gap)
+
+        if self.prev_absorbance is not None:
+            bad = bad | (motion_index(self.prev_absorbance, absorbance) > self.max_motion)
+        self.prev_absorbance = np.array(absorbance, copy=True)
+
+        if self.min_snr is not None and snr is not None:
+            bad = bad | (np.asarray(snr) < self.min_snr)
+
+        return bad
+
+    def update(self, clip, gap, absorbance, snr=None):
+        bad = self.sample_flags(clip, gap, absorbance, snr)
+
+        # window 에서 빠지는 sample 의 flag 를 빼고 새 flag 를 더함 (처음 seq_len 개 전에는 False)
+        pos = self.count % self.seq_len
+        self.n_bad += bad.astype(np.int64) - self.flags[pos]
+        self.flags[pos] = bad
+        self.count += 1
+
+        return self.quality()
+
+    def quality(self):
+        return 1.0 - self.n_bad / self.seq_len
+
+    def last_flags(self):
+        '''마지막 update 한 sample 의 (n_roi,) 나쁨 여부 (update 전이면 모두 False)'''
+        if self.count == 0:
+            return np.zeros(self.n_roi, dtype=np.bool_)
+        return self.flags[(self.count - 1) % self.seq_len].copy()
+
+    def usable(self, quality=None):
+        if quality is None:
+            quality = self.quality()
+        return quality >= self.min_quality
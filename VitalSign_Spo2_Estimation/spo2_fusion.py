@@ -0,0 +1,145 @@
+import numpy as np
+from collections import deque
+
+'''
+ROI 별 Spo2 추정값 CPF(Covariance Projection Filter) Fusion
+ROI n개의 추정값 z (n,) 를 같은 Spo2 x 의 측정 z = 1 x + e, Cov(e) = P 로 보고
+x = (1^T P^-1 1)^-1 1^T P^-1 z 로 Fusion 함 (ROI 사이의 오차 상관을 포함한 최소분산 추정, 분산 (1^T P^-1 1)^-1).
+P 는 GT가 있는 Calibration data 의 오차로 구하거나(error_covariance), GT가 없으면 최근 window 동안
+ROI 추정값의 중앙값(consensus)에 대한 잔차로 구함(sliding_covariance).
+추정값 자체의 분산을 쓰면 값이 고정된(멈춘, 포화된) ROI 의 분산이 0 에 가까워져 weight 를 거의 다 가져가므로 잔차를 사용함.
+'''
+
+CPF_ROI_LIST = ['forehead', 'ueye', 'cheek', 'unose']
+
+
+def error_covariance(pred, gt):
+    '''pred : (T, n) ROI 별 추정값, gt : (T,) -> (n, n) 오차 공분산 (bias 포함)'''
+    err = pred - gt[:, np.newaxis]
+    return err.T @ err / len(err)
+
+
+def consensus_residual(pred):
+    '''pred : (..., n) -> ROI 추정값 중앙값에 대한 잔차 (..., n), GT 대신 ROI 들의 합의값을 기준으로 한 오차'''
+    return pred - np.median(pred, axis=-1, keepdims=True)
+
+
+def sliding_covariance(pred, window=30):
+    '''
+    시점 t 마다 pred[t-window+1 : t+1] 의 consensus_residual 오차 공분산 (T, n, n) (error_covariance 처럼 bias 포함)
+    window 보다 앞쪽은 있는 data 로만 계산하고, data가 1개인 시점은 단위행렬 (같은 가중치)
+    '''
+    T, n = pred.shape
+    r = consensus_residual(pred)
+
+    outer = r[:, :, np.newaxis] * r[:, np.newaxis, :]
+    s2 = np.concatenate([np.zeros((1, n, n)), np.cumsum(outer, axis=0)], axis=0)
+
+    end = np.arange(1, T + 1)
+    start = np.maximum(end - window, 0)
+    count = end - start
+
+    cov = (s2[end] - s2[start]) / count[:, np.newaxis, np.newaxis]
+
+    cov[count < 2] = np.eye(n)
+    return cov
+
+
+def quality_covariance(cov, quality, min_quality=1e-6):
+    '''
+    신호 품질 q (..., n) (0 ~ 1) 로 ROI 오차 공분산을 조정, ROI i 의 분산이 1/q_i 배가 되도록 cov_ij / sqrt(q_i q_j)
+    '''
+    scale = 1.0 / np.sqrt(np.maximum(quality, min_quality))
+    return cov * scale[..., :, np.newaxis] * scale[..., np.newaxis, :]
+
+
+def cpf_weights(cov, eps=1e-6, quality=None):
+    '''
+    cov : (..., n, n) -> weight (..., n) (합 1), fused variance (...)
+    특이행렬이 되지 않도록 대각에 eps * 평균 분산을 더함
+    quality : (..., n) ROI 별 신호 품질, 품질이 낮은 ROI 는 분산을 키우고 0 인 ROI 는 weight 0
+              모든 ROI 의 품질이 0 이면 (쓸 수 있는 ROI 가 없음) 품질을 쓰지 않은 cov 만의 weight, variance 를 반환
+    '''
+    n = cov.shape[-1]
+    scale = np.trace(cov, axis1=-2, axis2=-1)[..., np.newaxis, np.newaxis] / n
+    reg = cov + (eps * scale + 1e-12) * np.eye(n)
+
+    s = np.linalg.solve(reg, np.ones(reg.shape[:-1])[..., np.newaxis])[..., 0]
+    if quality is not None:
+        quality = np.asarray(quality, dtype=np.float64)
+        usable = quality > 0
+
+        reg_quality = quality_covariance(reg, quality)
+        s_quality = np.linalg.solve(reg_quality, np.ones(reg_quality.shape[:-1])[..., np.newaxis])[..., 0]
+        s = np.where(np.any(usable, axis=-1)[..., np.newaxis], np.where(usable, s_quality, 0.0), s)
+    total = np.sum(s, axis=-1)
+
+    return s / total[..., np.newaxis], 1.0 / total
+
+
+def cpf_fuse(pred, cov, quality=None):
+    '''
+    pred : (T, n), cov : (n, n) 고정 또는 (T, n, n) 시점 별, quality : (T, n) 시점 별 ROI 신호 품질 (없으면 모두 1)
+    return : fused (T,), fused variance (T,)
+    '''
+    if quality is not None and cov.ndim == 2:
+        cov = np.broadcast_to(cov, (len(pred),) + cov.shape)
+    weight, var = cpf_weights(cov, quality=quality)
+    fused = np.sum(pred * weight, axis=-1)
+
+    if var.ndim == 0:
+        var = np.full(len(pred), var)
+    return fused, var
+
+
+class CPFFusion(object):
+    '''
+    Streaming Fusion, update 마다 ROI 추정값 (n,) 하나를 받아서 Fusion 결과를 반환
+    cov 를 주면 고정 공분산, 없으면 최근 window 개 추정값의 consensus_residual 로 공분산을 구함 (offline sliding_covariance 와 같은 값)
+    '''
+    def __init__(self, n_roi=4, cov=None, window=30):
+        self.n_roi = n_roi
+        self.cov = cov
+        self.window = window
+        self.history = deque(maxlen=window)
+
+        if cov is not None:
+            self.weight, self.var = cpf_weights(np.asarray(cov))
+
+    def reset(self):
+        self.history.clear()
+
+    def update(self, estimates, quality=None):
+        '''quality : (n,) ROI 별 신호 품질 (0 이면 해당 ROI 제외), 공분산 history 에는 모든 ROI 의 잔차를 넣음'''
+        estimates = np.asarray(estimates, dtype=np.float64)
+
+        if self.cov is not None:
+            if quality is None:
+                return float(np.dot(self.weight, estimates)), float(self.var)
+            weight, var = cpf_weights(np.asarray(self.cov), quality=quality)
+            return float(np.dot(weight, estimates)), float(var)
+
+        self.history.append(consensus_residual(estimates))
+        if len(self.history) < 2:
+            cov = np.eye(self.n_roi)
+        else:
+            r = np.stack(self.history)
+            cov = r.T @ r / len(r)
+
+        weight, var = cpf_weights(cov, quality=quality)
+        return float(np.dot(weight, estimates)), float(var)
+
+
+def fusion_report(pred, gt, roi_names, fused=None):
+    '''ROI 별 / Fusion 결과의 RMSE, 평균 절대오차 출력, return : {이름: rmse}'''
+    result = {}
+    for i, roi in enumerate(roi_names):
+        result[roi] = float(np.sqrt(np.mean((pred[:, i] - gt) ** 2)))
+        print("{} RMSE : {:.4f} , MAE : {:.4f}".format(roi, result[roi], np.mean(np.abs(pred[:, i] - gt))))
+
+    if fused is not None:
+        for name, value in fused.items():
+            result[name] = float(np.sqrt(np.mean((value - gt) ** 2)))
+            print("{} RMSE : {:.4f} , MAE : {:.4f}".format(name, result[name], np.mean(np.abs(value - gt))))
+
+    return result
@@ -0,0 +1,143 @@
+import torch
+import torch.nn as nn
+
+'''
+Spo2 추정 LSTM Model 정의
+학습/검증 Script의 VitalSign_Spo2 와 같은 구조(같은 weight 이름)이고, 입력 Tensor가 있는 device에서 동작함.
+'''
+
+
+class VitalSign_Spo2(nn.Module):
+    def __init__(self, feature_size=25, hidden_size=30, seq_len = 100):
+        super(VitalSign_Spo2, self).__init__()
+
+        self.feature_size = feature_size
+        self.hidden_size = hidden_size
+        self.seq_len = seq_len
+
+        self.layer = 2
+
+        self.lstm = nn.LSTM(
+            input_size=self.feature_size,
+            hidden_size=self.hidden_size,
+            num_layers=self.layer,
+            batch_first=True)
+
+        self.dense = nn.Linear(self.hidden_size*self.seq_len, 1)
+
+    def forward(self, x):
+        hidden = torch.zeros(self.layer, x.size()[0], self.hidden_size, device=x.device)
+        cell = torch.zeros(self.layer, x.size()[0], self.hidden_size, device=x.device)
+
+        outputs, (hidden, cell) = self.lstm(x, (hidden, cell))
+        hidden = outputs.reshape(-1, self.hidden_size * self.seq_len)
+
+        model = self.dense(hidden)
+
+        return model
+
+
+class GroupedSpo2(nn.Module):
+    '''
+    같은 hidden_size, seq_len 인 VitalSign_Spo2 여러 개(예: ROI 4개)를 한 번의 LSTM 호출로 계산하는 추론용 Model
+    각 Model의 LSTM weight를 Block-diagonal로 배치한 hidden_size * n_models 크기의 LSTM 하나를 사용하므로
+    Model 별로 입력 feature_size가 달라도 됨. (학습하면 Block 밖의 weight가 0이 아니게 되므로 추론에만 사용)
+    input_index : Model 별로 사용할 입력 번호 (기본은 Model 마다 다른 입력)
+      같은 입력을 쓰는 Model들은 입력의 앞쪽 feature_size 개를 함께 사용함.
+      예) mel/thickness 사용 여부 A/B 비교 : GroupedSpo2([spo2_model, spo2_model_nomelthick], input_index=[0, 0])
+          -> Absorbance(14) + 멜라닌, 피부두께 확률분포(11) 입력 하나로 두 Model을 계산
+    '''
+    def __init__(self, models, input_index=None):
+        super(GroupedSpo2, self).__init__()
+
+        base = models[0]
+        for m in models:
+            if m.hidden_size != base.hidden_size or m.seq_len != base.seq_len or m.layer != base.layer:
+                raise ValueError("GroupedSpo2 needs the same hidden_size, seq_len and layer for every model")
+
+        self.n_models = len(models)
+        self.hidden_size = base.hidden_size
+        self.seq_len = base.seq_len
+        self.layer = base.layer
+        self.feature_sizes = [m.feature_size for m in models]
+
+        if input_index is None:
+            input_index = list(range(self.n_models))
+        self.input_index = list(input_index)
+
+        # 입력 별 사용하는 feature 수, 이어 붙였을 때 시작 위치
+        self.input_sizes = [max(f for f, idx in zip(self.feature_sizes, self.input_index) if idx == k)
+                            for k in range(max(self.input_index) + 1)]
+        self.input_offsets = [sum(self.input_sizes[:k]) for k in range(len(self.input_sizes))]
+
+        self.lstm = nn.LSTM(
+            input_size=sum(self.input_sizes),
+            hidden_size=self.hidden_size * self.n_models,
+            num_layers=self.layer,
+            batch_first=True)
+
+        self.dense_weight = nn.Parameter(torch.zeros(self.n_models, self.hidden_size * self.seq_len))
+        self.dense_bias = nn.Parameter(torch.zeros(self.n_models))
+
+        self.load_models(models)
+
+    @torch.no_grad()
+    def load_models(self, models):
+        '''VitalSign_Spo2 weight를 Block-diagonal 위치로 복사'''
+        H = self.hidden_size
+        GH = H * self.n_models
+
+        for p in self.lstm.parameters():
+            p.zero_()
+
+        for l in range(self.layer):
+            w_ih = getattr(self.lstm, 'weight_ih_l{}'.format(l))
+            w_hh = getattr(self.lstm, 'weight_hh_l{}'.format(l))
+            b_ih = getattr(self.lstm, 'bias_ih_l{}'.format(l))
+            b_hh = getattr(self.lstm, 'bias_hh_l{}'.format(l))
+
+            for g, m in enumerate(models):
+                src_ih = getattr(m.lstm, 'weight_ih_l{}'.format(l))
+                src_hh = getattr(m.lstm, 'weight_hh_l{}'.format(l))
+                src_b_ih = getattr(m.lstm, 'bias_ih_l{}'.format(l))
+                src_b_hh = getattr(m.lstm, 'bias_hh_l{}'.format(l))
+
+                if l == 0:
+                    offset = self.input_offsets[self.input_index[g]]
+                    cols = slice(offset, offset + self.feature_sizes[g])
+                else:
+                    cols = slice(g * H, (g + 1) * H)
+
+                # nn.LSTM gate 순서 (i, f, g, o) 마다 Model g 의 hidden 위치에 배치
+                for k in range(4):
+                    rows = slice(k * GH + g * H, k * GH + (g + 1) * H)
+                    src_rows = slice(k * H, (k + 1) * H)
+
+                    w_ih[rows, cols] = src_ih[src_rows]
+                    w_hh[rows, g * H:(g + 1) * H] = src_hh[src_rows]
+                    b_ih[rows] = src_b_ih[src_rows]
+                    b_hh[rows] = src_b_hh[src_rows]
+
+        for g, m in enumerate(models):
+            self.dense_weight[g] = m.dense.weight[0]
+            self.dense_bias[g] = m.dense.bias[0]
+
+        self.lstm.flatten_parameters()
+
+    def forward(self, inputs):
+        '''
+        inputs : 입력 번호 순서대로 (batch, seq_len, feature) Tensor list (input_index 가 없으면 Model 순서)
+        return : (batch, n_models)
+        '''
+        x = torch.cat([inp[:, :, :size] for inp, size in zip(inputs, self.input_sizes)], dim=2)
+
+        hidden = torch.zeros(self.layer, x.size()[0], self.hidden_size * self.n_models, device=x.device)
+        cell = torch.zeros(self.layer, x.size()[0], self.hidden_size * self.n_models, device=x.device)
+
+        outputs, (hidden, cell) = self.lstm(x, (hidden, cell))
+
+        # (batch, seq, model, hidden) -> Model 별 (batch, seq * hidden), VitalSign_Spo2 의 reshape 순서와 같음
+        outputs = outputs.reshape(x.size()[0], self.seq_len, self.n_models, self.hidden_size)
+        outputs = outputs.permute(0, 2, 1, 3).reshape(x.size()[0], self.n_models, self.seq_len * self.hidden_size)
+
+        return torch.einsum('bgk,gk->bg', outputs, self.dense_weight) + self.dense_bias
@@ -0,0 +1,145 @@
+import copy
+import numpy as np
+import os
+import time
+
+import torch
+import torch.nn as nn
+
+from export_bundle import build_bundle, save_bundle
+from session_reader import load_session_corpus, sequence_end_index
+
+'''
+CPU 추론용 int8 동적 양자화 (weight 를 int8 로 저장, activation 은 실행 시 양자화)
+멜라닌/피부두께 MLP, LSTM + Dense 전체 (export_bundle.Spo2InferenceBundle) 를 양자화하고,
+total_data1 Test 구간에서 float Model 대비 Spo2 RMSE drift 를 확인해서 허용 범위를 넘으면 저장하지 않음.
+'''
+
+
+def quantize_model(model, quantize_lstm=False, per_channel=True):
+    '''
+    model 을 복사해서 nn.Linear (선택적으로 nn.LSTM) 을 동적 양자화 (원본 model 은 그대로)
+    per_channel : 출력 channel 별 scale 사용, 멜라닌 Feature Model 은 tensor 하나의 scale 로는 Spo2 오차가 커짐
+    quantize_lstm : hidden 30 LSTM 은 int8 kernel 이 float 보다 느린 CPU 가 있어서 기본은 float 유지
+    '''
+    model = copy.deepcopy(model).cpu()
+    model.eval()
+
+    linear_qconfig = torch.ao.quantization.per_channel_dynamic_qconfig if per_channel == True else torch.ao.quantization.default_dynamic_qconfig
+    qconfig_spec = {nn.Linear: linear_qconfig}
+    if quantize_lstm == True:
+        qconfig_spec[nn.LSTM] = torch.ao.quantization.default_dynamic_qconfig
+
+    return torch.ao.quantization.quantize_dynamic(model, qconfig_spec)
+
+
+def bundle_windows(corpus, end_index, seq_len=100, mv_window=30):
+    '''
+    Bundle 입력 window 를 길이별로 묶어서 반환 (Session 시작 부근은 Session 시작부터, 나머지는 seq_len + mv_window 길이)
+    return : [(end_index 안의 위치, (N, L, 14) Tensor)]
+    '''
+    offsets = corpus['offsets']
+    session_start = offsets[np.searchsorted(offsets, end_index, side='right') - 1]
+    start = np.maximum(session_start, end_index - (seq_len + mv_window - 1))
+
+    groups = []
+    for length in np.unique(end_index - start + 1):
+        position = np.where(end_index - start + 1 == length)[0]
+        window = torch.as_tensor(end_index[position, None] + np.arange(-(length - 1), 1))
+        groups.append((position, corpus['absorbance'][window]))
+
+    return groups
+
+
+def predict_bundle(bundle, corpus, end_index, seq_len=100, mv_window=30, batch_size=500):
+    '''return : spo2 (N,), mel_value (N,), thickness_value (N,), 추정 1개당 시간 (초)'''
+    spo2 = np.zeros(len(end_index))
+    mel_value = np.zeros(len(end_index))
+    thickness_value = np.zeros(len(end_index))
+
+    elapsed = 0
+    with torch.no_grad():
+        for position, windows in bundle_windows(corpus, end_index, seq_len, mv_window):
+            for bi in range(0, len(position), batch_size):
+                start = time.perf_counter()
+                out = bundle(windows[bi:bi + batch_size])
+                elapsed += time.perf_counter() - start
+
+                p = position[bi:bi + batch_size]
+                spo2[p] = out[0].numpy()
+                mel_value[p] = out[3].numpy()
+                thickness_value[p] = out[4].numpy()
+
+    return spo2, mel_value, thickness_value, elapsed / max(len(end_index), 1)
+
+
+def quantization_report(float_bundle, quant_bundle, corpus, end_index, max_drift=0.2):
+    '''
+    float / 양자화 Bundle 을 같은 Test window 로 비교
+    max_drift : 허용하는 float Model 추정값 대비 RMSE (Spo2 %), 넘으면 ValueError
+    '''
+    seq_len, mv_window = float_bundle.seq_len, float_bundle.mv_window
+    gt = corpus['spo2'].numpy()[end_index].astype(np.float64)
+
+    # 첫 호출 (thread pool, 양자화 kernel 준비) 은 시간 측정에서 제외
+    for bundle in (float_bundle, quant_bundle):
+        predict_bundle(bundle, corpus, end_index[:10], seq_len, mv_window)
+
+    float_spo2, float_mel, float_thickness, float_time = predict_bundle(float_bundle, corpus, end_index, seq_len, mv_window)
+    quant_spo2, quant_mel, quant_thickness, quant_time = predict_bundle(quant_bundle, corpus, end_index, seq_len, mv_window)
+
+    report = {
+        'float_rmse': float(np.sqrt(np.mean((float_spo2 - gt) ** 2))),
+        'quant_rmse': float(np.sqrt(np.mean((quant_spo2 - gt) ** 2))),
+        'spo2_drift_rmse': float(np.sqrt(np.mean((quant_spo2 - float_spo2) ** 2))),
+        'spo2_drift_max': float(np.max(np.abs(quant_spo2 - float_spo2))),
+        'mel_drift_max': float(np.max(np.abs(quant_mel - float_mel))),
+        'thickness_drift_max': float(np.max(np.abs(quant_thickness - float_thickness))),
+        'float_ms': float_time * 1000,
+        'quant_ms': quant_time * 1000,
+        'speedup': float_time / max(quant_time, 1e-12),
+    }
+    report['rmse_drift'] = report['quant_rmse'] - report['float_rmse']
+
+    print("Float RMSE : {:.4f} , Quant RMSE : {:.4f} ({:+.4f})".format(report['float_rmse'], report['quant_rmse'], report['rmse_drift']))
+    print("Spo2 drift RMSE : {:.4f} , max |diff| : {:.4f}".format(report['spo2_drift_rmse'], report['spo2_drift_max']))
+    print("Mel value max |diff| : {:.6f} , Thickness value max |diff| : {:.6f}".format(report['mel_drift_max'], report['thickness_drift_max']))
+    print("Time per prediction : float {:.4f} ms , quant {:.4f} ms (x{:.2f})".format(report['float_ms'], report['quant_ms'], report['speedup']))
+
+    if report['spo2_drift_rmse'] > max_drift:
+        raise ValueError("Quantized Spo2 drift RMSE {:.4f} exceeds max_drift {:.4f}".format(report['spo2_drift_rmse'], max_drift))
+
+    return report
+
+
+if __name__ == '__main__':
+    seq_len = 100
+    hidden_size = 30
+    roi = 'forehead'
+
+    # 양자화 Model 과 float Model 추정값의 RMSE 가 이 값 (Spo2 %) 을 넘으면 저장하지 않음
+    max_drift = 0.2
+    quantize_lstm = False
+
+    path = os.path.dirname(os.path.abspath(__file__))
+    save_dir = "vitalsign_0408_predict_spo2_lstm_l2_dropno_dataset1_{}_seq{}_hidden{}".format(roi, seq_len, hidden_size)
+    spo2_weight = os.path.join(path, 'result', save_dir, 'weight_data2')
+
+    # 동적 양자화는 nn.Linear 단위이므로 멜라닌, 피부두께 Model 은 묶지 않음
+    float_bundle = build_bundle(spo2_weight, feature_size=25, hidden_size=hidden_size, seq_len=seq_len, fuse_stage1=False)
+    quant_bundle = quantize_model(float_bundle, quantize_lstm=quantize_lstm)
+
+    # dataset1 Test 구간 (100 ~ 160초)
+    corpus = load_session_corpus(roi, time_start=100, time_end=160)
+    end_index = sequence_end_index(corpus, corpus['sessions'], seq_len)
+
+    report = quantization_report(float_bundle, quant_bundle, corpus, end_index, max_drift=max_drift)
+
+    metadata = {
+        'spo2_weight': os.path.basename(spo2_weight),
+        'feature_size': 25,
+        'hidden_size': hidden_size,
+        'quantization': 'dynamic_qint8_linear' + ('_lstm' if quantize_lstm == True else ''),
+        'quantization_report': report,
+    }
+    save_bundle(quant_bundle, os.path.join(path, 'result', save_dir, 'spo2_bundle_int8.pt'), metadata)
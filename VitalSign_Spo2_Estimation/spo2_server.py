@@ -0,0 +1,328 @@
+import asyncio
+import collections
+import json
+import numpy as np
+import os
+import time
+
+import torch
+
+from realtime_pipeline import SessionState
+from session_reader import load_stage1
+from spo2_model import VitalSign_Spo2
+
+'''
+여러 Session (실험자) 의 Spo2 를 동시에 추정하는 asyncio 추론 Server
+Client 는 30 fps Absorbance sample 을 한 줄 JSON 으로 보내고, Server 는 sample 마다 한 줄 JSON 으로 응답함.
+  요청 : {"session": "<id>", "time": 1.23, "absorbance": [14 개]}  /  {"cmd": "stats"}  /  {"cmd": "close", "session": "<id>"}
+  응답 : {"session": "<id>", "time": 1.23, "spo2": 97.1 또는 null (아직 Sequence 가 채워지지 않은 경우)}
+         잘못된 요청이나 계산 오류는 {"error": "<내용>"} 으로 응답하고 연결은 유지함
+Session 별 이동평균 / LSTM 입력 window 는 Server 가 유지하고, 여러 Session 에서 들어온 sample 은
+max_wait 안에 최대 max_batch 개까지 모아서 멜라닌/피부두께 Model, LSTM Model 을 한 번씩만 실행함 (micro-batching).
+'''
+
+
+# 요청 Absorbance band 수
+N_BAND = 14
+
+
+class ServerStats(object):
+    '''latency : 최근 max_latency 개 sample 만 저장 (오래 실행되는 Server 에서 계속 늘어나지 않도록)'''
+    def __init__(self, max_latency=10000):
+        self.start = time.perf_counter()
+        self.samples = 0
+        self.predictions = 0
+        self.batches = 0
+        self.errors = 0
+        self.latency = collections.deque(maxlen=max_latency)
+
+    def summary(self):
+        elapsed = time.perf_counter() - self.start
+        latency = np.array(self.latency) * 1000 if len(self.latency) > 0 else np.zeros(1)
+        return {
+            'samples': self.samples,
+            'predictions': self.predictions,
+            'batches': self.batches,
+            'errors': self.errors,
+            'mean_batch_size': self.samples / max(self.batches, 1),
+            'samples_per_sec': self.samples / max(elapsed, 1e-9),
+            'latency_mean_ms': float(latency.mean()),
+            'latency_p95_ms': float(np.percentile(latency, 95)),
+        }
+
+
+class Spo2InferenceServer(object):
+    '''
+    spo2_model : VitalSign_Spo2 (feature_size 25), 모든 Session 이 함께 사용
+    max_batch : 한 번에 계산할 최대 sample 수, max_wait : 첫 sample 이후 batch 를 모으는 최대 시간 (초)
+    '''
+    def __init__(self, spo2_model, prior_models=None, max_batch=256, max_wait=0.005, mv_window=30, stride=3, device='cpu'):
+        self.spo2_model = spo2_model.to(device)
+        self.spo2_model.eval()
+        self.stage1 = load_stage1(device, prior_models=prior_models)
+
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.mv_window = mv_window
+        self.stride = stride
+        self.device = device
+
+        self.sessions = {}
+        self.stats = ServerStats()
+        self.pending = None
+
+    def session_state(self, session):
+        if session not in self.sessions:
+            self.sessions[session] = SessionState((), self.spo2_model.seq_len, self.mv_window, self.stride)
+        return self.sessions[session]
+
+    async def submit(self, session, t, absorbance):
+        '''
+        sample 하나를 batch 대기열에 넣고 결과 (spo2 또는 None) 를 기다림
+        Session 상태는 Event loop 에서 미리 찾아서 넣음 (compute_batch 는 Session id 를 다루지 않음)
+        '''
+        future = asyncio.get_running_loop().create_future()
+        state = self.session_state(session)
+        await self.pending.put((state, t, np.asarray(absorbance, dtype=np.float64), future, time.perf_counter()))
+        return await future
+
+    def compute_batch(self, batch):
+        '''
+        batch : [(Session 상태, time, absorbance, future, 도착 시간)], 도착 순서대로 Session 상태를 갱신
+        return : batch 순서대로 spo2, None 또는 그 sample 에서 난 Exception (다른 sample 의 결과에는 영향 없음)
+        '''
+        results = [None] * len(batch)
+
+        # Session 상태 갱신은 sample 별로 처리, 오류가 난 sample 만 batch 에서 뺌
+        valid = []
+        mf_absorption = []
+        for bi, item in enumerate(batch):
+            try:
+                mf_absorption.append(item[0].moving_average(item[2]))
+                valid.append(bi)
+            except Exception as e:
+                results[bi] = e
+
+        if len(valid) == 0:
+            return results
+
+        absorption = np.stack([batch[bi][2] for bi in valid])
+        with torch.no_grad():
+            x = torch.as_tensor(np.stack(mf_absorption), dtype=torch.float32, device=self.device)
+            probs = [torch.softmax(out, dim=1).cpu().numpy() for out in self.stage1(x)]
+
+        concat = np.concatenate([absorption.astype(np.float32)] + probs, axis=1)
+
+        windows = []
+        window_index = []
+        for ci, bi in enumerate(valid):
+            try:
+                window = batch[bi][0].push_input(concat[ci])
+            except Exception as e:
+                results[bi] = e
+                continue
+            if window is not None:
+                windows.append(window)
+                window_index.append(bi)
+
+        if len(windows) > 0:
+            with torch.no_grad():
+                pred = self.spo2_model(torch.as_tensor(np.stack(windows), device=self.device))
+            for bi, value in zip(window_index, pred[:, 0].cpu().numpy()):
+                results[bi] = float(value)
+
+        return results
+
+    async def batch_loop(self):
+        loop = asyncio.get_running_loop()
+
+        while True:
+            batch = [await self.pending.get()]
+            deadline = loop.time() + self.max_wait
+
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.pending.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            # 계산은 별도 Thread 에서 (Event loop 는 계속 요청을 받음)
+            # 계산 오류는 이 batch 의 요청에만 전달하고 batch_loop 는 계속 실행함
+            # (sample 하나의 오류는 compute_batch 가 그 sample 의 결과로 돌려줌)
+            try:
+                results = await loop.run_in_executor(None, self.compute_batch, batch)
+            except Exception as e:
+                self.stats.errors += len(batch)
+                for item in batch:
+                    if item[3].done() == False:
+                        item[3].set_exception(e)
+                continue
+
+            now = time.perf_counter()
+            self.stats.batches += 1
+            for item, result in zip(batch, results):
+                if isinstance(result, Exception):
+                    self.stats.errors += 1
+                    if item[3].done() == False:
+                        item[3].set_exception(result)
+                    continue
+
+                self.stats.samples += 1
+                self.stats.latency.append(now - item[4])
+                if result is not None:
+                    self.stats.predictions += 1
+                if item[3].done() == False:
+                    item[3].set_result(result)
+
+    @staticmethod
+    def check_session(session):
+        '''Session id 는 문자열 또는 정수 (dict key 로 사용), 문제가 있으면 오류 내용 (없으면 None)'''
+        if isinstance(session, bool) == True or isinstance(session, (str, int)) == False:
+            return "'session' must be a string or an integer"
+        return None
+
+    @staticmethod
+    def check_sample(request):
+        '''sample 요청 형식 확인, 문제가 있으면 오류 내용 (없으면 None)'''
+        for key in ('session', 'time', 'absorbance'):
+            if key not in request:
+                return "missing '{}'".format(key)
+        error = Spo2InferenceServer.check_session(request['session'])
+        if error is not None:
+            return error
+        absorbance = request['absorbance']
+        if isinstance(absorbance, list) == False or len(absorbance) != N_BAND:
+            return "'absorbance' must be a list of {} values".format(N_BAND)
+        try:
+            values = np.asarray(absorbance, dtype=np.float64)
+        except (TypeError, ValueError):
+            return "'absorbance' must be numeric"
+        if np.all(np.isfinite(values)) == False:
+            return "'absorbance' must be finite"
+        return None
+
+    async def handle_client(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+
+                try:
+                    request = json.loads(line)
+                except ValueError:
+                    request = None
+                if isinstance(request, dict) == False:
+                    response = {'error': 'request must be a JSON object'}
+                    writer.write((json.dumps(response) + '\n').encode())
+                    await writer.drain()
+                    continue
+
+                cmd = request.get('cmd', 'sample')
+
+                if cmd == 'stats':
+                    response = self.stats.summary()
+                elif cmd == 'close':
+                    error = self.check_session(request.get('session'))
+                    if error is None:
+                        self.sessions.pop(request['session'], None)
+                        response = {'session': request['session'], 'closed': True}
+                    else:
+                        response = {'session': request.get('session'), 'error': error}
+                else:
+                    error = self.check_sample(request)
+                    if error is None:
+                        try:
+                            spo2 = await self.submit(request['session'], request['time'], request['absorbance'])
+                            response = {'session': request['session'], 'time': request['time'], 'spo2': spo2}
+                        except Exception as e:
+                            response = {'session': request['session'], 'time': request['time'], 'error': repr(e)}
+                    else:
+                        response = {'session': request.get('session'), 'error': error}
+
+                writer.write((json.dumps(response) + '\n').encode())
+                await writer.drain()
+        finally:
+            writer.close()
+
+    async def serve(self, host='127.0.0.1', port=8765, ready=None):
+        self.pending = asyncio.Queue()
+        batcher = asyncio.create_task(self.batch_loop())
+
+        server = await asyncio.start_server(self.handle_client, host, port)
+        print("Spo2 Server : {}:{} (max_batch {}, max_wait {} ms)".format(host, port, self.max_batch, self.max_wait * 1000))
+        if ready is not None:
+            ready.set()
+
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            batcher.cancel()
+
+
+async def replay_client(session, absorbance, host='127.0.0.1', port=8765, fps=30, speed=1.0):
+    '''
+    Test 용 Client, Absorbance (T, 14) 를 fps 간격 (speed 배속, None 이면 최대 속도) 으로 보내고 응답 list 반환
+    '''
+    reader, writer = await asyncio.open_connection(host, port)
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+
+    responses = []
+    for i, a in enumerate(absorbance):
+        if speed is not None:
+            delay = start + i / fps / speed - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+        request = {'session': session, 'time': i / fps, 'absorbance': [float(v) for v in a]}
+        writer.write((json.dumps(request) + '\n').encode())
+        await writer.drain()
+        responses.append(json.loads(await reader.readline()))
+
+    writer.write((json.dumps({'cmd': 'close', 'session': session}) + '\n').encode())
+    await writer.drain()
+    await reader.readline()
+
+    writer.close()
+    await writer.wait_closed()
+    return responses
+
+
+async def request_stats(host='127.0.0.1', port=8765):
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write((json.dumps({'cmd': 'stats'}) + '\n').encode())
+    await writer.drain()
+    stats = json.loads(await reader.readline())
+    writer.close()
+    await writer.wait_closed()
+    return stats
+
+
+if __name__ == '__main__':
+    use_gpu = False
+    device = 'cuda' if use_gpu == True else 'cpu'
+
+    seq_len = 100
+    hidden_size = 30
+    roi = 'forehead'
+
+    host = '127.0.0.1'
+    port = 8765
+
+    # Micro-batching 설정 : 첫 sample 이후 최대 max_wait 초 동안 최대 max_batch 개를 모아서 계산
+    max_batch = 256
+    max_wait = 0.005
+
+    path = os.path.dirname(os.path.abspath(__file__))
+    save_dir = "vitalsign_0408_predict_spo2_lstm_l2_dropno_dataset1_{}_seq{}_hidden{}".format(roi, seq_len, hidden_size)
+
+    spo2_model = VitalSign_Spo2(feature_size=25, hidden_size=hidden_size, seq_len=seq_len)
+    spo2_model.load_state_dict(torch.load(os.path.join(path, 'result', save_dir, 'weight_data2'), map_location='cpu'))
+
+    server = Spo2InferenceServer(spo2_model, max_batch=max_batch, max_wait=max_wait, device=device)
+    asyncio.run(server.serve(host, port))
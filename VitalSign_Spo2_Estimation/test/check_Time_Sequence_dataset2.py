@@ -1,9 +1,10 @@
 import numpy as np
 import matplotlib.pyplot as plt
 import os
+import sys
 
-
-from scipy.signal import butter, lfilter
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from signal_filter import butter_bandpass_filter
 from scipy import fftpack
 
 import csv
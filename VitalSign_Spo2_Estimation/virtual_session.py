@@ -0,0 +1,149 @@
+import json
+import numpy as np
+import os
+
+'''
+가상 Session : 여러 Session (또는 일부 frame 구간) 을 복사하지 않고 이어 붙인 Session
+Session 폴더에 session.json 만 두면 dataset1 / dataset2 / session_reader / ReplaySource 가 일반 Session 처럼 읽음.
+
+session.json : {'segments': [{'session': 'TPR8_sh1', 'start': 0, 'stop': 5000}, {'session': 'TPR8_sh2', 'start': 0, 'stop': null}]}
+  - session : 가상 Session 폴더의 상위 폴더 기준 이름 (다른 폴더는 '../total_data2/TPR8_sh1' 처럼)
+  - start, stop : 사용할 frame 구간 (stop 이 null 이면 끝까지)
+측정 시간은 segment 마다 앞 segment 마지막 frame 다음 (frame 간격 중앙값 뒤) 에서 이어지고,
+GT (spo2, pulse 1 Hz, ppg 60 Hz) 는 가상 시간 격자에서 원래 Session 의 같은 시점 값을 선형보간해서 만듦.
+'''
+
+VIRTUAL_SESSION_FILE = 'session.json'
+
+
+def is_virtual_session(session_dir):
+    return os.path.isfile(os.path.join(session_dir, VIRTUAL_SESSION_FILE))
+
+
+def load_segments(session_dir):
+    with open(os.path.join(session_dir, VIRTUAL_SESSION_FILE), encoding='utf-8') as f:
+        segments = json.load(f)['segments']
+    return [{'session': s['session'], 'start': s.get('start', 0), 'stop': s.get('stop')} for s in segments]
+
+
+def save_segments(session_dir, segments):
+    '''segments : [(session, start, stop)]'''
+    os.makedirs(session_dir, exist_ok=True)
+    data = {'segments': [{'session': name, 'start': start, 'stop': stop} for name, start, stop in segments]}
+    with open(os.path.join(session_dir, VIRTUAL_SESSION_FILE), 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=1)
+
+
+class VirtualCube(object):
+    '''
+    segment cube (np.ndarray, mmap, CubeStore) 의 frame 구간을 이어 붙인 것처럼 index (읽을 때 해당 segment 만 읽음)
+    parts : [(cube, start, stop)]
+    '''
+    def __init__(self, parts):
+        self.parts = parts
+        self.offsets = np.cumsum([0] + [stop - start for _, start, stop in parts])
+
+    def __len__(self):
+        return int(self.offsets[-1])
+
+    @property
+    def shape(self):
+        return (len(self),) + tuple(np.shape(self.parts[0][0][self.parts[0][1]]))
+
+    def _ranges(self, start, stop):
+        # (part index, part 안 start, stop)
+        for pi, (_, p_start, _) in enumerate(self.parts):
+            lo = max(start, self.offsets[pi])
+            hi = min(stop, self.offsets[pi + 1])
+            if lo < hi:
+                yield pi, p_start + lo - self.offsets[pi], p_start + hi - self.offsets[pi]
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(len(self))
+            parts = [np.asarray(self.parts[pi][0][lo:hi]) for pi, lo, hi in self._ranges(start, stop)]
+            if len(parts) == 0:
+                return np.zeros((0,) + self.shape[1:])
+            return np.concatenate(parts, axis=0)[::step]
+
+        key = int(key)
+        if key < 0:
+            key += len(self)
+        if key < 0 or key >= len(self):
+            raise IndexError("Frame {} out of range ({})".format(key, len(self)))
+
+        pi = int(np.searchsorted(self.offsets, key, side='right')) - 1
+        cube, p_start, _ = self.parts[pi]
+        return cube[p_start + key - self.offsets[pi]]
+
+    def __iter__(self):
+        for cube, start, stop in self.parts:
+            for i in range(start, stop):
+                yield cube[i]
+
+    def roi_mean(self, start=0, stop=None, bands=None):
+        '''(n, band) ROI 영역 평균, segment cube 가 CubeStore 면 미리 계산한 평균을 씀'''
+        if stop is None:
+            stop = len(self)
+
+        parts = []
+        for pi, lo, hi in self._ranges(start, stop):
+            cube = self.parts[pi][0]
+            if hasattr(cube, 'roi_mean'):
+                parts.append(cube.roi_mean(lo, hi, bands))
+            else:
+                frames = np.asarray(cube[lo:hi])
+                mean = np.reshape(frames, frames.shape[:2] + (-1,)).mean(axis=2)
+                parts.append(mean if bands is None else mean[:, bands])
+        return np.concatenate(parts, axis=0)
+
+
+class VirtualSession(object):
+    '''
+    session_dir : session.json 이 있는 폴더
+    read_time : 원래 Session 이름 -> 측정 시간 (초, 첫 frame 0), 읽는 쪽 (dataset1, session_reader) 의 함수를 그대로 사용
+    '''
+    def __init__(self, session_dir, read_time):
+        self.segments = load_segments(session_dir)
+
+        offset = 0.0
+        for seg in self.segments:
+            source_time = np.asarray(read_time(seg['session']))
+            stop = len(source_time) if seg['stop'] is None else min(seg['stop'], len(source_time))
+            seg['stop'] = stop
+            seg['source_time'] = source_time[seg['start']:stop]
+
+            # 가상 시간 = 원래 시간 - source_t0 + offset
+            seg['source_t0'] = float(seg['source_time'][0])
+            seg['offset'] = offset
+
+            duration = float(seg['source_time'][-1]) - seg['source_t0']
+            frame_interval = float(np.median(np.diff(seg['source_time']))) if len(seg['source_time']) > 1 else 0.0
+            offset += duration + frame_interval
+
+        self.duration = offset
+
+    def measurement_time(self):
+        return np.concatenate([seg['source_time'] - seg['source_t0'] + seg['offset'] for seg in self.segments])
+
+    def cube(self, open_source):
+        '''open_source : 원래 Session 이름 -> cube'''
+        return VirtualCube([(open_source(seg['session']), seg['start'], seg['stop']) for seg in self.segments])
+
+    def series(self, read_series, rate):
+        '''
+        read_series : 원래 Session 이름 -> 시간 0 부터 rate (Hz) 간격 값 (GT)
+        return : 가상 시간 0 부터 rate 간격 값 (segment 사이는 각 segment 의 원래 값)
+        '''
+        sample_time = np.arange(int(np.floor(self.duration * rate)) + 1) / rate
+        values = np.zeros(len(sample_time))
+
+        for si, seg in enumerate(self.segments):
+            source = np.asarray(read_series(seg['session']), dtype=np.float64)
+            end = self.segments[si + 1]['offset'] if si + 1 < len(self.segments) else np.inf
+            mask = (sample_time >= seg['offset']) & (sample_time < end)
+
+            source_time = sample_time[mask] - seg['offset'] + seg['source_t0']
+            values[mask] = np.interp(source_time, np.arange(len(source)) / rate, source)
+
+        return values
@@ -8,7 +8,7 @@ import torch.nn as nn
 import torch.nn.functional as F
 import torch.optim as optim
 
-from torch.utils.data import DataLoader
+from shared_data import batch_loader
 
 from dataset2 import ViatalSignDataset_triplet
 from dataset2 import ViatalSignDataset_class
@@ -88,6 +88,7 @@ class Regression(nn.Module):
 
 if __name__ == '__main__':
     use_gpu = True
+    device = 'cuda' if use_gpu == True else 'cpu'
     class_mode = ""
 
     # save_dir = "vitalsign_0224_ppg_spo2"
@@ -133,9 +134,7 @@ if __name__ == '__main__':
 
     classifier_model.load_state_dict(torch.load(classify_path))
 
-    test_data_len = len(ViatalSignDataset_class(mode='val', cl=class_mode, use_gpu=use_gpu))
-    test_loader = DataLoader(ViatalSignDataset_class(mode='val', cl=class_mode, use_gpu=use_gpu), batch_size=test_data_len,
-                             shuffle=False)
+    test_loader = batch_loader(ViatalSignDataset_class(mode='val', cl=class_mode, use_gpu=use_gpu), device=device)
 
     classifier_model.eval()
 
@@ -169,8 +168,7 @@ if __name__ == '__main__':
 
     Reg_model.load_state_dict(torch.load(regression_path_sto2))
 
-    test_data_len = len(ViatalSignDataset_regression(mode='val', cl=class_mode, use_gpu=use_gpu))
-    test_loader = DataLoader(ViatalSignDataset_regression(mode='val', cl=class_mode, use_gpu=use_gpu), batch_size=test_data_len, shuffle=False)
+    test_loader = batch_loader(ViatalSignDataset_regression(mode='val', cl=class_mode, use_gpu=use_gpu), device=device)
 
     criterion = nn.MSELoss()
 
@@ -251,9 +249,7 @@ if __name__ == '__main__':
 
     Reg_model2.load_state_dict(torch.load(regression_path_thb2))
 
-    test_data_len = len(ViatalSignDataset_regression(mode='val', cl=class_mode, use_gpu=use_gpu))
-    test_loader = DataLoader(ViatalSignDataset_regression(mode='val', cl=class_mode, use_gpu=use_gpu),
-                             batch_size=test_data_len, shuffle=False)
+    test_loader = batch_loader(ViatalSignDataset_regression(mode='val', cl=class_mode, use_gpu=use_gpu), device=device)
 
     criterion = nn.MSELoss()
 
@@ -8,44 +8,16 @@ import torch.nn as nn
 import torch.nn.functional as F
 import torch.optim as optim
 
-from torch.utils.data import DataLoader
+from shared_data import batch_loader
 
 from dataset1 import ViatalSignDataset_ppg_lstm
-
-from torch.autograd import Variable
+from spo2_model import VitalSign_Spo2, GroupedSpo2
 
 """ 정상상태로 3분씩 수집한 Dataset1을 이용하여, 초기 2분은 Training으로, 나머지 1분은 Test로 사용한 모델에 대한 Test Code"""
 
-class VitalSign_Spo2(nn.Module):
-    def __init__(self, feature_size=14, hidden_size=30, seq_len = 300):
-        super(VitalSign_Spo2, self).__init__()
-
-        self.feature_size = feature_size
-        self.hidden_size = hidden_size
-        self.seq_len = seq_len
-
-        self.layer = 2
-
-        self.lstm = nn.LSTM(
-            input_size=self.feature_size,
-            hidden_size=self.hidden_size,
-            num_layers=self.layer,
-            batch_first=True).cuda()
-
-        self.dense = nn.Linear(self.hidden_size*self.seq_len, 1)
-
-    def forward(self, x):
-        hidden = Variable(torch.zeros(self.layer, x.size()[0], self.hidden_size)).to('cuda')
-        cell = Variable(torch.zeros(self.layer, x.size()[0], self.hidden_size)).to('cuda')
-
-        outputs, (hidden, cell) = self.lstm(x, (hidden, cell))
-        hidden = outputs.reshape(-1, self.hidden_size * self.seq_len)
-        model = self.dense(hidden)
-
-        return model
-
 if __name__ == '__main__':
     use_gpu = True
+    device = 'cuda' if use_gpu == True else 'cpu'
 
     # Model의 Sequence Length와 Hidden Size 설정, Trainingd에 설정한 값과 동일하게 설정해야함.
     seq_len = 100
@@ -72,12 +44,17 @@ if __name__ == '__main__':
         spo2_model = VitalSign_Spo2(feature_size=25, hidden_size=hidden_size, seq_len= seq_len)
         spo2_model_nomelthick = VitalSign_Spo2(feature_size=14, hidden_size=hidden_size, seq_len= seq_len)
 
-    spo2_model.load_state_dict(torch.load(lstm_path1))
-    spo2_model_nomelthick.load_state_dict(torch.load(lstm_path2))
+    spo2_model.load_state_dict(torch.load(lstm_path1, map_location=device))
+    spo2_model_nomelthick.load_state_dict(torch.load(lstm_path2, map_location=device))
+
+    # 두 Model을 한 번의 LSTM 호출로 계산 (nomelthick Model은 concat 입력의 앞쪽 Absorbance 14개를 사용)
+    ab_model = GroupedSpo2([spo2_model, spo2_model_nomelthick], input_index=[0, 0])
+    if use_gpu == True:
+        ab_model = ab_model.to('cuda')
 
     # Dataset 설정
-    dataset = ViatalSignDataset_ppg_lstm(mode='test', use_gpu = True, seq_len=seq_len, roi=roi)
-    test_data_loader = DataLoader(dataset, batch_size=len(dataset), shuffle=False)
+    dataset = ViatalSignDataset_ppg_lstm(mode='test', use_gpu = use_gpu, seq_len=seq_len, roi=roi, device=device)
+    test_data_loader = batch_loader(dataset, device=device)
 
     criterion = nn.MSELoss()
     criterion2 = nn.MSELoss()
@@ -86,14 +63,13 @@ if __name__ == '__main__':
     running_test_loss2 = []
 
     with torch.no_grad():
-        spo2_model.eval()
+        ab_model.eval()
 
         for input_data_t, input_data_concat_t, input_ref_t, ppg_data_t, spo2_data_t, _, mel, thickness in test_data_loader:
-            pred_spo2_t = spo2_model(input_data_concat_t)
-            pred_spo2_t_no = spo2_model_nomelthick(input_data_t)
+            pred_ab = ab_model([input_data_concat_t])
 
-            pred_spo2_t = torch.squeeze(pred_spo2_t)
-            pred_spo2_t_no = torch.squeeze(pred_spo2_t_no)
+            pred_spo2_t = pred_ab[:, 0]
+            pred_spo2_t_no = pred_ab[:, 1]
             ppg_data_t = torch.squeeze(ppg_data_t)
             spo2_data_t = spo2_data_t[:, -1]
 
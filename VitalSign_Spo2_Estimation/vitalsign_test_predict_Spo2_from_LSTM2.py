@@ -8,43 +8,15 @@ import torch.nn as nn
 import torch.nn.functional as F
 import torch.optim as optim
 
-from torch.utils.data import DataLoader
+from shared_data import batch_loader
 
 from dataset2 import ViatalSignDataset_ppg_lstm
+from spo2_model import VitalSign_Spo2
 
 
-from torch.autograd import Variable
-
-class VitalSign_Spo2(nn.Module):
-    def __init__(self, feature_size=14, hidden_size=30, seq_len = 300):
-        super(VitalSign_Spo2, self).__init__()
-
-        self.feature_size = feature_size
-        self.hidden_size = hidden_size
-        self.seq_len = seq_len
-
-        self.layer = 2
-
-        self.lstm = nn.LSTM(
-            input_size=self.feature_size,
-            hidden_size=self.hidden_size,
-            num_layers=self.layer,
-            batch_first=True).cuda()
-
-        self.dense = nn.Linear(self.hidden_size*self.seq_len, 1)
-
-    def forward(self, x):
-        hidden = Variable(torch.zeros(self.layer, x.size()[0], self.hidden_size)).to('cuda')
-        cell = Variable(torch.zeros(self.layer, x.size()[0], self.hidden_size)).to('cuda')
-
-        outputs, (hidden, cell) = self.lstm(x, (hidden, cell))
-        hidden = outputs.reshape(-1, self.hidden_size * self.seq_len)
-        model = self.dense(hidden)
-
-        return model
-
 if __name__ == '__main__':
     use_gpu = True
+    device = 'cuda' if use_gpu == True else 'cpu'
 
     seq_len = 100
     hidden_size = 30
@@ -67,12 +39,12 @@ if __name__ == '__main__':
     else:
         spo2_model = VitalSign_Spo2(feature_size=25, hidden_size=hidden_size, seq_len=seq_len)
 
-    spo2_model.load_state_dict(torch.load(lstm_path2))
+    spo2_model.load_state_dict(torch.load(lstm_path2, map_location=device))
 
     # test_data_len = len(ViatalSignDataset_ppg_lstm(mode='test', seq_len=seq_len))
-    dataset = ViatalSignDataset_ppg_lstm(mode='test', use_gpu = True, seq_len=seq_len, roi=roi)
+    dataset = ViatalSignDataset_ppg_lstm(mode='test', use_gpu = use_gpu, seq_len=seq_len, roi=roi, device=device)
     # dataset = ViatalSignDataset_ppg_lstm3(mode='test', use_gpu = True, seq_len=seq_len, roi=roi)
-    test_data_loader = DataLoader(dataset, batch_size=len(dataset), shuffle=False)
+    test_data_loader = batch_loader(dataset, device=device)
 
     criterion = nn.MSELoss()
 
@@ -0,0 +1,174 @@
+import numpy as np
+import os
+
+import torch
+
+from session_reader import load_session_corpus, sequence_end_index, SequenceLoader
+from spo2_fusion import CPF_ROI_LIST, error_covariance, sliding_covariance, cpf_weights, cpf_fuse, CPFFusion, fusion_report
+from spo2_model import VitalSign_Spo2, GroupedSpo2
+from heart_rate import HeartRateEstimator
+from signal_quality import session_flags, window_quality
+
+""" Dataset1 (초기 2분 Training, 나머지 1분 Test) ROI 4곳의 Spo2 추정 결과를 CPF로 Fusion한 결과 확인
+    ROI 별 Model (멜라닌, 피부두께 사용 / 미사용 A/B 포함)은 GroupedSpo2로 묶어서 한 번에 추론하고,
+    CPF 공분산은 Session 별로, 다른 Session 들의 Training 구간 오차로 구함 (leave-one-session-out)
+    Training 구간 (0 ~ 120 초) 은 Test 구간 (100 ~ 160 초) 과 겹치므로 같은 Session 의 오차는 사용하지 않음
+    신호 품질 판정 (realtime_pipeline 과 같은 기준) 으로 window 품질이 낮은 ROI 를 뺀 Fusion 결과도 함께 확인
+"""
+
+
+def predict_roi(grouped_model, corpora, seq_len=100, device='cpu', batch_size=3000):
+    '''
+    corpora : ROI 순서대로 load_session_corpus 결과 (같은 Session, 같은 구간), grouped_model 의 입력 번호 = ROI 순서
+    return : Model 별 추정값 (T, n_models), GT Spo2 (T,), Session 번호 (T,) (corpus['sessions'] 의 index)
+    '''
+    end_index = sequence_end_index(corpora[0], corpora[0]['sessions'], seq_len)
+    session_index = np.searchsorted(corpora[0]['offsets'], end_index, side='right') - 1
+    loaders = [SequenceLoader(c, end_index, seq_len, batch_size=batch_size, device=device) for c in corpora]
+
+    pred_list = []
+    gt_list = []
+
+    grouped_model.eval()
+    with torch.no_grad():
+        for batches in zip(*loaders):
+            pred_list.append(grouped_model([b[1] for b in batches]).cpu().numpy())
+            gt_list.append(batches[0][4][:, -1].cpu().numpy())
+
+    return np.concatenate(pred_list, axis=0).astype(np.float64), np.concatenate(gt_list, axis=0).astype(np.float64), session_index
+
+
+def session_snr(absorbance, fps=30):
+    '''
+    한 Session absorbance (T, n_roi, 14) -> sample 별 ROI 심박 대역 SNR (T, n_roi) (dB)
+    realtime_pipeline 과 같이 HeartRateEstimator 의 최신 channel_snr 을 사용, 첫 추정값 전에는 inf (판정 안 함)
+    '''
+    hr_estimator = HeartRateEstimator(fps=fps, sample_shape=absorbance.shape[1:], bands=(6,), window_sec=10, update_interval=1.0)
+    snr = np.full(absorbance.shape[:2], np.inf)
+    for t, sample in enumerate(absorbance):
+        hr_estimator.push(sample)
+        if hr_estimator.latest is not None:
+            snr[t] = hr_estimator.latest['channel_snr'].mean(axis=-1)
+    return snr
+
+
+def roi_window_quality(corpora, seq_len=100, max_motion=0.05, min_snr=None):
+    '''
+    ROI 별 LSTM window 품질 (predict_roi 와 같은 window 순서) (N, n_roi)
+    sample 품질은 움직임, (min_snr 이 있으면) 심박 대역 SNR 로 Session 마다 판정 (signal_quality.session_flags)
+    '''
+    absorbance = np.stack([c['absorbance'].numpy() for c in corpora], axis=1)
+    offsets = corpora[0]['offsets']
+
+    bad = np.zeros(absorbance.shape[:2], dtype=np.bool_)
+    for si in range(len(offsets) - 1):
+        part = absorbance[offsets[si]:offsets[si + 1]]
+        snr = session_snr(part) if min_snr is not None else None
+        bad[offsets[si]:offsets[si + 1]] = session_flags(part, max_motion, snr, min_snr)
+
+    end_index = sequence_end_index(corpora[0], corpora[0]['sessions'], seq_len)
+    return window_quality(bad, end_index, seq_len)
+
+
+def held_out_covariance(train_pred, train_gt, train_session, session):
+    '''session 을 뺀 나머지 Session 들의 Training 구간 오차 공분산'''
+    other = train_session != session
+    return error_covariance(train_pred[other], train_gt[other])
+
+
+if __name__ == '__main__':
+    use_gpu = True
+    device = 'cuda' if use_gpu == True else 'cpu'
+
+    # Model의 Sequence Length와 Hidden Size 설정, Trainingd에 설정한 값과 동일하게 설정해야함.
+    seq_len = 100
+    hidden_size = 30
+
+    # 멜라닌과 피부두께 확률분포를 사용하지 않은 Model도 함께 추론해서 비교
+    compare_nomelthick = True
+
+    # 실시간(Streaming) Fusion 에서 공분산을 구할 최근 추정값 수
+    window = 30
+
+    # 신호 품질 (realtime_pipeline 과 같은 값) : 움직임, 심박 대역 SNR (dB) 로 나쁜 sample 을 정하고
+    # LSTM window 안 좋은 sample 비율이 min_quality 보다 낮은 ROI 는 추론, Fusion 에서 제외
+    max_motion = 0.05
+    min_snr = -5.0
+    min_quality = 0.8
+
+    path = os.path.dirname(os.path.abspath(__file__))
+
+    # (이름, save_dir 뒤에 붙는 이름, 입력 feature 수)
+    variants = [('', '', 25)]
+    if compare_nomelthick == True:
+        variants.append((' (no mel thick)', '_nomelthick', 14))
+
+    # ROI 별 Model Load, 같은 ROI의 Model들은 같은 입력 (Absorbance + 확률분포) 을 사용
+    models = []
+    input_index = []
+    for ri, roi in enumerate(CPF_ROI_LIST):
+        for _, suffix, feature_size in variants:
+            save_dir = "vitalsign_0408_predict_spo2_lstm_l2_dropno_dataset1_{}_seq{}_hidden{}{}".format(roi, seq_len, hidden_size, suffix)
+            spo2_model = VitalSign_Spo2(feature_size=feature_size, hidden_size=hidden_size, seq_len=seq_len)
+            spo2_model.load_state_dict(torch.load(os.path.join(path, 'result', save_dir, 'weight_data2'), map_location='cpu'))
+
+            models.append(spo2_model)
+            input_index.append(ri)
+
+    grouped_model = GroupedSpo2(models, input_index=input_index).to(device)
+
+    # Training 구간 (CPF 공분산), Test 구간
+    train_corpora = [load_session_corpus(roi, device=device, time_start=0, time_end=120) for roi in CPF_ROI_LIST]
+    test_corpora = [load_session_corpus(roi, device=device, time_start=100, time_end=160) for roi in CPF_ROI_LIST]
+
+    # 모든 Model을 한 번에 추론, 열 순서 : ROI 별로 variants 순서
+    train_pred_all, train_gt, train_session = predict_roi(grouped_model, train_corpora, seq_len, device)
+    test_pred_all, test_gt, test_session = predict_roi(grouped_model, test_corpora, seq_len, device)
+
+    test_quality = roi_window_quality(test_corpora, seq_len, max_motion, min_snr)
+    test_usable = test_quality >= min_quality
+    has_result = np.any(test_usable, axis=1)
+
+    for vi, (name, _, _) in enumerate(variants):
+        print("******************** CPF Fusion{} ********************".format(name))
+        train_pred = train_pred_all[:, vi::len(variants)]
+        test_pred = test_pred_all[:, vi::len(variants)]
+
+        # Offline Fusion (전체 기록), Test Session 마다 그 Session 을 뺀 공분산 사용
+        fused_cpf = np.zeros(len(test_gt))
+        weights = []
+        covs = {}
+        for si in np.unique(test_session):
+            covs[si] = held_out_covariance(train_pred, train_gt, train_session, si)
+            mask = test_session == si
+            fused_cpf[mask] = cpf_fuse(test_pred[mask], covs[si])[0]
+            weights.append(cpf_weights(covs[si])[0])
+        fused_sliding, _ = cpf_fuse(test_pred, sliding_covariance(test_pred, window))
+
+        weight = np.mean(weights, axis=0)
+        print("CPF weight (Session 평균) : {}".format({roi: round(float(w), 4) for roi, w in zip(CPF_ROI_LIST, weight)}))
+
+        fusion_report(test_pred, test_gt, CPF_ROI_LIST, {'mean': np.mean(test_pred, axis=1), 'CPF': fused_cpf, 'CPF (sliding)': fused_sliding})
+
+        # Streaming Fusion (추정값이 나올 때마다 update, Session 마다 새 Fusion)
+        fused_stream = np.zeros(len(test_gt))
+        for si in np.unique(test_session):
+            fusion = CPFFusion(n_roi=len(CPF_ROI_LIST), cov=covs[si])
+            mask = test_session == si
+            fused_stream[mask] = [fusion.update(z)[0] for z in test_pred[mask]]
+
+        print("Streaming CPF RMSE : {:.4f} (offline 과의 차이 {:.6f})".format(np.sqrt(np.mean((fused_stream - test_gt) ** 2)),
+                                                                      np.max(np.abs(fused_stream - fused_cpf))))
+
+        # 신호 품질 판정 : 쓸 수 없는 ROI 는 weight 0, 모든 ROI 를 쓸 수 없는 window 는 결과 없음 (realtime_pipeline 과 같음)
+        fused_quality = np.zeros(len(test_gt))
+        for si in np.unique(test_session):
+            mask = test_session == si
+            fused_quality[mask] = cpf_fuse(test_pred[mask], covs[si], quality=test_quality[mask] * test_usable[mask])[0]
+
+        print("Quality : LSTM ROI window {}/{} 건너뜀, 결과 없는 window {}/{}".format(
+            int(np.sum(~test_usable)), test_usable.size, int(np.sum(~has_result)), len(test_gt)))
+        if np.any(has_result):
+            gt_q = test_gt[has_result]
+            print("CPF RMSE (결과 있는 window) : {:.4f} , CPF (quality) RMSE : {:.4f}".format(
+                np.sqrt(np.mean((fused_cpf[has_result] - gt_q) ** 2)), np.sqrt(np.mean((fused_quality[has_result] - gt_q) ** 2))))
@@ -9,6 +9,7 @@ import torch.nn.functional as F
 import torch.optim as optim
 
 from torch.utils.data import DataLoader
+from shared_data import batch_loader
 
 from dataset2 import ViatalSignDataset_triplet
 from dataset2 import ViatalSignDataset_class
@@ -17,6 +18,10 @@ from dataset2 import ViatalSignDataset_regression
 from sklearn.manifold import TSNE
 from sklearn.metrics import confusion_matrix
 
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'VitalSign_Probability_Regression'))
+from train_util import set_lr
+
 """ Sto(산소포화도)와 Thb(혈류량)을 확률기반 Regression Model을 통해 추정하는 경우, 학습 Code"""
 
 
@@ -90,8 +95,13 @@ class Regression(nn.Module):
 
 if __name__ == '__main__':
     use_gpu = True
+    device = 'cuda' if use_gpu == True else 'cpu'
     class_mode = ""
 
+    # Classifier, Regression batch 를 만드는 DataLoader worker 수, GPU 로 옮길 batch 를 page-locked memory 에 만들지 여부
+    num_workers = 4
+    pin_memory = True
+
     save_dir = "vitalsign_0224_ppg_spo2_under_nose"
 
     path = os.path.dirname(__file__)
@@ -122,10 +132,10 @@ if __name__ == '__main__':
     else:
         feature_model = VitalSign_Feature()
 
-    data_loader = DataLoader(ViatalSignDataset_triplet(mode='train', cl=class_mode), batch_size=1000, shuffle=True)
+    data_loader = DataLoader(ViatalSignDataset_triplet(mode='train', cl=class_mode, device=device), batch_size=1000, shuffle=True)
 
-    test_data_len = len(ViatalSignDataset_triplet(mode='test', cl=class_mode))
-    test_data_loader = DataLoader(ViatalSignDataset_triplet(mode='test', cl=class_mode), batch_size=test_data_len, shuffle=False)
+    test_data_len = len(ViatalSignDataset_triplet(mode='test', cl=class_mode, device=device))
+    test_data_loader = DataLoader(ViatalSignDataset_triplet(mode='test', cl=class_mode, device=device), batch_size=test_data_len, shuffle=False)
 
     optimizer = optim.Adam(feature_model.parameters(), lr=0.001)
     criterion = nn.TripletMarginLoss(margin=1.0, p=2)
@@ -137,9 +147,9 @@ if __name__ == '__main__':
 
     for epoch in range(epochs):
         if epoch == 2500:
-            optimizer = optim.Adam(feature_model.parameters(), lr=0.0005)
+            set_lr(optimizer, 0.0005)
         if epoch == 4000:
-            optimizer = optim.Adam(feature_model.parameters(), lr=0.0001)
+            set_lr(optimizer, 0.0001)
 
         running_loss = []
         for anchor, pos, neg, _ in data_loader:
@@ -205,11 +215,10 @@ if __name__ == '__main__':
     else:
         classifier_model = Classifier()
 
-    data_loader = DataLoader(ViatalSignDataset_class(mode='train', cl=class_mode, use_gpu=use_gpu), batch_size=3000, shuffle=True)
+    data_loader = batch_loader(ViatalSignDataset_class(mode='train', cl=class_mode, use_gpu=use_gpu), batch_size=3000, shuffle=True,
+                               num_workers=num_workers, pin_memory=pin_memory, device=device)
 
-    test_data_len = len(ViatalSignDataset_class(mode='val', cl=class_mode, use_gpu=use_gpu))
-    test_loader = DataLoader(ViatalSignDataset_class(mode='val', cl=class_mode, use_gpu=use_gpu), batch_size=test_data_len,
-                             shuffle=False)
+    test_loader = batch_loader(ViatalSignDataset_class(mode='val', cl=class_mode, use_gpu=use_gpu), device=device)
 
     optimizer = optim.Adam(classifier_model.parameters(), lr=0.001)
     criterion = nn.CrossEntropyLoss()
@@ -221,9 +230,9 @@ if __name__ == '__main__':
 
     for epoch in range(epochs):
         if epoch == 1000:
-            optimizer = optim.Adam(classifier_model.parameters(), lr=0.0005)
+            set_lr(optimizer, 0.0005)
         elif epoch == 2000:
-            optimizer = optim.Adam(classifier_model.parameters(), lr=0.0001)
+            set_lr(optimizer, 0.0001)
 
         running_loss = []
         for anchor, total_label3 in data_loader:
@@ -304,9 +313,9 @@ if __name__ == '__main__':
     else:
         Reg_model = Regression()
 
-    data_loader = DataLoader(ViatalSignDataset_regression(mode='train', cl=class_mode, use_gpu=use_gpu), batch_size=1000, shuffle=True)
-    test_data_len = len(ViatalSignDataset_regression(mode='val', cl=class_mode, use_gpu=use_gpu))
-    test_loader = DataLoader(ViatalSignDataset_regression(mode='val', cl=class_mode, use_gpu=use_gpu), batch_size=test_data_len, shuffle=False)
+    data_loader = batch_loader(ViatalSignDataset_regression(mode='train', cl=class_mode, use_gpu=use_gpu), batch_size=1000, shuffle=True,
+                               num_workers=num_workers, pin_memory=pin_memory, device=device)
+    test_loader = batch_loader(ViatalSignDataset_regression(mode='val', cl=class_mode, use_gpu=use_gpu), device=device)
 
     optimizer = optim.Adam(Reg_model.parameters(), lr=0.001)
 
@@ -318,9 +327,9 @@ if __name__ == '__main__':
 
     for epoch in range(epochs):
         if epoch == 500:
-            optimizer = optim.Adam(Reg_model.parameters(), lr=0.0005)
+            set_lr(optimizer, 0.0005)
         elif epoch == 800:
-            optimizer = optim.Adam(Reg_model.parameters(), lr=0.0001)
+            set_lr(optimizer, 0.0001)
 
         running_loss = []
         # for anchor, m_label, tb_label, st_label, th_label in data_loader:
@@ -385,11 +394,9 @@ if __name__ == '__main__':
     else:
         Reg_model2 = Regression()
 
-    data_loader = DataLoader(ViatalSignDataset_regression(mode='train', cl=class_mode, use_gpu=use_gpu),
-                             batch_size=1000, shuffle=True)
-    test_data_len = len(ViatalSignDataset_regression(mode='val', cl=class_mode, use_gpu=use_gpu))
-    test_loader = DataLoader(ViatalSignDataset_regression(mode='val', cl=class_mode, use_gpu=use_gpu),
-                             batch_size=test_data_len, shuffle=False)
+    data_loader = batch_loader(ViatalSignDataset_regression(mode='train', cl=class_mode, use_gpu=use_gpu),
+                               batch_size=1000, shuffle=True, num_workers=num_workers, pin_memory=pin_memory, device=device)
+    test_loader = batch_loader(ViatalSignDataset_regression(mode='val', cl=class_mode, use_gpu=use_gpu), device=device)
 
     optimizer = optim.Adam(Reg_model2.parameters(), lr=0.001)
 
@@ -401,9 +408,9 @@ if __name__ == '__main__':
 
     for epoch in range(epochs):
         if epoch == 500:
-            optimizer = optim.Adam(Reg_model2.parameters(), lr=0.0005)
+            set_lr(optimizer, 0.0005)
         elif epoch == 800:
-            optimizer = optim.Adam(Reg_model2.parameters(), lr=0.0001)
+            set_lr(optimizer, 0.0001)
 
         running_loss = []
         # for anchor, m_label, tb_label, st_label, th_label in data_loader: